@@ -1,5 +1,6 @@
 import time
 import os
+import sys
 import json
 import logging
 import requests
@@ -10,21 +11,36 @@ import pickle
 import redis
 import re
 import gc
+import hashlib
+import gzip
 from urllib.parse import urlparse
 from psycopg2 import sql, OperationalError, InterfaceError
-from psycopg2.extras import RealDictCursor
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+from psycopg2.extras import RealDictCursor, execute_values
 from binance.client import Client
 from binance import ThreadedWebsocketManager
 from binance.exceptions import BinanceAPIException
-from flask import Flask, request, Response, jsonify, render_template_string
+from flask import Flask, request, Response, jsonify
 from flask_cors import CORS
-from threading import Thread, Lock
+from threading import Thread, Lock, Condition, BoundedSemaphore, Event
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta, timezone
 from decouple import config
-from typing import List, Dict, Optional, Any, Set
+from typing import List, Dict, Optional, Any, Set, Tuple, Iterator
+from contextlib import contextmanager
 from sklearn.preprocessing import StandardScaler
-from collections import deque
+from collections import deque, OrderedDict
+from queue import Queue, Empty
+from bisect import bisect_left
+from kline_store import KlineStore, interval_to_ms
+from fast_predictor import CompiledForest, ForestBatch
+from downsampling import lttb_downsample
+from price_bus import PRICE_CHANNEL, TRADE_OPENED, TRADE_UPDATED, TRADE_CLOSED, encode_price_batch, encode_trade_event, append_trade_event
 import warnings
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # --- تجاهل التحذيرات غير الهامة ---
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -57,14 +73,52 @@ except Exception as e:
 # ---------------------- إعداد الثوابت والمتغيرات العامة - V19 ----------------------
 BASE_ML_MODEL_NAME: str = 'LightGBM_Scalping_V8_With_Momentum'
 MODEL_FOLDER: str = 'V8'
+MODEL_CACHE_MAX_BYTES: int = 512 * 1024 * 1024
+USE_COMPILED_PREDICTOR: bool = True
 SIGNAL_GENERATION_TIMEFRAME: str = '15m'
 HIGHER_TIMEFRAME: str = '4h'
 SIGNAL_GENERATION_LOOKBACK_DAYS: int = 30
 REDIS_PRICES_HASH_NAME: str = "crypto_bot_current_prices_v8"
+REDIS_PRICES_TS_HASH_NAME: str = REDIS_PRICES_HASH_NAME + ":ts"
+REDIS_INDICATOR_STATE_HASH_NAME: str = "crypto_bot_indicator_state_v8"
 DIRECT_API_CHECK_INTERVAL: int = 10
+PRICE_SNAPSHOT_TTL_SECONDS: float = 2.0
+MARKET_STATUS_REFRESH_INTERVAL: float = 15.0
+FEAR_GREED_REFRESH_INTERVAL: float = 600.0
+MARKET_STATUS_STALE_FACTOR: int = 3
+SSE_MAX_CLIENTS: int = 8
+SSE_CLIENT_QUEUE_MAX: int = 256
+SSE_HEARTBEAT_INTERVAL: float = 15.0
+SSE_PRICE_PUSH_INTERVAL: float = 1.0
+SSE_RETRY_MS: int = 5000
+WAITRESS_REQUEST_THREADS: int = 8
+REDIS_PRICE_FLUSH_INTERVAL: float = 0.05
+REDIS_PRICE_MAX_AGE_SECONDS: float = 30.0
+REDIS_PRICE_TTL_SECONDS: float = 3600.0
+PUBLISH_PRICE_BUS: bool = True
+USE_LOCAL_KLINE_STORE: bool = True
+DB_POOL_MAX_CONNECTIONS: int = 12
+DB_POOL_CHECKOUT_TIMEOUT: float = 10.0
+DB_RECONNECT_BASE_BACKOFF: float = 1.0
+DB_RECONNECT_MAX_BACKOFF: float = 60.0
+NOTIFICATION_QUEUE_MAX: int = 1000
+NOTIFICATION_BATCH_SIZE: int = 50
+NOTIFICATION_FLUSH_INTERVAL: float = 2.0
+TELEGRAM_OUTBOX_MAX: int = 500
+TELEGRAM_PER_CHAT_INTERVAL: float = 1.0
+TELEGRAM_COALESCE_WINDOW: float = 1.0
+TELEGRAM_MAX_MESSAGE_LENGTH: int = 4096
+TELEGRAM_MAX_RETRIES: int = 5
+CLOSURE_WORKERS: int = 2
+CLOSURE_BATCH_SIZE: int = 50
 TRADING_FEE_PERCENT: float = 0.1
 HYPOTHETICAL_TRADE_SIZE_USDT: float = 10.0
 
+# --- إعدادات الشموع اللحظية عبر WebSocket ---
+USE_WEBSOCKET_CANDLES: bool = True
+CANDLE_BUFFER_SIZE: int = 1000
+KLINE_STREAMS_PER_SOCKET: int = 200
+
 # --- مؤشرات فنية ---
 ADX_PERIOD: int = 14
 RSI_PERIOD: int = 14
@@ -74,6 +128,7 @@ EMA_SLOW_PERIOD: int = 200
 REL_VOL_PERIOD: int = 30
 MOMENTUM_PERIOD: int = 12
 EMA_SLOPE_PERIOD: int = 5
+USE_INCREMENTAL_INDICATORS: bool = True
 
 # --- إدارة الصفقات ---
 MAX_OPEN_TRADES: int = 10
@@ -88,8 +143,7 @@ ATR_FALLBACK_TP_MULTIPLIER: float = 2.0
 USE_TRAILING_STOP_LOSS: bool = True
 TRAILING_ACTIVATION_PROFIT_PERCENT: float = 1.0
 TRAILING_DISTANCE_PERCENT: float = 0.8
-LAST_PEAK_UPDATE_TIME: Dict[int, float] = {}
-PEAK_UPDATE_COOLDOWN: int = 60
+PEAK_FLUSH_INTERVAL: float = 60.0
 
 # --- إعدادات الفلاتر المحسّنة ---
 USE_BTC_TREND_FILTER: bool = True
@@ -103,19 +157,60 @@ USE_MIN_VOLATILITY_FILTER: bool = True
 MIN_VOLATILITY_PERCENT: float = 0.3
 USE_MOMENTUM_FILTER: bool = True
 
+# --- إعدادات المسح المتوازي ---
+USE_CONCURRENT_SCAN: bool = True
+SCAN_MAX_WORKERS: int = 8
+SCAN_SYMBOL_DELAY_SECONDS: float = 2.0
+USE_BATCH_INFERENCE: bool = True
+BATCH_INFERENCE_CHUNK_SIZE: int = 32
+
+# --- إعدادات جدولة المسح عند إغلاق الشمعة ---
+USE_CANDLE_CLOSE_SCHEDULER: bool = True
+CANDLE_SETTLE_DELAY_SECONDS: float = 3.0
+CANDLE_READY_MAX_WAIT_SECONDS: float = 30.0
+CANDLE_READY_POLL_SECONDS: float = 0.5
+FIXED_SCAN_INTERVAL_SECONDS: int = 300
+
 # --- المتغيرات العامة وقفل العمليات ---
-conn: Optional[psycopg2.extensions.connection] = None
+db_pool: Optional['DBConnectionPool'] = None
+notification_writer: 'NotificationWriter'
+telegram_outbox: 'TelegramOutbox'
+closure_pool: 'ClosureWorkerPool'
+peak_price_buffer: 'PeakPriceBuffer'
+trading_stats: Dict[str, Any] = {}
+trading_stats_lock = Lock()
+profit_curve: 'ProfitCurve'
+PROFIT_CURVE_DEFAULT_MAX_POINTS: int = 500
+SIGNALS_PAGE_DEFAULT_LIMIT: int = 50
+SIGNALS_PAGE_MAX_LIMIT: int = 500
+SIGNAL_COLUMNS: Tuple[str, ...] = ('id', 'symbol', 'entry_price', 'target_price', 'stop_loss', 'status', 'closing_price', 'closed_at',
+                                   'profit_percentage', 'strategy_name', 'signal_details', 'current_peak_price')
 client: Optional[Client] = None
 redis_client: Optional[redis.Redis] = None
-ml_models_cache: Dict[str, Any] = {}
+kline_store: Optional[KlineStore] = None
+candle_buffers: Dict[Any, 'CandleBuffer'] = {}
+candle_buffers_lock = Lock()
+indicator_states: Dict[Any, 'IncrementalIndicators'] = {}
+indicator_states_lock = Lock()
+ml_models_cache: 'ModelCache'
+price_snapshot: 'PriceSnapshot'
+forest_batch_cache: Dict[Tuple[Any, ...], ForestBatch] = {}
 validated_symbols_to_scan: List[str] = []
 open_signals_cache: Dict[str, Dict] = {}
+reserved_trade_slots: Set[str] = set()
 signal_cache_lock = Lock()
 notifications_cache = deque(maxlen=50)
 notifications_lock = Lock()
 signals_pending_closure: Set[int] = set()
 closure_lock = Lock()
 last_api_check_time = time.time()
+pending_price_ticks: Dict[str, Tuple[float, float]] = {}
+last_pushed_prices: Dict[str, float] = {}
+last_scored_candle: Dict[str, int] = {}
+last_scored_candle_lock = Lock()
+price_tick_condition = Condition()
+tick_to_trigger_latency: 'LatencyHistogram'
+tick_to_evaluation_latency: 'LatencyHistogram'
 rejection_logs_cache = deque(maxlen=100)
 rejection_logs_lock = Lock()
 last_market_state_check = 0
@@ -372,7 +467,8 @@ function updateProfitChart() {
     const canvas = document.getElementById('profitChart');
     const chartCard = document.getElementById('profit-chart-card');
     
-    apiFetch('/api/profit_curve').then(data => {
+    const maxPoints = Math.max(100, Math.min(1000, Math.round(canvas.parentElement.clientWidth || 500)));
+    apiFetch(`/api/profit_curve?max_points=${maxPoints}`).then(data => {
         loader.style.display = 'none';
         const existingMsg = chartCard.querySelector('.no-data-msg');
         if(existingMsg) existingMsg.remove();
@@ -472,32 +568,56 @@ function renderProgressBar(signal) {
     return `<div class="flex flex-col w-full"><div class="progress-bar-container"><div class="progress-bar ${current >= entry ? 'bg-accent-green' : 'bg-accent-red'}" style="width: ${progressPct}%"></div></div><div class="progress-labels"><span title="وقف الخسارة">${sl.toFixed(4)}</span><span title="الهدف">${tp.toFixed(4)}</span></div></div>`;
 }
 
+let closedSignals = [];
+let closedSignalsCursor = null;
+let lastOpenSignals = [];
+
+function renderSignalRow(signal) {
+    const isOpen = signal.status === 'open' || signal.status === 'updated';
+    const pnlPct = isOpen ? signal.pnl_pct : signal.profit_percentage;
+    const pnlDisplay = pnlPct !== null && pnlPct !== undefined ? `${formatNumber(pnlPct)}%` : 'N/A';
+    const pnlColor = pnlPct === null || pnlPct === undefined ? 'text-text-secondary' : (pnlPct >= 0 ? 'text-accent-green' : 'text-accent-red');
+    
+    const statusClass = signal.status === 'open' ? 'text-yellow-400' : (signal.status === 'updated' ? 'text-blue-400' : 'text-gray-400');
+    const statusText = signal.status === 'updated' ? 'تم تحديثها' : (signal.status === 'open' ? 'مفتوحة' : signal.status);
+    
+    return `<tr class="table-row border-b border-border-color">
+            <td class="p-4 font-mono font-semibold">${signal.symbol}</td>
+            <td class="p-4 font-bold ${statusClass}">${statusText}</td>
+            <td class="p-4 font-mono font-bold ${pnlColor}">${pnlDisplay}</td>
+            <td class="p-4">${isOpen ? renderProgressBar(signal) : '-'}</td>
+            <td class="p-4 font-mono text-xs"><div>${formatNumber(signal.entry_price, 5)}</div><div class="text-text-secondary">${formatNumber(isOpen ? signal.current_price : signal.closing_price, 5)}</div></td>
+            <td class="p-4">${isOpen ? `<button onclick="manualCloseSignal(${signal.id})" class="bg-red-600/80 hover:bg-red-600 text-white text-xs py-1 px-3 rounded-md">إغلاق</button>` : ''}</td>
+        </tr>`;
+}
+
+function renderSignalsTable(openSignals) {
+    const tableBody = document.getElementById('signals-table');
+    const rows = openSignals.concat(closedSignals);
+    if (rows.length === 0) { tableBody.innerHTML = '<tr><td colspan="6" class="p-8 text-center text-text-secondary">لا توجد صفقات لعرضها.</td></tr>'; return; }
+    const loadMore = closedSignalsCursor ? '<tr><td colspan="6" class="p-4 text-center"><button onclick="loadMoreClosedSignals()" class="text-accent-blue text-sm">تحميل المزيد</button></td></tr>' : '';
+    tableBody.innerHTML = rows.map(renderSignalRow).join('') + loadMore;
+}
+
 function updateSignals() {
-    apiFetch('/api/signals').then(data => {
-        const tableBody = document.getElementById('signals-table');
-        if (!data || data.error) { tableBody.innerHTML = '<tr><td colspan="6" class="p-8 text-center text-text-secondary">فشل تحميل الصفقات.</td></tr>'; return; }
-        if (data.length === 0) { tableBody.innerHTML = '<tr><td colspan="6" class="p-8 text-center text-text-secondary">لا توجد صفقات لعرضها.</td></tr>'; return; }
-        
-        tableBody.innerHTML = data.map(signal => {
-            const pnlPct = (signal.status === 'open' || signal.status === 'updated') ? signal.pnl_pct : signal.profit_percentage;
-            const pnlDisplay = pnlPct !== null && pnlPct !== undefined ? `${formatNumber(pnlPct)}%` : 'N/A';
-            const pnlColor = pnlPct === null || pnlPct === undefined ? 'text-text-secondary' : (pnlPct >= 0 ? 'text-accent-green' : 'text-accent-red');
-            
-            const statusClass = signal.status === 'open' ? 'text-yellow-400' : (signal.status === 'updated' ? 'text-blue-400' : 'text-gray-400');
-            const statusText = signal.status === 'updated' ? 'تم تحديثها' : (signal.status === 'open' ? 'مفتوحة' : signal.status);
-            
-            return `<tr class="table-row border-b border-border-color">
-                    <td class="p-4 font-mono font-semibold">${signal.symbol}</td>
-                    <td class="p-4 font-bold ${statusClass}">${statusText}</td>
-                    <td class="p-4 font-mono font-bold ${pnlColor}">${pnlDisplay}</td>
-                    <td class="p-4">${(signal.status === 'open' || signal.status === 'updated') ? renderProgressBar(signal) : '-'}</td>
-                    <td class="p-4 font-mono text-xs"><div>${formatNumber(signal.entry_price, 5)}</div><div class="text-text-secondary">${formatNumber(signal.current_price, 5)}</div></td>
-                    <td class="p-4">${(signal.status === 'open' || signal.status === 'updated') ? `<button onclick="manualCloseSignal(${signal.id})" class="bg-red-600/80 hover:bg-red-600 text-white text-xs py-1 px-3 rounded-md">إغلاق</button>` : ''}</td>
-                </tr>`;
-        }).join('');
+    Promise.all([apiFetch('/api/signals?view=open'), apiFetch('/api/signals?view=closed')]).then(([openData, closedData]) => {
+        if (!openData || openData.error || !closedData || closedData.error) { document.getElementById('signals-table').innerHTML = '<tr><td colspan="6" class="p-8 text-center text-text-secondary">فشل تحميل الصفقات.</td></tr>'; return; }
+        lastOpenSignals = openData;
+        closedSignals = closedData.items;
+        closedSignalsCursor = closedData.next_cursor;
+        renderSignalsTable(lastOpenSignals);
     });
 }
 
+function loadMoreClosedSignals() {
+    if (!closedSignalsCursor) return;
+    apiFetch(`/api/signals?view=closed&cursor=${encodeURIComponent(closedSignalsCursor)}`).then(data => {
+        if (!data || data.error) return;
+        closedSignals = closedSignals.concat(data.items);
+        closedSignalsCursor = data.next_cursor;
+        renderSignalsTable(lastOpenSignals);
+    });
+}
 
 function updateList(endpoint, listId, formatter) {
     apiFetch(endpoint).then(data => {
@@ -515,95 +635,440 @@ function manualCloseSignal(signalId) {
     }
 }
 
+const dateLocaleOptions = { timeZone: 'UTC', year: 'numeric', month: '2-digit', day: '2-digit', hour: '2-digit', minute: '2-digit', second: '2-digit', hour12: false };
+const locale = 'fr-CA'; // YYYY-MM-DD format
+const formatNotification = n => `<div class="p-3 rounded-md bg-gray-900/50 text-sm">[${new Date(n.timestamp).toLocaleString(locale, dateLocaleOptions)}] ${n.message}</div>`;
+
 function refreshData() {
     updateMarketStatus();
     updateStats();
     updateProfitChart();
     updateSignals();
-    const dateLocaleOptions = { timeZone: 'UTC', year: 'numeric', month: '2-digit', day: '2-digit', hour: '2-digit', minute: '2-digit', second: '2-digit', hour12: false };
-    const locale = 'fr-CA'; // YYYY-MM-DD format
-    updateList('/api/notifications', 'notifications-list', n => `<div class="p-3 rounded-md bg-gray-900/50 text-sm">[${new Date(n.timestamp).toLocaleString(locale, dateLocaleOptions)}] ${n.message}</div>`);
+    updateList('/api/notifications', 'notifications-list', formatNotification);
     updateList('/api/rejection_logs', 'rejections-list', log => `<div class="p-3 rounded-md bg-gray-900/50 text-sm">[${new Date(log.timestamp).toLocaleString(locale, dateLocaleOptions)}] <strong>${log.symbol}</strong>: ${log.reason} - <span class="font-mono text-xs text-text-secondary">${JSON.stringify(log.details)}</span></div>`);
 }
 
-setInterval(refreshData, 5000);
-window.onload = refreshData;
+// ---- Live updates: the server pushes events over /api/stream; polling only runs while the stream is down ----
+let streamConnected = false;
+
+function applyPriceTicks(updates) {
+    let changed = false;
+    lastOpenSignals.forEach(signal => {
+        const tick = updates[signal.symbol];
+        if (tick && tick.id === signal.id) { signal.current_price = tick.current_price; signal.pnl_pct = tick.pnl_pct; changed = true; }
+    });
+    if (changed) renderSignalsTable(lastOpenSignals);
+}
+
+function connectEventStream() {
+    if (!window.EventSource) return;
+    const source = new EventSource('/api/stream');
+    source.onopen = () => { streamConnected = true; refreshData(); };
+    source.onerror = () => { streamConnected = false; };
+    source.addEventListener('prices', e => applyPriceTicks(JSON.parse(e.data)));
+    source.addEventListener('signal', () => { updateSignals(); updateStats(); });
+    source.addEventListener('closure', () => { updateSignals(); updateStats(); updateProfitChart(); });
+    source.addEventListener('market_state', () => updateMarketStatus());
+    source.addEventListener('resync', refreshData);
+    source.addEventListener('notification', e => {
+        const list = document.getElementById('notifications-list');
+        list.insertAdjacentHTML('afterbegin', formatNotification(JSON.parse(e.data)));
+        while (list.children.length > 100) list.lastElementChild.remove();
+    });
+}
+
+setInterval(() => { if (!streamConnected) refreshData(); }, 5000);
+setInterval(() => { if (streamConnected) refreshData(); }, 60000);
+window.onload = () => { refreshData(); connectEventStream(); };
 </script>
 </body>
 </html>
     """
 
+# ---------------------- تجهيز لوحة التحكم مرة واحدة عند التشغيل ----------------------
+class PrecompressedAsset:
+    """محتوى ثابت مضغوط مسبقاً بـ gzip (وbrotli إن كانت المكتبة مثبتة) مع ETag قوي لكل ترميز من بصمة SHA-256."""
+
+    def __init__(self, body: bytes, content_type: str, cache_control: str):
+        self.content_type = content_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()
+        self.encodings: Dict[str, bytes] = {'identity': body, 'gzip': gzip.compress(body, compresslevel=9, mtime=0)}
+        if brotli is not None: self.encodings['br'] = brotli.compress(body, quality=11)
+        self.etags: Dict[str, str] = {encoding: f"{self.digest[:32]}-{encoding}" for encoding in self.encodings}
+
+    def respond(self) -> Response:
+        """Picks br > gzip > identity from Accept-Encoding and answers 304 when If-None-Match names any of our ETags."""
+        encoding = next((e for e in ('br', 'gzip') if e in self.encodings and request.accept_encodings[e]), 'identity')
+        if any(request.if_none_match.contains(tag) for tag in self.etags.values()):
+            response = Response(status=304)
+        else:
+            response = Response(self.encodings[encoding], content_type=self.content_type)
+            if encoding != 'identity': response.headers['Content-Encoding'] = encoding
+        response.set_etag(self.etags[encoding])
+        response.headers['Cache-Control'] = self.cache_control
+        response.headers['Vary'] = 'Accept-Encoding'
+        return response
+
+def build_dashboard() -> Tuple[PrecompressedAsset, Dict[str, PrecompressedAsset]]:
+    """
+    Splits get_dashboard_html() into a small HTML shell plus dashboard.css/dashboard.js served from a
+    content-hashed /assets/<version>/ path. The shell is revalidated on every load (cheap 304); the assets are
+    immutable, since any edit changes their version.
+    """
+    html = get_dashboard_html().strip()
+    style = re.search(r'<style>(.*?)</style>', html, re.S)
+    script = re.search(r'<script>(.*?)</script>', html, re.S)
+    assets: Dict[str, PrecompressedAsset] = {}
+    for name, block, content_type, tag in (
+        ('dashboard.css', style, 'text/css; charset=utf-8', '<link rel="stylesheet" href="/assets/{version}/dashboard.css">'),
+        ('dashboard.js', script, 'application/javascript; charset=utf-8', '<script src="/assets/{version}/dashboard.js"></script>'),
+    ):
+        asset = PrecompressedAsset(block.group(1).strip().encode('utf-8'), content_type, 'public, max-age=31536000, immutable')
+        assets[name] = asset
+        html = html.replace(block.group(0), tag.format(version=asset.digest[:16]))
+    shell = PrecompressedAsset(html.encode('utf-8'), 'text/html; charset=utf-8', 'no-cache')
+    logger.info(f"✅ [Dashboard] Built shell ({len(shell.encodings['identity'])} B, gzip {len(shell.encodings['gzip'])} B) and {len(assets)} versioned assets.")
+    return shell, assets
+
+dashboard_shell, dashboard_assets = build_dashboard()
+
 # ---------------------- دوال قاعدة البيانات ----------------------
+class DBConnectionPool:
+    """
+    مجمع اتصالات PostgreSQL محدود وآمن للخيوط: كل عملية تستعير اتصالاً خاصاً بها عبر db_connection() ثم تعيده.
+    صلاحية الاتصال تُعرف محلياً (conn.closed وحالة المعاملة) ومن أخطاء الاستخدام بدلاً من SELECT 1 قبل كل عملية،
+    وعند فشل الاتصال تُؤجَّل المحاولة التالية بتراجع أُسّي.
+    """
+
+    def __init__(self, dsn: str, max_connections: int):
+        self.dsn = dsn
+        self.max_connections = max_connections
+        self._idle: List[psycopg2.extensions.connection] = []
+        self._lock = Lock()
+        self._slots = BoundedSemaphore(max_connections)
+        self._failures = 0
+        self._retry_at = 0.0
+
+    def seconds_until_retry(self) -> float:
+        with self._lock: return max(0.0, self._retry_at - time.time())
+
+    def is_available(self) -> bool:
+        """False while waiting out a reconnect backoff. No round-trip to the server."""
+        return self.seconds_until_retry() == 0.0
+
+    def _connect(self) -> psycopg2.extensions.connection:
+        with self._lock: wait = self._retry_at - time.time()
+        if wait > 0: raise OperationalError(f"DB reconnect backoff active, next attempt in {wait:.1f}s.")
+        try:
+            new_conn = psycopg2.connect(self.dsn, connect_timeout=15, cursor_factory=RealDictCursor)
+            new_conn.autocommit = False
+        except Exception:
+            with self._lock:
+                self._failures += 1
+                backoff = min(DB_RECONNECT_MAX_BACKOFF, DB_RECONNECT_BASE_BACKOFF * 2 ** (self._failures - 1))
+                self._retry_at = time.time() + backoff
+            logger.error(f"❌ [DB Pool] Connect failed ({self._failures} in a row), retrying in {backoff:.0f}s.")
+            raise
+        with self._lock:
+            if self._failures: logger.info(f"✅ [DB Pool] Reconnected after {self._failures} failed attempts.")
+            self._failures, self._retry_at = 0, 0.0
+        return new_conn
+
+    def getconn(self, timeout: float) -> psycopg2.extensions.connection:
+        if not self._slots.acquire(timeout=timeout):
+            raise OperationalError(f"Timed out after {timeout}s waiting for one of {self.max_connections} DB connections.")
+        try:
+            with self._lock:
+                while self._idle:
+                    idle_conn = self._idle.pop()
+                    if idle_conn.closed == 0: return idle_conn
+            return self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, used_conn: psycopg2.extensions.connection, discard: bool = False):
+        try:
+            if not discard and used_conn.closed == 0:
+                status = used_conn.get_transaction_status()
+                if status == TRANSACTION_STATUS_UNKNOWN: discard = True
+                elif status != TRANSACTION_STATUS_IDLE: used_conn.rollback()
+            else:
+                discard = True
+        except Exception:
+            discard = True
+        try:
+            if discard:
+                try: used_conn.close()
+                except Exception: pass
+            else:
+                with self._lock: self._idle.append(used_conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for idle_conn in idle:
+            try: idle_conn.close()
+            except Exception: pass
+
+
+@contextmanager
+def db_connection(timeout: float = DB_POOL_CHECKOUT_TIMEOUT) -> Iterator[psycopg2.extensions.connection]:
+    """Checks out a pooled connection; rolls back on error and drops it when the error means the link is dead."""
+    if db_pool is None: raise OperationalError("DB pool is not initialized.")
+    conn = db_pool.getconn(timeout)
+    discard = False
+    try:
+        yield conn
+    except (OperationalError, InterfaceError):
+        discard = True
+        raise
+    except Exception:
+        try: conn.rollback()
+        except Exception: discard = True
+        raise
+    finally:
+        db_pool.putconn(conn, discard=discard)
+
+
 def init_db(retries: int = 5, delay: int = 5) -> None:
-    global conn
-    logger.info("[DB] Initializing database connection...")
+    global db_pool
+    logger.info("[DB] Initializing database connection pool...")
     db_url_to_use = DB_URL
     if 'postgres' in db_url_to_use and 'sslmode' not in db_url_to_use:
         separator = '&' if '?' in db_url_to_use else '?'
         db_url_to_use += f"{separator}sslmode=require"
+    if db_pool is None: db_pool = DBConnectionPool(db_url_to_use, DB_POOL_MAX_CONNECTIONS)
     for attempt in range(retries):
         try:
-            conn = psycopg2.connect(db_url_to_use, connect_timeout=15, cursor_factory=RealDictCursor)
-            conn.autocommit = False
-            with conn.cursor() as cur:
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS signals (
-                        id SERIAL PRIMARY KEY, symbol TEXT NOT NULL, entry_price DOUBLE PRECISION NOT NULL,
-                        target_price DOUBLE PRECISION NOT NULL, stop_loss DOUBLE PRECISION NOT NULL,
-                        status TEXT DEFAULT 'open', closing_price DOUBLE PRECISION, closed_at TIMESTAMP,
-                        profit_percentage DOUBLE PRECISION, strategy_name TEXT, signal_details JSONB,
-                        current_peak_price DOUBLE PRECISION
-                    );
-                """)
-                cur.execute("CREATE INDEX IF NOT EXISTS idx_signals_status ON signals (status);")
-                cur.execute("""
-                    CREATE TABLE IF NOT EXISTS notifications (
-                        id SERIAL PRIMARY KEY, timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
-                        type TEXT NOT NULL, message TEXT NOT NULL, is_read BOOLEAN DEFAULT FALSE
-                    );
-                """)
-            conn.commit()
-            logger.info("✅ [DB] Database connection successful and tables initialized.")
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS signals (
+                            id SERIAL PRIMARY KEY, symbol TEXT NOT NULL, entry_price DOUBLE PRECISION NOT NULL,
+                            target_price DOUBLE PRECISION NOT NULL, stop_loss DOUBLE PRECISION NOT NULL,
+                            status TEXT DEFAULT 'open', closing_price DOUBLE PRECISION, closed_at TIMESTAMP,
+                            profit_percentage DOUBLE PRECISION, strategy_name TEXT, signal_details JSONB,
+                            current_peak_price DOUBLE PRECISION
+                        );
+                    """)
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_signals_status ON signals (status);")
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_signals_closed_at_id ON signals (closed_at DESC, id DESC);")
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_signals_symbol ON signals (symbol);")
+                    cur.execute("CREATE INDEX IF NOT EXISTS idx_signals_open ON signals (id) WHERE status IN ('open', 'updated');")
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS notifications (
+                            id SERIAL PRIMARY KEY, timestamp TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+                            type TEXT NOT NULL, message TEXT NOT NULL, is_read BOOLEAN DEFAULT FALSE
+                        );
+                    """)
+                    cur.execute("""
+                        CREATE TABLE IF NOT EXISTS trading_stats (
+                            id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                            closed_count BIGINT NOT NULL DEFAULT 0, win_count BIGINT NOT NULL DEFAULT 0,
+                            profit_sum DOUBLE PRECISION NOT NULL DEFAULT 0, win_profit_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+                            loss_profit_sum DOUBLE PRECISION NOT NULL DEFAULT 0, version BIGINT NOT NULL DEFAULT 0,
+                            updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+                        );
+                    """)
+                conn.commit()
+            logger.info(f"✅ [DB] Database pool ready (max {DB_POOL_MAX_CONNECTIONS} connections) and tables initialized.")
             return
         except Exception as e:
             logger.error(f"❌ [DB] Connection error (Attempt {attempt + 1}/{retries}): {e}")
-            if conn: conn.rollback()
-            if attempt < retries - 1: time.sleep(delay)
+            if attempt < retries - 1: time.sleep(max(delay, db_pool.seconds_until_retry()))
             else: logger.critical("❌ [DB] Failed to connect to the database after multiple retries.")
 
 
 def check_db_connection() -> bool:
-    global conn
-    if conn is None or conn.closed != 0:
-        logger.warning("[DB] Connection is closed, attempting to reconnect...")
-        init_db()
-    try:
-        if conn and conn.closed == 0:
-            with conn.cursor() as cur: cur.execute("SELECT 1;")
-            return True
-        return False
-    except (OperationalError, InterfaceError) as e:
-        logger.error(f"❌ [DB] Connection lost: {e}. Attempting to reconnect...")
-        try:
-            init_db()
-            return conn is not None and conn.closed == 0
-        except Exception as retry_e:
-            logger.error(f"❌ [DB] Reconnect failed: {retry_e}")
-            return False
-    return False
+    """Cheap health flag: the pool exists and is not backing off after failed connects (no SELECT 1)."""
+    return db_pool is not None and db_pool.is_available()
+
+# ---------------------- كاتب الإشعارات غير المتزامن ----------------------
+class NotificationWriter:
+    """
+    يحفظ الإشعارات في قاعدة البيانات من خيط خلفي على دفعات (INSERT متعدد الصفوف) عند امتلاء الدفعة أو مرور
+    NOTIFICATION_FLUSH_INTERVAL. الطابور محدود: عند امتلائه يُسقط الأقدم، بينما يبقى notifications_cache
+    في الذاكرة هو مصدر لوحة التحكم.
+    """
+
+    def __init__(self, max_pending: int, batch_size: int, flush_interval: float):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._pending: deque = deque(maxlen=max_pending)
+        self._condition = Condition()
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+        self._healthy = True
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='notification-writer', daemon=True)
+            self._thread.start()
+
+    def enqueue(self, timestamp: datetime, notification_type: str, message: str):
+        with self._condition:
+            if len(self._pending) == self._pending.maxlen: self.dropped += 1
+            self._pending.append((timestamp, notification_type, message))
+            if self._healthy and len(self._pending) >= self.batch_size: self._condition.notify()
+
+    def _take_batch(self) -> List[Tuple[datetime, str, str]]:
+        with self._condition:
+            return [self._pending.popleft() for _ in range(min(self.batch_size, len(self._pending)))]
+
+    def _requeue(self, batch: List[Tuple[datetime, str, str]]):
+        with self._condition:
+            room = self._pending.maxlen - len(self._pending)
+            self.dropped += max(0, len(batch) - room)
+            self._pending.extendleft(reversed(batch[:room]))
+
+    def _flush(self) -> bool:
+        """Writes everything pending in batch_size chunks. Returns False (batch requeued) when the DB is unavailable."""
+        while True:
+            batch = self._take_batch()
+            if not batch: return True
+            try:
+                if not check_db_connection(): raise OperationalError("DB connection unavailable.")
+                with db_connection() as conn:
+                    with conn.cursor() as cur:
+                        execute_values(cur, "INSERT INTO notifications (timestamp, type, message) VALUES %s;", batch)
+                    conn.commit()
+            except Exception as e:
+                logger.error(f"❌ [Notify DB] Failed to save {len(batch)} notifications to DB, will retry: {e}")
+                self._requeue(batch)
+                return False
+
+    def _run(self):
+        while True:
+            with self._condition:
+                # After a failed flush wait out a full interval instead of retrying on every new notification.
+                if not self._stopping and (not self._healthy or len(self._pending) < self.batch_size):
+                    self._condition.wait(timeout=self.flush_interval)
+                stopping = self._stopping
+            self._healthy = self._flush()
+            if self.dropped:
+                logger.warning(f"⚠️ [Notify DB] Notification queue full, dropped {self.dropped} oldest notifications.")
+                self.dropped = 0
+            if stopping: return
+
+    def stop(self, timeout: float = 10.0):
+        """Flushes whatever is still queued, then stops the writer thread."""
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        if self._thread is not None: self._thread.join(timeout)
+        else: self._flush()
+
+notification_writer = NotificationWriter(NOTIFICATION_QUEUE_MAX, NOTIFICATION_BATCH_SIZE, NOTIFICATION_FLUSH_INTERVAL)
+
+# ---------------------- موزع الأحداث للوحة التحكم (Server-Sent Events) ----------------------
+class EventSubscriber:
+    """طابور أحداث مُرمَّزة مسبقاً لمتصفح واحد. إذا تأخر المتصفح حتى امتلأ الطابور يُفرَّغ ويُرسل له resync بدلاً منه."""
+
+    def __init__(self, max_pending: int):
+        self.max_pending = max_pending
+        self._frames: deque = deque()
+        self._condition = Condition()
+        self.closed = False
+
+    def push(self, frame: str):
+        with self._condition:
+            if len(self._frames) >= self.max_pending:
+                self._frames.clear()
+                frame = EventBroker.encode('resync', {})
+            self._frames.append(frame)
+            self._condition.notify()
+
+    def wait(self, timeout: float) -> Optional[List[str]]:
+        """Pending frames ([] on timeout), or None once the subscriber is closed."""
+        with self._condition:
+            if not self._frames and not self.closed: self._condition.wait(timeout)
+            if self.closed: return None
+            frames = list(self._frames)
+            self._frames.clear()
+            return frames
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+class EventBroker:
+    """
+    يوزع أحداث البوت (تغير الأسعار والصفقات والإشعارات وحالة السوق) على كل متصفح متصل عبر /api/stream.
+    كل حدث يُرمَّز مرة واحدة مهما كان عدد المتصفحين، وتحديثات الأسعار تُدمج لكل صفقة وتُرسل مرة كل
+    SSE_PRICE_PUSH_INTERVAL. عدد المتصفحين محدود لأن كل اتصال يحجز خيطاً من waitress طوال مدته.
+    """
+
+    def __init__(self, max_clients: int, max_pending: int, price_interval: float):
+        self.max_clients = max_clients
+        self.max_pending = max_pending
+        self.price_interval = price_interval
+        self._subscribers: List[EventSubscriber] = []
+        self._pending_prices: Dict[str, Dict[str, Any]] = {}
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    @staticmethod
+    def encode(event: str, data: Any) -> str:
+        return f"event: {event}\ndata: {json.dumps(data, default=str, separators=(',', ':'))}\n\n"
+
+    def has_subscribers(self) -> bool:
+        return bool(self._subscribers)
+
+    def subscribe(self) -> Optional[EventSubscriber]:
+        with self._lock:
+            if len(self._subscribers) >= self.max_clients: return None
+            subscriber = EventSubscriber(self.max_pending)
+            self._subscribers.append(subscriber)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='sse-price-pump', daemon=True)
+                self._thread.start()
+        logger.info(f"📡 [SSE] Dashboard connected ({len(self._subscribers)}/{self.max_clients}).")
+        return subscriber
+
+    def unsubscribe(self, subscriber: EventSubscriber):
+        with self._lock:
+            if subscriber in self._subscribers: self._subscribers.remove(subscriber)
+        subscriber.close()
+        logger.info(f"📡 [SSE] Dashboard disconnected ({len(self._subscribers)}/{self.max_clients}).")
+
+    def publish(self, event: str, data: Any):
+        if not self._subscribers: return
+        frame = self.encode(event, data)
+        with self._lock: subscribers = list(self._subscribers)
+        for subscriber in subscribers: subscriber.push(frame)
+
+    def stage_prices(self, updates: Dict[str, Dict[str, Any]]):
+        """Merges per-symbol price/PnL updates; only the latest value per symbol is sent on the next push."""
+        if not self._subscribers: return
+        with self._lock: self._pending_prices.update(updates)
+
+    def _run(self):
+        while not self._stop_event.wait(self.price_interval):
+            with self._lock:
+                updates, self._pending_prices = self._pending_prices, {}
+            if updates: self.publish('prices', updates)
+
+    def stop(self):
+        self._stop_event.set()
+        with self._lock: subscribers, self._subscribers = self._subscribers, []
+        for subscriber in subscribers: subscriber.close()
+
+event_broker = EventBroker(SSE_MAX_CLIENTS, SSE_CLIENT_QUEUE_MAX, SSE_PRICE_PUSH_INTERVAL)
 
 def log_and_notify(level: str, message: str, notification_type: str):
     log_methods = {'info': logger.info, 'warning': logger.warning, 'error': logger.error, 'critical': logger.critical}
     log_methods.get(level.lower(), logger.info)(message)
-    if not check_db_connection() or not conn: return
-    try:
-        new_notification = {"timestamp": datetime.now().isoformat(), "type": notification_type, "message": message}
-        with notifications_lock: notifications_cache.appendleft(new_notification)
-        with conn.cursor() as cur: cur.execute("INSERT INTO notifications (type, message) VALUES (%s, %s);", (notification_type, message))
-        conn.commit()
-    except Exception as e:
-        logger.error(f"❌ [Notify DB] Failed to save notification to DB: {e}")
-        if conn: conn.rollback()
+    new_notification = {"timestamp": datetime.now().isoformat(), "type": notification_type, "message": message}
+    with notifications_lock: notifications_cache.appendleft(new_notification)
+    notification_writer.enqueue(datetime.now(timezone.utc), notification_type, message)
+    event_broker.publish('notification', new_notification)
 
 def log_rejection(symbol: str, reason: str, details: Optional[Dict] = None):
     log_message = f"🚫 [REJECTED] {symbol} | Reason: {reason} | Details: {details or {}}"
@@ -628,6 +1093,16 @@ def init_redis() -> None:
         exit(1)
 
 # ---------------------- دوال Binance والبيانات ----------------------
+def init_kline_store() -> None:
+    global kline_store
+    if not USE_LOCAL_KLINE_STORE: return
+    try:
+        kline_store = KlineStore()
+        logger.info(f"✅ [Kline Store] Using local candle store at '{kline_store.path}'.")
+    except Exception as e:
+        logger.error(f"❌ [Kline Store] Could not open local candle store, using REST only: {e}")
+        kline_store = None
+
 def get_validated_symbols(filename: str = 'crypto_list.txt') -> List[str]:
     if not client: return []
     try:
@@ -645,21 +1120,106 @@ def get_validated_symbols(filename: str = 'crypto_list.txt') -> List[str]:
         logger.error(f"❌ [Validation] An error occurred during symbol validation: {e}", exc_info=True)
         return []
 
-def fetch_historical_data(symbol: str, interval: str, days: int) -> Optional[pd.DataFrame]:
+def fetch_historical_data(symbol: str, interval: str, days: int, include_open: bool = True) -> Optional[pd.DataFrame]:
     if not client: return None
+    limit = int((days * 24 * 60) / int(re.sub('[a-zA-Z]', '', interval)))
+    if kline_store:
+        try:
+            return kline_store.get_latest(client, symbol, interval, min(limit, 1000), include_open=include_open)
+        except Exception as e:
+            logger.warning(f"⚠️ [Kline Store] Falling back to full REST fetch for {symbol} {interval}: {e}")
     try:
-        limit = int((days * 24 * 60) / int(re.sub('[a-zA-Z]', '', interval)))
         klines = client.get_historical_klines(symbol, interval, limit=min(limit, 1000))
         if not klines: return None
         df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trades', 'taker_buy_base', 'taker_buy_quote', 'ignore'])
         df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']].astype(float)
         df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
         df.set_index('timestamp', inplace=True)
+        if not include_open:
+            df = df[df.index + pd.Timedelta(milliseconds=interval_to_ms(interval)) <= pd.Timestamp.now(tz='UTC')]
         return df.dropna()
     except Exception as e:
         logger.error(f"❌ [Data] Error fetching historical data for {symbol}: {e}")
         return None
 
+class CandleBuffer:
+    """
+    مخزن دائري بحجم ثابت للشموع المغلقة لعملة وإطار زمني واحد، تتم تغذيته من بث @kline.
+    لا يُستخدم REST إلا لملء الفجوات (عند البدء أو بعد انقطاع الاتصال).
+    """
+    def __init__(self, symbol: str, interval: str, maxlen: int = CANDLE_BUFFER_SIZE):
+        self.symbol = symbol
+        self.interval = interval
+        self.interval_ms = interval_to_ms(interval)
+        self.rows: deque = deque(maxlen=maxlen)
+        self.lock = Lock()
+        self.needs_gap_fill = True
+
+    def seed(self, df: pd.DataFrame):
+        rows = [(int(ts.value // 1_000_000), r.open, r.high, r.low, r.close, r.volume) for ts, r in zip(df.index, df.itertuples(index=False))]
+        with self.lock:
+            self.rows.clear()
+            self.rows.extend(rows)
+            self.needs_gap_fill = False
+
+    def append_closed(self, open_time: int, o: float, h: float, l: float, c: float, v: float):
+        with self.lock:
+            if self.rows:
+                last_open_time = self.rows[-1][0]
+                if open_time <= last_open_time: return
+                if open_time > last_open_time + self.interval_ms: self.needs_gap_fill = True
+            self.rows.append((open_time, o, h, l, c, v))
+
+    def has_closed(self, open_time: int) -> bool:
+        """True once the candle opened at `open_time` is buffered, or when the next read will gap-fill via REST anyway."""
+        with self.lock:
+            return self.needs_gap_fill or (bool(self.rows) and self.rows[-1][0] >= open_time)
+
+    def is_usable(self, now_ms: int) -> bool:
+        with self.lock:
+            return not self.needs_gap_fill and bool(self.rows) and self.rows[-1][0] + 2 * self.interval_ms > now_ms
+
+    def to_dataframe(self) -> pd.DataFrame:
+        with self.lock: rows = list(self.rows)
+        df = pd.DataFrame(rows, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+        return df.set_index('timestamp')
+
+def get_candle_buffer(symbol: str, interval: str) -> 'CandleBuffer':
+    with candle_buffers_lock:
+        buffer = candle_buffers.get((symbol, interval))
+        if buffer is None:
+            buffer = candle_buffers[(symbol, interval)] = CandleBuffer(symbol, interval)
+        return buffer
+
+def get_signal_candles(symbol: str, interval: str) -> Optional[pd.DataFrame]:
+    """Closed candles for signal generation: served from the websocket buffer, REST only as gap-fill."""
+    if not USE_WEBSOCKET_CANDLES:
+        return fetch_historical_data(symbol, interval, SIGNAL_GENERATION_LOOKBACK_DAYS, include_open=False)
+    buffer = get_candle_buffer(symbol, interval)
+    if buffer.is_usable(int(time.time() * 1000)):
+        return buffer.to_dataframe()
+    df = fetch_historical_data(symbol, interval, SIGNAL_GENERATION_LOOKBACK_DAYS, include_open=False)
+    if df is not None and not df.empty:
+        buffer.seed(df)
+        logger.debug(f"🧩 [Candles] Gap-filled {symbol} {interval} buffer via REST ({len(df)} candles).")
+    return df
+
+def handle_kline_message(msg: Dict[str, Any]) -> None:
+    if not isinstance(msg, dict): return
+    try:
+        data = msg.get('data', msg)
+        if data.get('e') == 'error':
+            logger.warning(f"⚠️ [WebSocket Klines] Stream error, buffers will be gap-filled: {data.get('m')}")
+            with candle_buffers_lock: buffers = list(candle_buffers.values())
+            for buffer in buffers: buffer.needs_gap_fill = True
+            return
+        kline = data.get('k')
+        if data.get('e') != 'kline' or not kline or not kline.get('x'): return
+        get_candle_buffer(kline['s'], kline['i']).append_closed(
+            int(kline['t']), float(kline['o']), float(kline['h']), float(kline['l']), float(kline['c']), float(kline['v']))
+    except Exception as e: logger.error(f"❌ [WebSocket Klines] Error: {e}", exc_info=True)
+
 # ---------------------- دوال حساب الميزات وتحديد الاتجاه ----------------------
 def calculate_features(df: pd.DataFrame, btc_df: Optional[pd.DataFrame]) -> pd.DataFrame:
     df_calc = df.copy()
@@ -695,6 +1255,214 @@ def calculate_features(df: pd.DataFrame, btc_df: Optional[pd.DataFrame]) -> pd.D
     df_calc['hour_of_day'] = df_calc.index.hour
     return df_calc.astype('float32', errors='ignore')
 
+def _ewm_alpha(span: Optional[float] = None, com: Optional[float] = None) -> float:
+    """Same alpha derivation as pandas (span -> center of mass -> alpha), so the recursion matches bit for bit."""
+    if span is not None: com = (span - 1) / 2
+    return 1.0 / (1.0 + com)
+
+def _ewm_step(prev: Optional[float], value: float, alpha: float) -> Optional[float]:
+    """One step of pandas `ewm(adjust=False).mean()`, including its normalisation by (old_wt + new_wt)."""
+    if value != value: return prev
+    if prev is None: return value
+    old_wt = 1.0 - alpha
+    if prev != value: return (old_wt * prev + alpha * value) / (old_wt + alpha)
+    return prev
+
+class IncrementalIndicators:
+    """
+    حالة مؤشرات تراكمية لكل (عملة، إطار) تتقدم بشمعة مغلقة واحدة في O(1)، وتعطي نفس تعريفات calculate_features.
+    عند إعادة التهيئة من نافذة بيانات تكون القيم مطابقة للحساب الكامل على تلك النافذة، وبعدها تستمر الحالة
+    عبر كامل التاريخ بدلاً من اقتطاعه عند حدود النافذة (فرق EMA200 يتلاشى بعد بضع مئات من الشموع).
+    """
+    VERSION = 1
+    ALPHA_ATR = _ewm_alpha(span=ATR_PERIOD)
+    ALPHA_ADX = _ewm_alpha(span=ADX_PERIOD)
+    ALPHA_RSI = _ewm_alpha(com=RSI_PERIOD - 1)
+    ALPHA_EMA_FAST = _ewm_alpha(span=EMA_FAST_PERIOD)
+    ALPHA_EMA_SLOW = _ewm_alpha(span=EMA_SLOW_PERIOD)
+    ALPHA_EMA_SLOPE = _ewm_alpha(span=EMA_SLOPE_PERIOD)
+    BTC_CORR_PERIOD = 30
+    SCALAR_FIELDS = ['last_open_time', 'prev_high', 'prev_low', 'prev_close', 'atr', 'plus_dm_ema', 'minus_dm_ema', 'adx',
+                     'gain', 'loss', 'ema_fast', 'ema_slow', 'ema_slope', 'prev_roc', 'with_btc']
+
+    def __init__(self, with_btc: bool = True):
+        self.lock = Lock()
+        self.with_btc = with_btc
+        self.reset()
+
+    def reset(self):
+        self.last_open_time: Optional[int] = None
+        self.prev_high = self.prev_low = self.prev_close = None
+        self.atr = self.plus_dm_ema = self.minus_dm_ema = self.adx = None
+        self.gain = self.loss = None
+        self.ema_fast = self.ema_slow = self.ema_slope = None
+        self.prev_roc = float('nan')
+        self.volumes: deque = deque(maxlen=REL_VOL_PERIOD)
+        self.closes: deque = deque(maxlen=MOMENTUM_PERIOD + 1)
+        self.corr_pairs: deque = deque(maxlen=self.BTC_CORR_PERIOD)
+        self.features: Dict[str, float] = {}
+
+    @staticmethod
+    def _window_corr(pairs) -> float:
+        """Rolling-corr definition used by pandas: (E[xy] - E[x]E[y]) * n/(n-1) / sqrt(var_x * var_y)."""
+        if len(pairs) < IncrementalIndicators.BTC_CORR_PERIOD or any(x != x or y != y for x, y in pairs): return float('nan')
+        n = float(len(pairs))
+        mean_x = sum(x for x, _ in pairs) / n; mean_y = sum(y for _, y in pairs) / n
+        mean_xy = sum(x * y for x, y in pairs) / n
+        var_x = sum((x - mean_x) ** 2 for x, _ in pairs) / (n - 1)
+        var_y = sum((y - mean_y) ** 2 for _, y in pairs) / (n - 1)
+        denominator = (var_x * var_y) ** 0.5
+        if denominator == 0: return float('nan')
+        return (mean_xy - mean_x * mean_y) * (n / (n - 1)) / denominator
+
+    def update(self, open_time: int, o: float, h: float, l: float, c: float, v: float, btc_return: Optional[float] = None) -> Dict[str, float]:
+        prev_close, prev_high, prev_low = self.prev_close, self.prev_high, self.prev_low
+        tr = h - l
+        if prev_close is not None: tr = max(tr, abs(h - prev_close), abs(l - prev_close))
+        self.atr = _ewm_step(self.atr, tr, self.ALPHA_ATR)
+        up_move = h - prev_high if prev_high is not None else float('nan')
+        down_move = -(l - prev_low) if prev_low is not None else float('nan')
+        plus_dm = up_move if (up_move > down_move and up_move > 0) else 0.0
+        minus_dm = down_move if (down_move > up_move and down_move > 0) else 0.0
+        self.plus_dm_ema = _ewm_step(self.plus_dm_ema, plus_dm, self.ALPHA_ADX)
+        self.minus_dm_ema = _ewm_step(self.minus_dm_ema, minus_dm, self.ALPHA_ADX)
+        atr_safe = self.atr if self.atr != 0 else 1e-9
+        plus_di = 100 * self.plus_dm_ema / atr_safe
+        minus_di = 100 * self.minus_dm_ema / atr_safe
+        di_sum = plus_di + minus_di
+        dx = 100 * (abs(plus_di - minus_di) / (di_sum if di_sum != 0 else 1e-9))
+        self.adx = _ewm_step(self.adx, dx, self.ALPHA_ADX)
+
+        if prev_close is not None:
+            delta = c - prev_close
+            self.gain = _ewm_step(self.gain, max(delta, 0.0), self.ALPHA_RSI)
+            self.loss = _ewm_step(self.loss, -min(delta, 0.0), self.ALPHA_RSI)
+        rsi = float('nan')
+        if self.gain is not None:
+            rsi = 100 - (100 / (1 + (self.gain / (self.loss if self.loss != 0 else 1e-9))))
+
+        self.volumes.append(v)
+        relative_volume = v / (sum(self.volumes) / len(self.volumes) + 1e-9)
+        self.ema_fast = _ewm_step(self.ema_fast, c, self.ALPHA_EMA_FAST)
+        self.ema_slow = _ewm_step(self.ema_slow, c, self.ALPHA_EMA_SLOW)
+
+        if self.with_btc:
+            symbol_return = (c / prev_close - 1) if prev_close is not None else float('nan')
+            btc_value = btc_return if btc_return is not None and btc_return == btc_return else 0.0
+            self.corr_pairs.append((symbol_return, btc_value))
+            btc_correlation = self._window_corr(self.corr_pairs)
+        else:
+            btc_correlation = 0.0
+
+        self.closes.append(c)
+        roc = (c / self.closes[0] - 1) * 100 if len(self.closes) > MOMENTUM_PERIOD else float('nan')
+        roc_acceleration = roc - self.prev_roc
+        self.prev_roc = roc
+        prev_ema_slope = self.ema_slope
+        self.ema_slope = _ewm_step(self.ema_slope, c, self.ALPHA_EMA_SLOPE)
+        ema_slope_pct = float('nan')
+        if prev_ema_slope is not None:
+            ema_slope_pct = (self.ema_slope - prev_ema_slope) / (prev_ema_slope if prev_ema_slope != 0 else 1e-9) * 100
+
+        raw = {
+            'open': o, 'high': h, 'low': l, 'close': c, 'volume': v,
+            'atr': self.atr, 'adx': self.adx, 'rsi': rsi, 'relative_volume': relative_volume,
+            'price_vs_ema50': (c / self.ema_fast) - 1, 'price_vs_ema200': (c / self.ema_slow) - 1,
+            'btc_correlation': btc_correlation, f'roc_{MOMENTUM_PERIOD}': roc, 'roc_acceleration': roc_acceleration,
+            f'ema_slope_{EMA_SLOPE_PERIOD}': ema_slope_pct,
+            'hour_of_day': float(datetime.fromtimestamp(open_time / 1000, tz=timezone.utc).hour),
+        }
+        # Mirrors the forward-fill that get_features applies before dropping incomplete rows.
+        previous = self.features
+        self.features = {k: (previous.get(k, value) if value != value else value) for k, value in raw.items()}
+        self.prev_close, self.prev_high, self.prev_low = c, h, l
+        self.last_open_time = open_time
+        return self.features
+
+    def advance(self, df: pd.DataFrame, btc_returns: Optional[Dict[int, float]] = None) -> Optional[Dict[str, float]]:
+        """Feeds the candles of `df` newer than the state; replays the whole frame if the state does not connect to it."""
+        if df is None or df.empty: return None
+        open_times = ((df.index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).tolist()
+        start = bisect_left(open_times, self.last_open_time) if self.last_open_time is not None else len(open_times)
+        if start < len(open_times) and open_times[start] == self.last_open_time:
+            start += 1
+        else:
+            self.reset(); start = 0
+        values = df[['open', 'high', 'low', 'close', 'volume']].iloc[start:].to_numpy(dtype=float)
+        btc_returns = btc_returns or {}
+        for open_time, (o, h, l, c, v) in zip(open_times[start:], values):
+            self.update(open_time, o, h, l, c, v, btc_returns.get(open_time))
+        return self.features
+
+    def to_dict(self) -> Dict[str, Any]:
+        state = {name: getattr(self, name) for name in self.SCALAR_FIELDS}
+        state.update({'version': self.VERSION, 'volumes': list(self.volumes), 'closes': list(self.closes),
+                      'corr_pairs': [list(p) for p in self.corr_pairs], 'features': self.features})
+        return state
+
+    @classmethod
+    def from_dict(cls, state: Dict[str, Any]) -> Optional['IncrementalIndicators']:
+        if state.get('version') != cls.VERSION: return None
+        obj = cls(with_btc=bool(state.get('with_btc', True)))
+        for name in cls.SCALAR_FIELDS: setattr(obj, name, state.get(name))
+        if obj.prev_roc is None: obj.prev_roc = float('nan')
+        obj.volumes.extend(state.get('volumes', [])); obj.closes.extend(state.get('closes', []))
+        obj.corr_pairs.extend(tuple(p) for p in state.get('corr_pairs', []))
+        obj.features = dict(state.get('features', {}))
+        return obj
+
+def get_indicator_state(symbol: str, interval: str, with_btc: bool) -> IncrementalIndicators:
+    with indicator_states_lock:
+        state = indicator_states.get((symbol, interval))
+        if state is None or state.with_btc != with_btc:
+            state = indicator_states[(symbol, interval)] = IncrementalIndicators(with_btc=with_btc)
+        return state
+
+def calculate_latest_features(symbol: str, df_15m: pd.DataFrame, df_4h: pd.DataFrame, btc_df: Optional[pd.DataFrame]) -> Optional[pd.DataFrame]:
+    """Incremental equivalent of get_features()'s last row, as a one-row float32 DataFrame."""
+    btc_returns = None
+    has_btc = btc_df is not None and not btc_df.empty
+    if has_btc:
+        btc_tail = btc_df['btc_returns'].iloc[-(CANDLE_BUFFER_SIZE + 1):]
+        btc_keys = ((btc_tail.index - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(milliseconds=1)).tolist()
+        btc_returns = dict(zip(btc_keys, btc_tail.tolist()))
+    state_15m = get_indicator_state(symbol, SIGNAL_GENERATION_TIMEFRAME, with_btc=has_btc)
+    state_4h = get_indicator_state(symbol, HIGHER_TIMEFRAME, with_btc=False)
+    with state_15m.lock: features = dict(state_15m.advance(df_15m, btc_returns) or {})
+    with state_4h.lock:
+        features_4h = dict(state_4h.advance(df_4h) or {})
+        last_4h_open_time = state_4h.last_open_time
+    if not features or not features_4h or last_4h_open_time > state_15m.last_open_time: return None
+    features['rsi_4h'] = features_4h['rsi']
+    features['price_vs_ema50_4h'] = features_4h['price_vs_ema50']
+    return pd.DataFrame([features], index=df_15m.index[-1:]).astype('float32')
+
+def save_indicator_states():
+    if not redis_client or not USE_INCREMENTAL_INDICATORS: return
+    try:
+        with indicator_states_lock: items = list(indicator_states.items())
+        payload = {}
+        for (symbol, interval), state in items:
+            with state.lock: payload[f"{symbol}:{interval}"] = json.dumps(state.to_dict())
+        if payload: redis_client.hset(REDIS_INDICATOR_STATE_HASH_NAME, mapping=payload)
+        logger.info(f"💾 [Indicators] Persisted {len(payload)} incremental indicator states.")
+    except Exception as e:
+        logger.error(f"❌ [Indicators] Failed to persist indicator states: {e}")
+
+def load_indicator_states():
+    if not redis_client or not USE_INCREMENTAL_INDICATORS: return
+    try:
+        loaded = 0
+        for key, raw in redis_client.hgetall(REDIS_INDICATOR_STATE_HASH_NAME).items():
+            symbol, interval = key.rsplit(':', 1)
+            state = IncrementalIndicators.from_dict(json.loads(raw))
+            if state is None: continue
+            with indicator_states_lock: indicator_states[(symbol, interval)] = state
+            loaded += 1
+        logger.info(f"✅ [Indicators] Restored {loaded} incremental indicator states.")
+    except Exception as e:
+        logger.error(f"❌ [Indicators] Failed to restore indicator states: {e}")
+
 def get_trend_for_timeframe(df: Optional[pd.DataFrame]) -> Dict[str, Any]:
     if df is None or len(df) < 26: return {"trend": "Uncertain", "rsi": -1, "adx": -1}
     try:
@@ -748,22 +1516,87 @@ def determine_market_state():
         elif downtrends >= 2 and uptrends == 0: overall_regime = "DOWNTREND"
         elif "Uncertain" in trends: overall_regime = "UNCERTAIN"
         with market_state_lock:
+            regime_changed = current_market_state.get('overall_regime') != overall_regime
             current_market_state = {
                 "overall_regime": overall_regime,
                 "details": {"15m": state_15m, "1h": state_1h, "4h": state_4h},
                 "last_updated": datetime.now(timezone.utc).isoformat()
             }
             last_market_state_check = time.time()
+            state_copy = dict(current_market_state)
+        event_broker.publish('market_state', {**state_copy, 'regime_changed': regime_changed})
         logger.info(f"✅ [Market State] New state: {overall_regime} (15m: {state_15m['trend']}, 1h: {state_1h['trend']}, 4h: {state_4h['trend']})")
     except Exception as e:
         logger.error(f"❌ [Market State] Failed to determine market state: {e}", exc_info=True)
         with market_state_lock: current_market_state['overall_regime'] = "UNCERTAIN"
 
+class ModelCache:
+    """
+    ذاكرة تخزين مؤقت LRU لحزم النماذج بميزانية بايت محددة، تبقى دافئة بين الدورات.
+    يُعاد تحميل النموذج فقط إذا تغيّر ملفه (mtime/الحجم ثم بصمة SHA-1 للتأكيد).
+    """
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._lock = Lock()
+        self.total_bytes = 0
+        self.hits = self.misses = self.reloads = self.evictions = 0
+
+    def __len__(self) -> int:
+        with self._lock: return len(self._entries)
+
+    def get(self, model_name: str, model_path: str) -> Optional[Dict[str, Any]]:
+        try:
+            stat = os.stat(model_path)
+        except FileNotFoundError:
+            self.discard(model_name)
+            return None
+        with self._lock:
+            entry = self._entries.get(model_name)
+            if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                self._entries.move_to_end(model_name)
+                self.hits += 1
+                return entry['bundle']
+        with open(model_path, 'rb') as f: raw = f.read()
+        digest = hashlib.sha1(raw).hexdigest()
+        with self._lock:
+            if entry and entry['sha1'] == digest and model_name in self._entries:
+                entry['mtime_ns'] = stat.st_mtime_ns
+                self._entries.move_to_end(model_name)
+                self.hits += 1
+                return entry['bundle']
+        bundle = pickle.loads(raw)
+        logger.info(f"✅ [ML Model] {'Reloaded changed' if entry else 'Loaded'} model '{model_name}' ({stat.st_size / 1024 / 1024:.1f} MB).")
+        with self._lock:
+            if entry: self.reloads += 1
+            else: self.misses += 1
+            self._put(model_name, {'bundle': bundle, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha1': digest})
+        return bundle
+
+    def _put(self, model_name: str, entry: Dict[str, Any]):
+        old = self._entries.pop(model_name, None)
+        if old: self.total_bytes -= old['size']
+        self._entries[model_name] = entry
+        self.total_bytes += entry['size']
+        while self.total_bytes > self.max_bytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self.total_bytes -= evicted['size']
+            self.evictions += 1
+
+    def discard(self, model_name: str):
+        with self._lock:
+            old = self._entries.pop(model_name, None)
+            if old: self.total_bytes -= old['size']
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"models": len(self._entries), "bytes": self.total_bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "reloads": self.reloads, "evictions": self.evictions}
+
+ml_models_cache = ModelCache(MODEL_CACHE_MAX_BYTES)
+
 def load_ml_model_bundle_from_folder(symbol: str) -> Optional[Dict[str, Any]]:
-    global ml_models_cache
     model_name = f"{BASE_ML_MODEL_NAME}_{symbol}"
-    if model_name in ml_models_cache:
-        return ml_models_cache[model_name]
     script_dir = os.path.dirname(os.path.abspath(__file__))
     model_dir_path = os.path.join(script_dir, MODEL_FOLDER)
     if not os.path.exists(model_dir_path):
@@ -774,14 +1607,14 @@ def load_ml_model_bundle_from_folder(symbol: str) -> Optional[Dict[str, Any]]:
         logger.warning(f"⚠️ [ML Model] Model file not found at '{model_path}'.")
         return None
     try:
-        with open(model_path, 'rb') as f:
-            model_bundle = pickle.load(f)
-        if 'model' in model_bundle and 'scaler' in model_bundle and 'feature_names' in model_bundle:
-            ml_models_cache[model_name] = model_bundle
-            logger.info(f"✅ [ML Model] Loaded model '{model_name}' successfully.")
+        model_bundle = ml_models_cache.get(model_name, model_path)
+        if model_bundle and 'model' in model_bundle and 'scaler' in model_bundle and 'feature_names' in model_bundle:
+            if USE_COMPILED_PREDICTOR and 'compiled_predictor' not in model_bundle:
+                model_bundle['compiled_predictor'] = CompiledForest.from_bundle(model_bundle)
             return model_bundle
         else:
             logger.error(f"❌ [ML Model] Model bundle at '{model_path}' is incomplete.")
+            ml_models_cache.discard(model_name)
             return None
     except Exception as e:
         logger.error(f"❌ [ML Model] Error loading model for symbol {symbol}: {e}", exc_info=True)
@@ -792,6 +1625,7 @@ class TradingStrategy:
         self.symbol = symbol
         model_bundle = load_ml_model_bundle_from_folder(symbol)
         self.ml_model, self.scaler, self.feature_names = (model_bundle.get('model'), model_bundle.get('scaler'), model_bundle.get('feature_names')) if model_bundle else (None, None, None)
+        self.compiled_predictor: Optional[CompiledForest] = model_bundle.get('compiled_predictor') if model_bundle and USE_COMPILED_PREDICTOR else None
 
     def get_features(self, df_15m: pd.DataFrame, df_4h: pd.DataFrame, btc_df: pd.DataFrame) -> Optional[pd.DataFrame]:
         if self.feature_names is None: return None
@@ -810,21 +1644,40 @@ class TradingStrategy:
             logger.error(f"❌ [{self.symbol}] Feature engineering failed: {e}", exc_info=True)
             return None
 
+    def get_latest_features(self, df_15m: pd.DataFrame, df_4h: pd.DataFrame, btc_df: pd.DataFrame) -> Optional[pd.DataFrame]:
+        if self.feature_names is None: return None
+        try:
+            df_featured = calculate_latest_features(self.symbol, df_15m, df_4h, btc_df)
+            if df_featured is None: return None
+            for col in self.feature_names:
+                if col not in df_featured.columns: df_featured[col] = 0.0
+            df_featured.replace([np.inf, -np.inf], np.nan, inplace=True)
+            return df_featured.dropna(subset=self.feature_names)
+        except Exception as e:
+            logger.error(f"❌ [{self.symbol}] Incremental feature engineering failed: {e}", exc_info=True)
+            return None
+
     def generate_signal(self, df_features: pd.DataFrame) -> Optional[Dict[str, Any]]:
         if not all([self.ml_model, self.scaler, self.feature_names]) or df_features.empty: return None
         try:
             last_row_ordered_df = df_features.iloc[[-1]][self.feature_names]
-            features_scaled_np = self.scaler.transform(last_row_ordered_df)
-            features_scaled_df = pd.DataFrame(features_scaled_np, columns=self.feature_names)
-            prediction = self.ml_model.predict(features_scaled_df)[0]
-            prediction_proba = self.ml_model.predict_proba(features_scaled_df)
-            confidence = float(np.max(prediction_proba[0]))
-            logger.info(f"ℹ️ [{self.symbol}] Model predicted '{'BUY' if prediction == 1 else 'SELL/HOLD'}' with {confidence:.2%} confidence.")
-            return {'prediction': int(prediction), 'confidence': confidence}
+            if self.compiled_predictor is not None:
+                prediction, confidence = self.compiled_predictor.predict_one(last_row_ordered_df.to_numpy())
+            else:
+                features_scaled_np = self.scaler.transform(last_row_ordered_df)
+                features_scaled_df = pd.DataFrame(features_scaled_np, columns=self.feature_names)
+                prediction = self.ml_model.predict(features_scaled_df)[0]
+                prediction_proba = self.ml_model.predict_proba(features_scaled_df)
+                confidence = float(np.max(prediction_proba[0]))
+            return self.make_signal(prediction, confidence)
         except Exception as e:
             logger.warning(f"⚠️ [{self.symbol}] Signal Generation Error: {e}")
             return None
 
+    def make_signal(self, prediction: Any, confidence: float) -> Dict[str, Any]:
+        logger.info(f"ℹ️ [{self.symbol}] Model predicted '{'BUY' if prediction == 1 else 'SELL/HOLD'}' with {confidence:.2%} confidence.")
+        return {'prediction': int(prediction), 'confidence': float(confidence)}
+
 def passes_momentum_filter(last_features: pd.Series) -> bool:
     symbol = last_features.name
     roc = last_features.get(f'roc_{MOMENTUM_PERIOD}', 0)
@@ -861,123 +1714,677 @@ def calculate_tp_sl(symbol: str, entry_price: float, last_atr: float) -> Optiona
     fallback_sl = entry_price - (last_atr * ATR_FALLBACK_SL_MULTIPLIER)
     return {'target_price': fallback_tp, 'stop_loss': fallback_sl, 'source': 'ATR_Fallback'}
 
-def handle_price_update_message(msg: List[Dict[str, Any]]) -> None:
-    if not isinstance(msg, list) or not redis_client: return
+# ---------------------- لقطة أسعار مشتركة (Price Snapshot) ----------------------
+class PriceSnapshot:
+    """
+    أسعار كل العملات من طلب get_symbol_ticker() واحد بدون رمز، تُخدَم لكل المستدعين خلال مدة `ttl`.
+    مراقب الصفقات وسعر الدخول و/api/signals والإغلاق اليدوي تتشارك نفس الطلب بدلاً من طلب لكل عملة.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._prices: Dict[str, float] = {}
+        self._fetched_at = 0.0
+        self._lock = Lock()
+
+    def _get_all(self, max_age: float) -> Dict[str, float]:
+        # One caller refreshes while the others wait on the lock and then reuse its result.
+        with self._lock:
+            if time.time() - self._fetched_at > max_age:
+                tickers = client.get_symbol_ticker()
+                self._prices = {t['symbol']: float(t['price']) for t in tickers if t.get('symbol') and t.get('price')}
+                self._fetched_at = time.time()
+            return self._prices
+
+    def get_prices(self, symbols: List[str], max_age: Optional[float] = None) -> Dict[str, float]:
+        """Prices at most `max_age` (default ttl) seconds old; symbols missing from the snapshot are left out."""
+        prices = self._get_all(self.ttl if max_age is None else max_age)
+        return {symbol: prices[symbol] for symbol in symbols if symbol in prices}
+
+    def get_price(self, symbol: str, max_age: Optional[float] = None) -> float:
+        price = self.get_prices([symbol], max_age).get(symbol)
+        if price is None: price = float(client.get_symbol_ticker(symbol=symbol)['price'])
+        return price
+
+price_snapshot = PriceSnapshot(PRICE_SNAPSHOT_TTL_SECONDS)
+
+# ---------------------- مدرج زمن الاستجابة لمراقب الصفقات ----------------------
+class LatencyHistogram:
+    """Cumulative (Prometheus-style `le`) latency buckets in milliseconds, safe to observe from any thread."""
+    BUCKETS_MS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 50.0, 100.0, 250.0, 500.0, 1000.0)
+
+    def __init__(self, buckets_ms: Optional[Tuple[float, ...]] = None):
+        if buckets_ms is not None: self.BUCKETS_MS = buckets_ms
+        self._lock = Lock()
+        self._counts = [0] * (len(self.BUCKETS_MS) + 1)
+        self._count, self._sum_ms, self._max_ms = 0, 0.0, 0.0
+
+    def observe(self, seconds: float):
+        value_ms = seconds * 1000
+        with self._lock:
+            self._counts[bisect_left(self.BUCKETS_MS, value_ms)] += 1
+            self._count += 1
+            self._sum_ms += value_ms
+            self._max_ms = max(self._max_ms, value_ms)
+
+    def _quantile_upper_bound(self, counts: List[int], total: int, q: float) -> Optional[float]:
+        if total == 0: return None
+        running = 0
+        for bound, count in zip(self.BUCKETS_MS + (float('inf'),), counts):
+            running += count
+            if running >= q * total: return bound
+        return None
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total, sum_ms, max_ms = list(self._counts), self._count, self._sum_ms, self._max_ms
+        cumulative, running = [], 0
+        for bound, count in zip(self.BUCKETS_MS + (float('inf'),), counts):
+            running += count
+            cumulative.append({'le_ms': bound if bound != float('inf') else '+Inf', 'count': running})
+        return {
+            'count': total, 'sum_ms': sum_ms, 'max_ms': max_ms, 'mean_ms': (sum_ms / total) if total else None,
+            'p50_ms_le': self._quantile_upper_bound(counts, total, 0.5), 'p99_ms_le': self._quantile_upper_bound(counts, total, 0.99),
+            'buckets': cumulative
+        }
+
+tick_to_trigger_latency = LatencyHistogram()
+tick_to_evaluation_latency = LatencyHistogram()
+candle_close_to_decision_latency = LatencyHistogram((1000.0, 2500.0, 5000.0, 10000.0, 20000.0, 30000.0, 60000.0, 120000.0, 300000.0, 900000.0))
+
+# ---------------------- كاتب الأسعار المدمج إلى Redis ----------------------
+class RedisPriceWriter:
+    """
+    يحتفظ بآخر سعر لكل عملة في الذاكرة، ويكتب إلى Redis الأسعار التي تغيرت فقط بأمر HSET واحد عبر pipeline كل
+    REDIS_PRICE_FLUSH_INTERVAL، فلا يتبع عدد الكتابات معدل رسائل WebSocket. بجانب كل سعر يُكتب وقت آخر تأكيد له
+    من المنصة في REDIS_PRICES_TS_HASH_NAME حتى لو لم يتغير، ليعرف القارئ عمر كل حقل. يقيس مدة تقادم السعر من
+    وصول الرسالة حتى اكتمال كتابته في Redis.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self.staleness = LatencyHistogram()
+        self._latest: Dict[str, float] = {}
+        self._dirty: Dict[str, float] = {}
+        self._seen_at: Dict[str, float] = {}
+        self._dirty_since: Optional[float] = None
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+        self.messages_received = 0
+        self.prices_written = 0
+        self.flushes = 0
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='redis-price-writer', daemon=True)
+            self._thread.start()
+
+    def update(self, prices: Dict[str, float], received_at: float):
+        seen_at = time.time()
+        with self._lock:
+            self.messages_received += 1
+            if self._dirty_since is None: self._dirty_since = received_at
+            for symbol, price in prices.items():
+                self._seen_at[symbol] = seen_at
+                if self._latest.get(symbol) == price: continue
+                self._latest[symbol] = price
+                self._dirty[symbol] = price
+
+    def forget(self, symbols: List[str]):
+        """Forgets prices Redis no longer holds (pruned fields) so the next message for them is written again."""
+        with self._lock:
+            for symbol in symbols: self._latest.pop(symbol, None)
+
+    def get_prices(self, symbols: List[str]) -> Dict[str, float]:
+        with self._lock:
+            return {symbol: self._latest[symbol] for symbol in symbols if symbol in self._latest}
+
+    def flush(self):
+        with self._lock:
+            dirty, seen_at, dirty_since = self._dirty, self._seen_at, self._dirty_since
+            self._dirty, self._seen_at, self._dirty_since = {}, {}, None
+        if not seen_at or not redis_client: return
+        batch = None
+        if dirty and PUBLISH_PRICE_BUS:
+            # A batch that cannot be encoded only costs its bus message; the hashes are still written.
+            try: batch = encode_price_batch(dirty, time.time())
+            except Exception as e: logger.error(f"❌ [Price Bus] Could not encode a batch of {len(dirty)} prices, not publishing it: {e}")
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            # Timestamps go first, so a reader never finds a newly written price without its timestamp.
+            pipe.hset(REDIS_PRICES_TS_HASH_NAME, mapping=seen_at)
+            if dirty: pipe.hset(REDIS_PRICES_HASH_NAME, mapping=dirty)
+            if batch is not None: pipe.publish(PRICE_CHANNEL, batch)
+            pipe.execute()
+        except redis.exceptions.RedisError as e:
+            logger.error(f"❌ [Redis Prices] Flush of {len(dirty)} prices failed, retrying next flush: {e}")
+            with self._lock:
+                # Prices that changed again while the write was failing are newer; keep those.
+                for symbol, price in dirty.items(): self._dirty.setdefault(symbol, price)
+                for symbol, ts in seen_at.items(): self._seen_at.setdefault(symbol, ts)
+                if self._dirty_since is None or (dirty_since is not None and dirty_since < self._dirty_since): self._dirty_since = dirty_since
+            return
+        except Exception as e:
+            logger.error(f"❌ [Redis Prices] Flush of {len(dirty)} prices failed, dropping them: {e}", exc_info=True)
+            return
+        if dirty_since is not None: self.staleness.observe(time.perf_counter() - dirty_since)
+        with self._lock:
+            self.prices_written += len(dirty)
+            self.flushes += 1
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None: self._thread.join(5)
+        self.flush()
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            pending_age = (time.perf_counter() - self._dirty_since) * 1000 if self._dirty_since is not None else 0.0
+            counters = {'messages_received': self.messages_received, 'flushes': self.flushes, 'prices_written': self.prices_written,
+                        'pending_prices': len(self._dirty), 'pending_age_ms': pending_age}
+        return {**counters, 'staleness': self.staleness.snapshot()}
+
+def announce_trade_events(events: List[Tuple[int, int, str, str, float, Optional[float]]]):
+    """
+    Appends (kind, signal_id, symbol, status, price, profit_pct) events to the Redis trade-event stream in one
+    pipeline. Best effort: see price_bus for the delivery guarantees; failures are logged, never raised.
+    """
+    if not events or not PUBLISH_PRICE_BUS or not redis_client: return
+    event_time, payloads = time.time(), []
+    for kind, signal_id, symbol, status, price, profit_pct in events:
+        try: payloads.append(encode_trade_event(kind, signal_id, symbol, status, price, profit_pct, event_time))
+        except Exception as e: logger.error(f"❌ [Price Bus] Could not encode trade event {kind} for signal {signal_id} ({symbol}): {e}")
+    if not payloads: return
     try:
-        price_updates = {item.get('s'): float(item.get('c', 0)) for item in msg if item.get('s') and item.get('c')}
-        if price_updates: redis_client.hset(REDIS_PRICES_HASH_NAME, mapping=price_updates)
+        pipe = redis_client.pipeline(transaction=False)
+        for payload in payloads: append_trade_event(pipe, payload)
+        pipe.execute()
+    except Exception as e:
+        logger.warning(f"⚠️ [Price Bus] Could not publish {len(payloads)} trade events: {e}")
+
+def read_cached_prices(symbols: List[str], max_age: float = REDIS_PRICE_MAX_AGE_SECONDS) -> Dict[str, float]:
+    """Prices from the Redis cache whose last exchange confirmation is at most `max_age` seconds old; others are left out."""
+    if not symbols or not redis_client: return {}
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hmget(REDIS_PRICES_HASH_NAME, symbols)
+    pipe.hmget(REDIS_PRICES_TS_HASH_NAME, symbols)
+    raw_prices, raw_timestamps = pipe.execute()
+    cutoff = time.time() - max_age
+    prices: Dict[str, float] = {}
+    for symbol, raw_price, raw_ts in zip(symbols, raw_prices, raw_timestamps):
+        try:
+            if raw_price and raw_ts and float(raw_ts) >= cutoff: prices[symbol] = float(raw_price)
+        except (ValueError, TypeError): continue
+    return prices
+
+def prune_stale_prices(ttl: float = REDIS_PRICE_TTL_SECONDS) -> int:
+    """Removes price fields not confirmed for `ttl` seconds (delisted or unsubscribed symbols), plus prices without a timestamp."""
+    if not redis_client: return 0
+    # One MULTI snapshot of both hashes: read separately, a symbol first flushed in between looks timestamp-less.
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.hgetall(REDIS_PRICES_TS_HASH_NAME)
+    pipe.hkeys(REDIS_PRICES_HASH_NAME)
+    timestamps, price_symbols = pipe.execute()
+    cutoff = time.time() - ttl
+    stale = set(price_symbols) - set(timestamps)
+    for symbol, raw_ts in timestamps.items():
+        try:
+            if float(raw_ts) < cutoff: stale.add(symbol)
+        except (ValueError, TypeError): stale.add(symbol)
+    if not stale: return 0
+    stale_symbols = list(stale)
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.hdel(REDIS_PRICES_HASH_NAME, *stale_symbols)
+    pipe.hdel(REDIS_PRICES_TS_HASH_NAME, *stale_symbols)
+    pipe.execute()
+    redis_price_writer.forget(stale_symbols)
+    return len(stale_symbols)
+
+redis_price_writer = RedisPriceWriter(REDIS_PRICE_FLUSH_INTERVAL)
+
+def handle_price_update_message(msg: Dict[str, Any]) -> None:
+    """
+    Multiplex miniTicker callback. Messages arrive as {'stream': ..., 'data': {...}} (a bare list for the
+    all-market array stream). Prices go to the coalescing Redis writer, and changed prices of symbols with an
+    open trade are handed straight to the trade monitor.
+    """
+    received_at = time.perf_counter()
+    try:
+        data = msg.get('data', msg) if isinstance(msg, dict) else msg
+        if isinstance(data, dict):
+            if data.get('e') == 'error':
+                logger.warning(f"⚠️ [WebSocket Price Updater] Stream error: {data.get('m')}")
+                return
+            data = [data]
+        if not isinstance(data, list): return
+        price_updates = {item.get('s'): float(item.get('c', 0)) for item in data if isinstance(item, dict) and item.get('s') and item.get('c')}
+        if not price_updates: return
+        redis_price_writer.update(price_updates, received_at)
+        
+        with signal_cache_lock:
+            open_symbols = [s for s in price_updates if s in open_signals_cache]
+        changed = {}
+        for symbol in open_symbols:
+            price = price_updates[symbol]
+            if last_pushed_prices.get(symbol) != price:
+                last_pushed_prices[symbol] = price
+                changed[symbol] = (price, received_at)
+        if changed:
+            with price_tick_condition:
+                pending_price_ticks.update(changed)
+                price_tick_condition.notify()
     except Exception as e: logger.error(f"❌ [WebSocket Price Updater] Error: {e}", exc_info=True)
 
+def initiate_signal_closures(closures: List[Tuple[str, Dict, str, float]]):
+    """
+    Takes (symbol, signal, status, closing_price) closures out of the open book and hands them to the closure
+    pool as one batch, so closures triggered by the same tick are written by a single UPDATE.
+    """
+    batch = []
+    for symbol, signal_to_close, status, closing_price in closures:
+        signal_id = signal_to_close.get('id')
+        if not signal_id:
+            logger.error(f"❌ [Closure] Attempted to close a signal without an ID for symbol {symbol}")
+            continue
+        with closure_lock:
+            if signal_id in signals_pending_closure:
+                logger.warning(f"⚠️ [Closure] Closure for signal {signal_id} ({symbol}) already in progress.")
+                continue
+            signals_pending_closure.add(signal_id)
+        with signal_cache_lock:
+            open_signals_cache.pop(symbol, None)
+            open_trade_book.remove(symbol)
+        last_pushed_prices.pop(symbol, None)
+        logger.info(f"ℹ️ [Closure] Queued closure for signal {signal_id} ({symbol}) with status '{status}'.")
+        batch.append((signal_to_close, status, closing_price))
+    if batch: closure_pool.submit_many(batch)
+
 def initiate_signal_closure(symbol: str, signal_to_close: Dict, status: str, closing_price: float):
-    signal_id = signal_to_close.get('id')
-    if not signal_id:
-        logger.error(f"❌ [Closure] Attempted to close a signal without an ID for symbol {symbol}")
-        return
-    with closure_lock:
-        if signal_id in signals_pending_closure:
-            logger.warning(f"⚠️ [Closure] Closure for signal {signal_id} ({symbol}) already in progress.")
+    initiate_signal_closures([(symbol, signal_to_close, status, closing_price)])
+
+# ---------------------- ذاكرة مؤقتة لقمم الأسعار (Write-Behind) ----------------------
+class PeakPriceBuffer:
+    """
+    يجمع أعلى سعر جديد لكل صفقة في الذاكرة ويكتب كل القمم المتغيرة بعبارة UPDATE واحدة كل
+    PEAK_FLUSH_INTERVAL ثانية، فلا يتناسب عدد الكتابات مع عدد الصفقات الصاعدة. قبل إغلاق أي صفقة تُكتب قمتها
+    فوراً ثم تُحذف من الذاكرة، وعند الإيقاف تُكتب كل القمم المتبقية.
+    """
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._dirty: Dict[int, float] = {}
+        self._lock = Lock()
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='peak-flusher', daemon=True)
+            self._thread.start()
+
+    def mark(self, signal_id: int, peak_price: float):
+        with self._lock:
+            if peak_price > self._dirty.get(signal_id, float('-inf')): self._dirty[signal_id] = peak_price
+
+    def flush(self, signal_ids: Optional[List[int]] = None):
+        """Writes the buffered peaks (only `signal_ids` when given) and forgets them; failed rows are kept for the next flush."""
+        with self._lock:
+            ids = list(self._dirty) if signal_ids is None else [i for i in signal_ids if i in self._dirty]
+            rows = [(signal_id, self._dirty.pop(signal_id)) for signal_id in ids]
+        if not rows: return
+        try:
+            if not check_db_connection(): raise OperationalError("DB connection unavailable.")
+            with db_connection() as conn:
+                with conn.cursor() as cur:
+                    execute_values(cur, """
+                        UPDATE signals AS s SET current_peak_price = v.peak
+                        FROM (VALUES %s) AS v(id, peak)
+                        WHERE s.id = v.id AND s.status IN ('open', 'updated')
+                        AND (s.current_peak_price IS NULL OR s.current_peak_price < v.peak);
+                    """, rows, template="(%s::integer, %s::double precision)", page_size=max(len(rows), 1))
+                conn.commit()
+            logger.debug(f"💾 [DB Peak Update] Flushed {len(rows)} peak prices.")
+        except Exception as e:
+            logger.error(f"❌ [DB Peak Update] Failed to flush {len(rows)} peak prices, keeping them for the next flush: {e}")
+            for signal_id, peak_price in rows: self.mark(signal_id, peak_price)
+
+    def _run(self):
+        while not self._stop_event.wait(self.flush_interval):
+            self.flush()
+
+    def stop(self):
+        self._stop_event.set()
+        if self._thread is not None: self._thread.join(5)
+        self.flush()
+
+peak_price_buffer = PeakPriceBuffer(PEAK_FLUSH_INTERVAL)
+
+# ---------------------- دفتر الصفقات المفتوحة كمصفوفات (Open-Trade Book) ----------------------
+class OpenTradeBook:
+    """
+    الصفقات المفتوحة كمصفوفات NumPy متوازية (صف لكل عملة)، فيُقيَّم الهدف والوقف والوقف المتحرك والربح لكل دفعة
+    أسعار بخطوة واحدة. الحذف ينقل آخر صف مكان الصف المحذوف فتبقى الصفوف [0:size) متصلة.
+    """
+    STATUS_NONE, STATUS_TARGET_HIT, STATUS_STOP_LOSS_HIT = 0, 1, 2
+
+    def __init__(self, capacity: int = 16):
+        self._lock = Lock()
+        self.size = 0
+        self.rows: Dict[str, int] = {}
+        self.symbols: List[Optional[str]] = [None] * capacity
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.entry = np.zeros(capacity)
+        self.target = np.zeros(capacity)
+        self.stop = np.zeros(capacity)
+        self.peak = np.zeros(capacity)
+        self.activation = np.zeros(capacity)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def _grow(self):
+        capacity = len(self.symbols) * 2
+        for name in ('ids', 'entry', 'target', 'stop', 'peak', 'activation'):
+            old = getattr(self, name)
+            new = np.zeros(capacity, dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+        self.symbols.extend([None] * (capacity - len(self.symbols)))
+
+    def upsert(self, signal: Dict[str, Any]):
+        """Adds or refreshes the row of an open signal dict (as stored in open_signals_cache)."""
+        symbol, signal_id = signal.get('symbol'), signal.get('id')
+        entry = float(signal.get('entry_price') or 0)
+        if not symbol or not signal_id or entry <= 0:
+            if symbol: self.remove(symbol)
             return
-        signals_pending_closure.add(signal_id)
-    with signal_cache_lock: open_signals_cache.pop(symbol, None)
-    logger.info(f"ℹ️ [Closure] Starting closure thread for signal {signal_id} ({symbol}) with status '{status}'.")
-    Thread(target=close_signal, args=(signal_to_close, status, closing_price)).start()
+        peak = float(signal.get('current_peak_price') or entry)
+        with self._lock:
+            row = self.rows.get(symbol)
+            if row is None:
+                if self.size == len(self.symbols): self._grow()
+                row = self.size
+                self.size += 1
+                self.rows[symbol] = row
+            elif self.ids[row] == signal_id:
+                peak = max(peak, self.peak[row])
+            self.symbols[row] = symbol
+            self.ids[row] = signal_id
+            self.entry[row] = entry
+            self.target[row] = float(signal.get('target_price') or 0)
+            self.stop[row] = float(signal.get('stop_loss') or 0)
+            self.peak[row] = peak
+            self.activation[row] = entry * (1 + TRAILING_ACTIVATION_PROFIT_PERCENT / 100)
+
+    def remove(self, symbol: str):
+        with self._lock:
+            row = self.rows.pop(symbol, None)
+            if row is None: return
+            last = self.size - 1
+            if row != last:
+                moved_symbol = self.symbols[last]
+                for values in (self.ids, self.entry, self.target, self.stop, self.peak, self.activation):
+                    values[row] = values[last]
+                self.symbols[row] = moved_symbol
+                self.rows[moved_symbol] = row
+            self.symbols[last] = None
+            self.size = last
+
+    def reset(self, signals: List[Dict[str, Any]]):
+        with self._lock:
+            self.rows.clear()
+            self.size = 0
+        for signal in signals: self.upsert(signal)
+
+    def evaluate(self, prices: Dict[str, float]) -> Optional[Dict[str, Any]]:
+        """
+        One vectorised pass over the trades that have a price in `prices`: PnL, peak ratchet (stored), effective
+        trailing stop and TP/SL status per row. Returns None when none of the symbols has an open trade.
+        """
+        with self._lock:
+            matched = [(self.rows[s], p) for s, p in prices.items() if s in self.rows and p and p > 0]
+            if not matched: return None
+            rows = np.fromiter((r for r, _ in matched), dtype=np.int64, count=len(matched))
+            price = np.fromiter((p for _, p in matched), dtype=np.float64, count=len(matched))
+            stop = self.stop[rows]
+            if USE_TRAILING_STOP_LOSS:
+                trailing_active = price > self.activation[rows]
+                new_peak = trailing_active & (price > self.peak[rows])
+                self.peak[rows[new_peak]] = price[new_peak]
+                trailing_stop = self.peak[rows] * (1 - TRAILING_DISTANCE_PERCENT / 100)
+                effective_stop = np.where(trailing_active, np.maximum(stop, trailing_stop), stop)
+            else:
+                new_peak = np.zeros(len(rows), dtype=bool)
+                effective_stop = stop
+            target_hit = price >= self.target[rows]
+            stop_hit = ~target_hit & (price <= effective_stop)
+            return {
+                'symbols': [self.symbols[r] for r in rows], 'ids': self.ids[rows], 'price': price,
+                'pnl_pct': (price / self.entry[rows] - 1) * 100, 'peak': self.peak[rows], 'new_peak': new_peak,
+                'stop': stop, 'effective_stop': effective_stop,
+                'status': np.where(target_hit, self.STATUS_TARGET_HIT, np.where(stop_hit, self.STATUS_STOP_LOSS_HIT, self.STATUS_NONE))
+            }
 
-def update_signal_peak_price_in_db(signal_id: int, new_peak_price: float):
-    if not check_db_connection() or not conn:
-        return
-    try:
-        with conn.cursor() as cur:
-            cur.execute("UPDATE signals SET current_peak_price = %s WHERE id = %s;", (new_peak_price, signal_id))
-        conn.commit()
-        logger.debug(f"💾 [DB Peak Update] Saved new peak price {new_peak_price} for signal {signal_id}.")
-    except Exception as e:
-        logger.error(f"❌ [DB Peak Update] Failed to update peak price for signal {signal_id}: {e}")
-        if conn: conn.rollback()
+open_trade_book = OpenTradeBook()
+
+def evaluate_open_trades(ticks: Dict[str, Tuple[float, Optional[float]]]):
+    """Applies a batch of {symbol: (price, received_at)} to the open-trade book, then runs the side effects."""
+    result = open_trade_book.evaluate({symbol: price for symbol, (price, _) in ticks.items()})
+    if result is None: return
+    symbols, ids, prices, pnl, peaks = result['symbols'], result['ids'], result['price'], result['pnl_pct'], result['peak']
+    with signal_cache_lock:
+        for i, symbol in enumerate(symbols):
+            cached = open_signals_cache.get(symbol)
+            if not cached or cached.get('id') != ids[i]: continue
+            cached['current_price'] = float(prices[i])
+            cached['pnl_pct'] = float(pnl[i])
+            if result['new_peak'][i]: cached['current_peak_price'] = float(peaks[i])
+    if event_broker.has_subscribers():
+        event_broker.stage_prices({symbols[i]: {'id': int(ids[i]), 'current_price': float(prices[i]), 'pnl_pct': float(pnl[i])} for i in range(len(symbols))})
+    
+    for i in np.flatnonzero(result['new_peak']):
+        signal_id, symbol = int(ids[i]), symbols[i]
+        peak_price_buffer.mark(signal_id, float(peaks[i]))
+        if result['effective_stop'][i] > result['stop'][i]:
+            logger.info(f"📈 [Trailing SL] {symbol} new peak: {peaks[i]:.4f}. Adjusted SL to: {result['effective_stop'][i]:.4f}")
+    
+    status_names = {OpenTradeBook.STATUS_TARGET_HIT: 'target_hit', OpenTradeBook.STATUS_STOP_LOSS_HIT: 'stop_loss_hit'}
+    triggered = []
+    for i, symbol in enumerate(symbols):
+        received_at = ticks[symbol][1]
+        status_to_set = status_names.get(int(result['status'][i]))
+        if not status_to_set:
+            if received_at is not None: tick_to_evaluation_latency.observe(time.perf_counter() - received_at)
+            continue
+        signal_id, price = int(ids[i]), float(prices[i])
+        with closure_lock:
+            if signal_id in signals_pending_closure: continue
+        with signal_cache_lock:
+            signal = open_signals_cache.get(symbol)
+        if not signal or signal.get('id') != signal_id: continue
+        latency_note = ""
+        if received_at is not None:
+            latency = time.perf_counter() - received_at
+            tick_to_trigger_latency.observe(latency)
+            latency_note = f" (tick-to-trigger {latency * 1000:.2f}ms)"
+        logger.info(f"✅ [TRIGGER] ID:{signal_id} | {symbol} | Condition '{status_to_set}' met at price {price}{latency_note}.")
+        triggered.append((symbol, signal, status_to_set, price))
+    initiate_signal_closures(triggered)
+
+def run_direct_price_check():
+    """Safety net for a silent WebSocket: re-evaluates every open trade from the price snapshot, Redis as fallback."""
+    with signal_cache_lock:
+        symbols = list(open_signals_cache.keys())
+    if not symbols: return
+    prices: Dict[str, float] = {}
+    try: prices = price_snapshot.get_prices(symbols)
+    except Exception as e: logger.warning(f"⚠️ [Trade Monitor] Price snapshot failed, using Redis prices: {e}")
+    missing = [s for s in symbols if s not in prices]
+    if missing:
+        try: prices.update(read_cached_prices(missing, max_age=DIRECT_API_CHECK_INTERVAL))
+        except redis.exceptions.RedisError as e: logger.warning(f"⚠️ [Trade Monitor] Redis price lookup failed: {e}")
+    evaluate_open_trades({symbol: (price, None) for symbol, price in prices.items()})
 
 def trade_monitoring_loop():
+    """
+    Event-driven: handle_price_update_message queues the latest changed price of every symbol with an open
+    trade and wakes this thread, which evaluates them immediately. Bursts for one symbol coalesce to the newest
+    price. Every DIRECT_API_CHECK_INTERVAL seconds all open trades are also re-checked from the price snapshot.
+    """
     global last_api_check_time
-    logger.info("✅ [Trade Monitor] Starting trade monitoring loop.")
+    logger.info("✅ [Trade Monitor] Starting event-driven trade monitor.")
     while True:
         try:
-            with signal_cache_lock:
-                signals_to_check = dict(open_signals_cache)
-            if not signals_to_check or not redis_client or not client:
-                time.sleep(1); continue
+            with price_tick_condition:
+                if not pending_price_ticks: price_tick_condition.wait(timeout=1.0)
+                ticks = dict(pending_price_ticks)
+                pending_price_ticks.clear()
+            if ticks: evaluate_open_trades(ticks)
             
-            perform_direct_api_check = (time.time() - last_api_check_time) > DIRECT_API_CHECK_INTERVAL
-            if perform_direct_api_check:
+            if client and (time.time() - last_api_check_time) > DIRECT_API_CHECK_INTERVAL:
                 last_api_check_time = time.time()
-            
-            symbols_to_fetch = list(signals_to_check.keys())
-            redis_prices_list = redis_client.hmget(REDIS_PRICES_HASH_NAME, symbols_to_fetch)
-            redis_prices = {symbol: price for symbol, price in zip(symbols_to_fetch, redis_prices_list)}
-            
-            for symbol, signal in signals_to_check.items():
-                signal_id = signal.get('id')
-                if not signal_id: continue
-                with closure_lock:
-                    if signal_id in signals_pending_closure: continue
-                
-                price = None
-                if perform_direct_api_check:
-                    try: price = float(client.get_symbol_ticker(symbol=symbol)['price'])
-                    except Exception: pass
-                if not price and redis_prices.get(symbol):
-                    try: price = float(redis_prices[symbol])
-                    except (ValueError, TypeError): continue
-                if not price: continue
-                
-                with signal_cache_lock:
-                    if symbol in open_signals_cache:
-                        open_signals_cache[symbol]['current_price'] = price
-                        open_signals_cache[symbol]['pnl_pct'] = ((price / float(signal['entry_price'])) - 1) * 100
-                
-                target_price = float(signal.get('target_price', 0))
-                original_stop_loss = float(signal.get('stop_loss', 0))
-                effective_stop_loss = original_stop_loss
-                
-                if USE_TRAILING_STOP_LOSS:
-                    entry_price = float(signal.get('entry_price', 0))
-                    activation_price = entry_price * (1 + TRAILING_ACTIVATION_PROFIT_PERCENT / 100)
-                    if price > activation_price:
-                        current_peak = float(signal.get('current_peak_price', entry_price))
-                        if price > current_peak:
-                            with signal_cache_lock:
-                                if symbol in open_signals_cache:
-                                    open_signals_cache[symbol]['current_peak_price'] = price
-                            now = time.time()
-                            if now - LAST_PEAK_UPDATE_TIME.get(signal_id, 0) > PEAK_UPDATE_COOLDOWN:
-                                update_signal_peak_price_in_db(signal_id, price)
-                                LAST_PEAK_UPDATE_TIME[signal_id] = now
-                            current_peak = price
-                        
-                        trailing_stop_price = current_peak * (1 - TRAILING_DISTANCE_PERCENT / 100)
-                        if trailing_stop_price > effective_stop_loss:
-                            logger.info(f"📈 [Trailing SL] {symbol} new peak: {current_peak:.4f}. Adjusted SL to: {trailing_stop_price:.4f}")
-                            effective_stop_loss = trailing_stop_price
-                
-                status_to_set = None
-                if price >= target_price: status_to_set = 'target_hit'
-                elif price <= effective_stop_loss: status_to_set = 'stop_loss_hit'
-                
-                if status_to_set:
-                    logger.info(f"✅ [TRIGGER] ID:{signal_id} | {symbol} | Condition '{status_to_set}' met at price {price}.")
-                    initiate_signal_closure(symbol, signal, status_to_set, price)
-            time.sleep(0.2)
+                run_direct_price_check()
         except Exception as e:
             logger.error(f"❌ [Trade Monitor] Critical error: {e}", exc_info=True)
             time.sleep(5)
 
-def send_telegram_message(target_chat_id: str, text: str, reply_markup: Optional[Dict] = None) -> bool:
-    if not TELEGRAM_TOKEN or not target_chat_id: return False
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
-    payload = {'chat_id': str(target_chat_id), 'text': text, 'parse_mode': 'Markdown'}
-    if reply_markup: payload['reply_markup'] = json.dumps(reply_markup)
-    try:
-        response = requests.post(url, json=payload, timeout=10)
-        if response.status_code == 200: return True
-        else: logger.error(f"❌ [Telegram] Failed to send message. Status: {response.status_code}, Response: {response.text}"); return False
-    except requests.exceptions.RequestException as e: logger.error(f"❌ [Telegram] Request failed: {e}"); return False
+# ---------------------- صندوق صادر Telegram غير المتزامن ----------------------
+class TelegramOutbox:
+    """
+    طابور رسائل Telegram يخدمه خيط واحد بجلسة HTTP دائمة، فلا تنتظر خيوط التداول الشبكة أبداً.
+    - لكل محادثة رسالة واحدة على الأكثر كل TELEGRAM_PER_CHAT_INTERVAL ثانية، مع احترام retry_after عند 429.
+    - الرسائل بلا أزرار تنتظر TELEGRAM_COALESCE_WINDOW ثم تُدمج المتتالية منها في رسالة واحدة (دفعة إغلاقات مثلاً).
+    - أخطاء الشبكة و5xx يُعاد إرسالها بتراجع أُسّي حتى TELEGRAM_MAX_RETRIES، وأخطاء 4xx الأخرى تُسقط مع تسجيلها.
+    """
+
+    def __init__(self, token: str, max_pending: int):
+        self.url = f"https://api.telegram.org/bot{token}/sendMessage" if token else None
+        self.max_pending = max_pending
+        self._session = requests.Session()
+        self._queues: Dict[str, deque] = {}
+        self._next_send_at: Dict[str, float] = {}
+        self._pending = 0
+        self._condition = Condition()
+        self._stopping = False
+        self._thread: Optional[Thread] = None
+        self._thread_lock = Lock()
+
+    def send(self, chat_id: str, text: str, reply_markup: Optional[Dict] = None, on_sent: Optional[Any] = None) -> bool:
+        """Queues a message and returns immediately; `on_sent` runs on the worker once Telegram accepted it."""
+        if not self.url or not chat_id: return False
+        with self._condition:
+            if self._stopping: return False
+            if self._pending >= self.max_pending:
+                logger.error(f"❌ [Telegram] Outbox full ({self._pending} pending), dropping message.")
+                return False
+            now = time.time()
+            self._queues.setdefault(str(chat_id), deque()).append({
+                'text': text, 'reply_markup': reply_markup, 'on_sent': on_sent, 'attempts': 0,
+                'not_before': now + (TELEGRAM_COALESCE_WINDOW if reply_markup is None else 0.0)
+            })
+            self._pending += 1
+            self._condition.notify()
+        self._ensure_started()
+        return True
+
+    def _ensure_started(self):
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name='telegram-outbox', daemon=True)
+                self._thread.start()
+
+    def _take_ready(self) -> Tuple[Optional[str], List[Dict[str, Any]], Optional[float]]:
+        """Called under the condition. Returns (chat_id, messages) ready to go now, or the seconds until one is."""
+        now, wait = time.time(), None
+        for chat_id, queue in self._queues.items():
+            if not queue: continue
+            ready_at = max(self._next_send_at.get(chat_id, 0.0), queue[0]['not_before'])
+            if ready_at > now:
+                wait = ready_at - now if wait is None else min(wait, ready_at - now)
+                continue
+            batch = [queue.popleft()]
+            if batch[0]['reply_markup'] is None:
+                length = len(batch[0]['text'])
+                while queue and queue[0]['reply_markup'] is None and queue[0]['not_before'] <= now + TELEGRAM_COALESCE_WINDOW \
+                        and length + 2 + len(queue[0]['text']) <= TELEGRAM_MAX_MESSAGE_LENGTH:
+                    length += 2 + len(queue[0]['text'])
+                    batch.append(queue.popleft())
+            self._pending -= len(batch)
+            return chat_id, batch, None
+        return None, [], wait
+
+    def _requeue(self, chat_id: str, batch: List[Dict[str, Any]], delay: float, count_attempt: bool):
+        now = time.time()
+        keep = []
+        for message in batch:
+            if count_attempt: message['attempts'] += 1
+            if message['attempts'] > TELEGRAM_MAX_RETRIES:
+                logger.error(f"❌ [Telegram] Giving up on message after {TELEGRAM_MAX_RETRIES} retries: {message['text'][:80]!r}")
+                continue
+            message['not_before'] = now + delay
+            keep.append(message)
+        with self._condition:
+            self._queues.setdefault(chat_id, deque()).extendleft(reversed(keep))
+            self._pending += len(keep)
+
+    def _deliver(self, chat_id: str, batch: List[Dict[str, Any]]):
+        payload = {'chat_id': chat_id, 'text': "\n\n".join(m['text'] for m in batch), 'parse_mode': 'Markdown'}
+        if batch[0]['reply_markup']: payload['reply_markup'] = json.dumps(batch[0]['reply_markup'])
+        backoff = min(60.0, 2.0 ** max(m['attempts'] for m in batch))
+        try:
+            response = self._session.post(self.url, json=payload, timeout=10)
+        except requests.exceptions.RequestException as e:
+            logger.error(f"❌ [Telegram] Request failed, retrying in {backoff:.0f}s: {e}")
+            self._requeue(chat_id, batch, backoff, count_attempt=True)
+            return
+        with self._condition: self._next_send_at[chat_id] = time.time() + TELEGRAM_PER_CHAT_INTERVAL
+        if response.status_code == 200:
+            for message in batch:
+                if message['on_sent']:
+                    try: message['on_sent']()
+                    except Exception as e: logger.error(f"❌ [Telegram] on_sent callback failed: {e}", exc_info=True)
+            return
+        if response.status_code == 429:
+            try: retry_after = float(response.json().get('parameters', {}).get('retry_after', backoff))
+            except ValueError: retry_after = backoff
+            logger.warning(f"⚠️ [Telegram] Rate limited for chat {chat_id}, retrying in {retry_after:.1f}s.")
+            with self._condition: self._next_send_at[chat_id] = time.time() + retry_after
+            self._requeue(chat_id, batch, retry_after, count_attempt=False)
+        elif response.status_code >= 500:
+            logger.error(f"❌ [Telegram] Server error {response.status_code}, retrying in {backoff:.0f}s.")
+            self._requeue(chat_id, batch, backoff, count_attempt=True)
+        else:
+            logger.error(f"❌ [Telegram] Failed to send message. Status: {response.status_code}, Response: {response.text}")
+
+    def _run(self):
+        while True:
+            with self._condition:
+                chat_id, batch, wait = self._take_ready()
+                if not batch:
+                    if self._stopping and self._pending == 0: return
+                    self._condition.wait(timeout=wait if wait is not None else 1.0)
+                    continue
+            self._deliver(chat_id, batch)
+
+    def stop(self, timeout: float = 10.0):
+        """Stops accepting messages and gives the worker up to `timeout` seconds to deliver what is queued."""
+        with self._condition:
+            self._stopping = True
+            for queue in self._queues.values():
+                for message in queue: message['not_before'] = 0.0
+            self._condition.notify()
+        if self._thread is not None: self._thread.join(timeout)
+
+telegram_outbox = TelegramOutbox(TELEGRAM_TOKEN, TELEGRAM_OUTBOX_MAX)
+
+def send_telegram_message(target_chat_id: str, text: str, reply_markup: Optional[Dict] = None, on_sent: Optional[Any] = None) -> bool:
+    """Non-blocking: queues the message on the outbox. Returns False only when it could not be queued."""
+    return telegram_outbox.send(target_chat_id, text, reply_markup, on_sent)
 
 def send_new_signal_alert(signal_data: Dict[str, Any]):
     symbol = signal_data['symbol']; entry = float(signal_data['entry_price']); target = float(signal_data['target_price']); sl = float(signal_data['stop_loss'])
@@ -991,8 +2398,8 @@ def send_new_signal_alert(signal_data: Dict[str, Any]):
                f"*الربح المتوقع:* `{profit_pct:.2f}%`\n*المخاطرة/العائد:* `1:{rrr:.2f}`\n\n"
                f"*ثقة النموذج:* `{confidence_display}`")
     reply_markup = {"inline_keyboard": [[{"text": "📊 فتح لوحة التحكم", "url": WEBHOOK_URL or '#'}]]}
-    if send_telegram_message(CHAT_ID, message, reply_markup):
-        log_and_notify('info', f"New Signal: {symbol} in {market_regime} market", "NEW_SIGNAL")
+    send_telegram_message(CHAT_ID, message, reply_markup,
+                          on_sent=lambda: log_and_notify('info', f"New Signal: {symbol} in {market_regime} market", "NEW_SIGNAL"))
 
 def send_trade_update_alert(signal_data: Dict[str, Any], old_signal_data: Dict[str, Any]):
     symbol = signal_data['symbol']
@@ -1010,120 +2417,346 @@ def send_trade_update_alert(signal_data: Dict[str, Any], old_signal_data: Dict[s
                f"*الوقف:* `{old_sl:,.8g}` ⬅️ `{new_sl:,.8g}`\n\n"
                f"تم تحديث الصفقة بناءً على إشارة شراء أقوى.")
     reply_markup = {"inline_keyboard": [[{"text": "📊 فتح لوحة التحكم", "url": WEBHOOK_URL or '#'}]]}
-    if send_telegram_message(CHAT_ID, message, reply_markup):
-        log_and_notify('info', f"Updated Signal: {symbol} due to stronger signal.", "UPDATE_SIGNAL")
+    send_telegram_message(CHAT_ID, message, reply_markup,
+                          on_sent=lambda: log_and_notify('info', f"Updated Signal: {symbol} due to stronger signal.", "UPDATE_SIGNAL"))
 
 
 def insert_signal_into_db(signal: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-    if not check_db_connection() or not conn: return None
+    if not check_db_connection(): return None
     try:
         entry = float(signal['entry_price']); target = float(signal['target_price']); sl = float(signal['stop_loss'])
-        with conn.cursor() as cur:
-            cur.execute("INSERT INTO signals (symbol, entry_price, target_price, stop_loss, strategy_name, signal_details, current_peak_price) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;",
-                        (signal['symbol'], entry, target, sl, signal.get('strategy_name'), json.dumps(signal.get('signal_details', {})), entry))
-            signal['id'] = cur.fetchone()['id']
-        conn.commit()
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("INSERT INTO signals (symbol, entry_price, target_price, stop_loss, strategy_name, signal_details, current_peak_price) VALUES (%s, %s, %s, %s, %s, %s, %s) RETURNING id;",
+                            (signal['symbol'], entry, target, sl, signal.get('strategy_name'), json.dumps(signal.get('signal_details', {})), entry))
+                signal['id'] = cur.fetchone()['id']
+            conn.commit()
         logger.info(f"✅ [DB] Inserted signal {signal['id']} for {signal['symbol']}.")
         return signal
     except Exception as e:
         logger.error(f"❌ [Insert] Error inserting signal for {signal['symbol']}: {e}", exc_info=True)
-        if conn: conn.rollback()
         return None
 
 def update_signal_in_db(signal_id: int, new_data: Dict[str, Any]) -> bool:
-    if not check_db_connection() or not conn: return False
+    if not check_db_connection(): return False
     try:
         target = float(new_data['target_price'])
         sl = float(new_data['stop_loss'])
         details = json.dumps(new_data.get('signal_details', {}))
         
-        with conn.cursor() as cur:
-            cur.execute("""
-                UPDATE signals 
-                SET target_price = %s, stop_loss = %s, signal_details = %s, status = 'updated'
-                WHERE id = %s AND status IN ('open', 'updated');
-            """, (target, sl, details, signal_id))
-            if cur.rowcount == 0:
-                logger.warning(f"⚠️ [DB Update] Signal {signal_id} not found or already closed. No update performed.")
-                return False
-        conn.commit()
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    UPDATE signals 
+                    SET target_price = %s, stop_loss = %s, signal_details = %s, status = 'updated'
+                    WHERE id = %s AND status IN ('open', 'updated');
+                """, (target, sl, details, signal_id))
+                if cur.rowcount == 0:
+                    logger.warning(f"⚠️ [DB Update] Signal {signal_id} not found or already closed. No update performed.")
+                    return False
+            conn.commit()
         logger.info(f"✅ [DB] Updated signal {signal_id} for {new_data['symbol']}.")
         return True
     except Exception as e:
         logger.error(f"❌ [Update] Error updating signal {signal_id}: {e}", exc_info=True)
-        if conn: conn.rollback()
         return False
 
-def close_signal(signal: Dict, status: str, closing_price: float):
-    signal_id = signal.get('id'); symbol = signal.get('symbol')
-    logger.info(f"Initiating closure for signal {signal_id} ({symbol}) with status '{status}'")
-    try:
-        if not check_db_connection() or not conn: raise OperationalError("DB connection failed.")
-        db_closing_price = float(closing_price); entry_price = float(signal['entry_price'])
-        profit_pct = ((db_closing_price / entry_price) - 1) * 100
+# ---------------------- الإحصائيات المُجمَّعة (Materialised Stats) ----------------------
+# صف واحد في trading_stats يُحدَّث داخل نفس معاملة الإغلاق، ونسخة منه في الذاكرة تخدم /api/stats بزمن ثابت.
+TRADING_STATS_COLUMNS = ('closed_count', 'win_count', 'profit_sum', 'win_profit_sum', 'loss_profit_sum', 'version')
+
+def _set_trading_stats(row: Dict[str, Any]):
+    # Concurrent closures may commit out of order; never let an older version overwrite a newer one.
+    with trading_stats_lock:
+        if not trading_stats or int(row['version']) >= int(trading_stats.get('version', -1)):
+            trading_stats.clear()
+            trading_stats.update({column: row[column] for column in TRADING_STATS_COLUMNS})
+
+def apply_closures_to_trading_stats(cur, profits: List[float]) -> Optional[Dict[str, Any]]:
+    """Adds newly closed trades to the stats row inside the caller's transaction. None when the row does not exist yet."""
+    wins = [p for p in profits if p > 0]
+    losses = [p for p in profits if p < 0]
+    cur.execute("""
+        UPDATE trading_stats SET closed_count = closed_count + %s, win_count = win_count + %s, profit_sum = profit_sum + %s,
+            win_profit_sum = win_profit_sum + %s, loss_profit_sum = loss_profit_sum + %s, version = version + 1, updated_at = NOW()
+        WHERE id = 1 RETURNING *;
+    """, (len(profits), len(wins), sum(profits), sum(wins), -sum(losses)))
+    return cur.fetchone()
+
+def rebuild_trading_stats() -> Optional[Dict[str, Any]]:
+    """Recomputes the stats row from the full signals history (repair path; also seeds an empty table)."""
+    with db_connection() as conn:
         with conn.cursor() as cur:
-            cur.execute("UPDATE signals SET status = %s, closing_price = %s, closed_at = NOW(), profit_percentage = %s WHERE id = %s AND status IN ('open', 'updated');",
-                        (status, db_closing_price, profit_pct, signal_id))
-            if cur.rowcount == 0: logger.warning(f"⚠️ [DB Close] Signal {signal_id} was already closed or not found."); return
+            cur.execute("INSERT INTO trading_stats (id) VALUES (1) ON CONFLICT (id) DO NOTHING;")
+            # Holding the row lock makes closures committing meanwhile apply their increments after the rebuild.
+            cur.execute("SELECT id FROM trading_stats WHERE id = 1 FOR UPDATE;")
+            cur.execute("""
+                WITH agg AS (
+                    SELECT COUNT(*) AS closed_count, COUNT(*) FILTER (WHERE profit_percentage > 0) AS win_count,
+                        COALESCE(SUM(profit_percentage), 0) AS profit_sum,
+                        COALESCE(SUM(profit_percentage) FILTER (WHERE profit_percentage > 0), 0) AS win_profit_sum,
+                        COALESCE(-SUM(profit_percentage) FILTER (WHERE profit_percentage < 0), 0) AS loss_profit_sum
+                    FROM signals WHERE status NOT IN ('open', 'updated') AND profit_percentage IS NOT NULL
+                )
+                UPDATE trading_stats SET closed_count = agg.closed_count, win_count = agg.win_count, profit_sum = agg.profit_sum,
+                    win_profit_sum = agg.win_profit_sum, loss_profit_sum = agg.loss_profit_sum,
+                    version = trading_stats.version + 1, updated_at = NOW()
+                FROM agg WHERE trading_stats.id = 1 RETURNING trading_stats.*;
+            """)
+            row = cur.fetchone()
         conn.commit()
-        status_map = {'target_hit': '✅ تحقق الهدف', 'stop_loss_hit': '🛑 ضرب وقف الخسارة', 'manual_close': '🖐️ إغلاق يدوي', 'closed_by_sell_signal': '🔴 إغلاق بإشارة بيع'}
-        status_message = status_map.get(status, status)
-        alert_msg = (f"*{status_message}*\n*العملة:* `{symbol}`\n*الربح:* `{profit_pct:+.2f}%`")
-        send_telegram_message(CHAT_ID, alert_msg)
-        log_and_notify('info', f"{status_message}: {symbol} | Profit: {profit_pct:+.2f}%", 'CLOSE_SIGNAL')
-        logger.info(f"✅ [DB Close] Signal {signal_id} closed successfully.")
+    _set_trading_stats(row)
+    logger.info(f"✅ [Stats] Rebuilt trading stats from history: {row['closed_count']} closed trades.")
+    return row
+
+def load_trading_stats():
+    if not check_db_connection(): return
+    try:
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT * FROM trading_stats WHERE id = 1;")
+            row = cur.fetchone()
+        if row: _set_trading_stats(row)
+        else: rebuild_trading_stats()
+    except Exception as e: logger.error(f"❌ [Loading] Failed to load trading stats: {e}")
+
+# ---------------------- منحنى الأرباح التراكمي في الذاكرة ----------------------
+class ProfitCurve:
+    """
+    منحنى الربح التراكمي محفوظ في الذاكرة: يُحمَّل مرة واحدة من قاعدة البيانات ثم يُضاف إليه كل إغلاق، وتقدّمه
+    /api/profit_curve مقصوصاً بـ since ومختزلاً إلى max_points نقطة بخوارزمية LTTB.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._times: List[datetime] = []
+        self._x: List[float] = []
+        self._profits: List[float] = []
+        self._cumulative: List[float] = []
+        self.loaded = False
+
+    def load(self):
+        with db_connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT closed_at, profit_percentage FROM signals
+                WHERE status NOT IN ('open', 'updated') AND profit_percentage IS NOT NULL AND closed_at IS NOT NULL
+                ORDER BY closed_at ASC;
+            """)
+            trades = cur.fetchall()
+        with self._lock:
+            self._times = [t['closed_at'] for t in trades]
+            self._x = [t['closed_at'].timestamp() for t in trades]
+            self._profits = [float(t['profit_percentage']) for t in trades]
+            self._cumulative = np.cumsum(self._profits).tolist() if trades else []
+            self.loaded = True
+        logger.info(f"✅ [Loading] Loaded profit curve with {len(trades)} closed trades.")
+
+    def add(self, closed_at: datetime, profit_pct: float):
+        with self._lock:
+            if not self.loaded: return
+            position = bisect_left(self._x, closed_at.timestamp()) if self._x and closed_at.timestamp() < self._x[-1] else len(self._x)
+            self._times.insert(position, closed_at)
+            self._x.insert(position, closed_at.timestamp())
+            self._profits.insert(position, profit_pct)
+            base = self._cumulative[position - 1] if position > 0 else 0.0
+            # Closures normally arrive in order (O(1) append); a late commit only recomputes the tail after it.
+            self._cumulative[position:] = (base + np.cumsum(self._profits[position:])).tolist()
+
+    def series(self, since: Optional[datetime] = None, max_points: int = PROFIT_CURVE_DEFAULT_MAX_POINTS) -> List[Dict[str, Any]]:
+        with self._lock:
+            start = bisect_left(self._x, since.timestamp()) if since is not None else 0
+            times = self._times[start:]
+            x = np.asarray(self._x[start:])
+            y = np.asarray(self._cumulative[start:])
+        points = []
+        if since is None:
+            start_time = (times[0] - timedelta(seconds=1)).isoformat() if times else datetime.now(timezone.utc).isoformat()
+            points.append({"timestamp": start_time, "cumulative_profit": 0.0})
+        for i in lttb_downsample(x, y, max_points - len(points)) if len(x) else []:
+            points.append({"timestamp": times[i].isoformat(), "cumulative_profit": float(y[i])})
+        return points
+
+profit_curve = ProfitCurve()
+
+def _restore_open_signal(signal: Dict):
+    symbol = signal.get('symbol')
+    if not symbol: return
+    with signal_cache_lock:
+        if symbol not in open_signals_cache:
+            open_signals_cache[symbol] = signal
+            open_trade_book.upsert(signal)
+
+def close_signals(closures: List[Tuple[Dict, str, float]]):
+    """
+    Closes a batch of (signal, status, closing_price) in one UPDATE ... FROM (VALUES ...) statement, then sends
+    the alerts. Signals whose closure fails are put back in the open cache; all ids leave signals_pending_closure.
+    """
+    rows, by_id = [], {}
+    for signal, status, closing_price in closures:
+        signal_id, symbol = signal.get('id'), signal.get('symbol')
+        logger.info(f"Initiating closure for signal {signal_id} ({symbol}) with status '{status}'")
+        try:
+            db_closing_price = float(closing_price); entry_price = float(signal['entry_price'])
+            profit_pct = ((db_closing_price / entry_price) - 1) * 100
+            rows.append((signal_id, status, db_closing_price, profit_pct))
+            by_id[signal_id] = (signal, status, profit_pct)
+        except Exception as e:
+            logger.error(f"❌ [DB Close] Critical error closing signal {signal_id}: {e}", exc_info=True)
+            _restore_open_signal(signal)
+            with closure_lock: signals_pending_closure.discard(signal_id)
+    if not rows: return
+    peak_price_buffer.flush(list(by_id))
+    try:
+        if not check_db_connection(): raise OperationalError("DB connection failed.")
+        with db_connection() as conn:
+            with conn.cursor() as cur:
+                closed_rows = execute_values(cur, """
+                    UPDATE signals AS s
+                    SET status = v.status, closing_price = v.closing_price, closed_at = NOW(), profit_percentage = v.profit_percentage
+                    FROM (VALUES %s) AS v(id, status, closing_price, profit_percentage)
+                    WHERE s.id = v.id AND s.status IN ('open', 'updated')
+                    RETURNING s.id, s.profit_percentage, s.closed_at;
+                """, rows, template="(%s::integer, %s::text, %s::double precision, %s::double precision)", page_size=len(rows), fetch=True)
+                stats_row = apply_closures_to_trading_stats(cur, [float(row['profit_percentage']) for row in closed_rows]) if closed_rows else None
+            conn.commit()
     except Exception as e:
-        logger.error(f"❌ [DB Close] Critical error closing signal {signal_id}: {e}", exc_info=True)
-        if conn: conn.rollback()
-        if symbol:
-            with signal_cache_lock:
-                if symbol not in open_signals_cache: open_signals_cache[symbol] = signal
+        logger.error(f"❌ [DB Close] Critical error closing signals {list(by_id)}: {e}", exc_info=True)
+        for signal, _, _ in by_id.values(): _restore_open_signal(signal)
+        with closure_lock: signals_pending_closure.difference_update(by_id)
+        return
+
+    # The closures are committed from here on: a failing side effect is logged, never undone by reopening trades.
+    closed_ids = {row['id'] for row in closed_rows}
+    try:
+        for row in closed_rows: profit_curve.add(row['closed_at'], float(row['profit_percentage']))
+    except Exception as e: logger.error(f"❌ [Profit Curve] Could not add closures {sorted(closed_ids)}: {e}", exc_info=True)
+    try:
+        if stats_row: _set_trading_stats(stats_row)
+        elif closed_rows: rebuild_trading_stats()
+    except Exception as e: logger.error(f"❌ [Stats] Could not update trading stats: {e}", exc_info=True)
+    if closed_rows:
+        try:
+            event_broker.publish('closure', [{'id': row['id'], 'symbol': by_id[row['id']][0].get('symbol'), 'status': by_id[row['id']][1],
+                                              'profit_percentage': float(row['profit_percentage']), 'closed_at': row['closed_at']} for row in closed_rows])
+        except Exception as e: logger.error(f"❌ [Events] Could not publish closures {sorted(closed_ids)}: {e}", exc_info=True)
+        closing_prices = {signal_id: closing_price for signal_id, _, closing_price, _ in rows}
+        announce_trade_events([(TRADE_CLOSED, row['id'], by_id[row['id']][0].get('symbol'), by_id[row['id']][1],
+                                closing_prices[row['id']], float(row['profit_percentage'])) for row in closed_rows])
+
+    status_map = {'target_hit': '✅ تحقق الهدف', 'stop_loss_hit': '🛑 ضرب وقف الخسارة', 'manual_close': '🖐️ إغلاق يدوي', 'closed_by_sell_signal': '🔴 إغلاق بإشارة بيع'}
+    try:
+        for signal_id, (signal, status, profit_pct) in by_id.items():
+            if signal_id not in closed_ids:
+                logger.warning(f"⚠️ [DB Close] Signal {signal_id} was already closed or not found.")
+                continue
+            symbol = signal.get('symbol')
+            status_message = status_map.get(status, status)
+            alert_msg = (f"*{status_message}*\n*العملة:* `{symbol}`\n*الربح:* `{profit_pct:+.2f}%`")
+            send_telegram_message(CHAT_ID, alert_msg)
+            log_and_notify('info', f"{status_message}: {symbol} | Profit: {profit_pct:+.2f}%", 'CLOSE_SIGNAL')
+            logger.info(f"✅ [DB Close] Signal {signal_id} closed successfully.")
     finally:
-        with closure_lock: signals_pending_closure.discard(signal_id)
+        with closure_lock: signals_pending_closure.difference_update(by_id)
+
+def close_signal(signal: Dict, status: str, closing_price: float):
+    close_signals([(signal, status, closing_price)])
+
+# ---------------------- مجمع عمال الإغلاق ----------------------
+class ClosureWorkerPool:
+    """
+    عدد ثابت من العمال يخدم طابور الإغلاقات بدلاً من خيط لكل إغلاق. إغلاقات نفس النبضة تدخل الطابور كدفعة
+    واحدة (submit_many)، وكل عامل يأخذ دفعة كاملة ويضم إليها ما تراكم بعدها حتى CLOSURE_BATCH_SIZE، ثم يغلقها بعبارة
+    UPDATE واحدة.
+    """
+
+    def __init__(self, workers: int, batch_size: int):
+        self.workers = workers
+        self.batch_size = batch_size
+        self._queue: Queue = Queue()
+        self._threads: List[Thread] = []
+        self._threads_lock = Lock()
+        self._stopping = False
+
+    def submit(self, signal: Dict, status: str, closing_price: float):
+        self.submit_many([(signal, status, closing_price)])
+
+    def submit_many(self, closures: List[Tuple[Dict, str, float]]):
+        """Queues the closures as batches of at most batch_size, each taken whole by one worker."""
+        with self._threads_lock:
+            if not self._threads:
+                self._threads = [Thread(target=self._run, name=f'closure-{i}', daemon=True) for i in range(self.workers)]
+                for thread in self._threads: thread.start()
+        for i in range(0, len(closures), self.batch_size):
+            self._queue.put(list(closures[i:i + self.batch_size]))
+
+    def _run(self):
+        while True:
+            try: batch = self._queue.get(timeout=0.5)
+            except Empty:
+                if self._stopping: return
+                continue
+            while len(batch) < self.batch_size:
+                try: more = self._queue.get_nowait()
+                except Empty: break
+                room = self.batch_size - len(batch)
+                batch.extend(more[:room])
+                if len(more) > room: self._queue.put(more[room:])
+            try: close_signals(batch)
+            except Exception as e: logger.error(f"❌ [Closure] Worker error: {e}", exc_info=True)
+
+    def stop(self, timeout: float = 10.0):
+        """Lets the workers finish everything already queued, then stops them."""
+        self._stopping = True
+        deadline = time.time() + timeout
+        for thread in self._threads: thread.join(max(0.0, deadline - time.time()))
+
+closure_pool = ClosureWorkerPool(CLOSURE_WORKERS, CLOSURE_BATCH_SIZE)
 
 def load_open_signals_to_cache():
-    if not check_db_connection() or not conn: return
+    if not check_db_connection(): return
     try:
-        with conn.cursor() as cur:
+        with db_connection() as conn, conn.cursor() as cur:
             cur.execute("SELECT * FROM signals WHERE status IN ('open', 'updated');")
             open_signals = cur.fetchall()
-            with signal_cache_lock:
-                open_signals_cache.clear()
-                for signal in open_signals: open_signals_cache[signal['symbol']] = dict(signal)
-            logger.info(f"✅ [Loading] Loaded {len(open_signals)} open signals.")
+        with signal_cache_lock:
+            open_signals_cache.clear()
+            for signal in open_signals: open_signals_cache[signal['symbol']] = dict(signal)
+            open_trade_book.reset(list(open_signals_cache.values()))
+        logger.info(f"✅ [Loading] Loaded {len(open_signals)} open signals.")
     except Exception as e: logger.error(f"❌ [Loading] Failed to load open signals: {e}")
 
 def load_notifications_to_cache():
-    if not check_db_connection() or not conn: return
+    if not check_db_connection(): return
     try:
-        with conn.cursor() as cur:
+        with db_connection() as conn, conn.cursor() as cur:
             cur.execute("SELECT * FROM notifications ORDER BY timestamp DESC LIMIT 50;")
             recent = cur.fetchall()
-            with notifications_lock:
-                notifications_cache.clear()
-                for n in reversed(recent): n['timestamp'] = n['timestamp'].isoformat(); notifications_cache.appendleft(dict(n))
-            logger.info(f"✅ [Loading] Loaded {len(notifications_cache)} notifications.")
+        with notifications_lock:
+            notifications_cache.clear()
+            for n in reversed(recent): n['timestamp'] = n['timestamp'].isoformat(); notifications_cache.appendleft(dict(n))
+        logger.info(f"✅ [Loading] Loaded {len(notifications_cache)} notifications.")
     except Exception as e: logger.error(f"❌ [Loading] Failed to load notifications: {e}")
 
 def get_btc_data_for_bot() -> Optional[pd.DataFrame]:
-    btc_data = fetch_historical_data(BTC_SYMBOL, SIGNAL_GENERATION_TIMEFRAME, SIGNAL_GENERATION_LOOKBACK_DAYS)
+    btc_data = get_signal_candles(BTC_SYMBOL, SIGNAL_GENERATION_TIMEFRAME)
     if btc_data is not None: btc_data['btc_returns'] = btc_data['close'].pct_change()
     return btc_data
 
 def perform_end_of_cycle_cleanup():
     """
     Performs cleanup tasks at the end of a scan cycle.
-    Clears the Redis price cache and runs the Python garbage collector.
+    Prunes expired Redis price fields, reports model cache statistics and runs the Python garbage collector.
     """
     logger.info("🧹 [Cleanup] Starting end-of-cycle cleanup...")
     try:
         if redis_client:
-            deleted_keys = redis_client.delete(REDIS_PRICES_HASH_NAME)
-            logger.info(f"🧹 [Cleanup] Cleared Redis price cache '{REDIS_PRICES_HASH_NAME}'. Keys deleted: {deleted_keys}.")
+            pruned = prune_stale_prices()
+            logger.info(f"🧹 [Cleanup] Pruned {pruned} Redis prices older than {REDIS_PRICE_TTL_SECONDS:.0f}s from '{REDIS_PRICES_HASH_NAME}'.")
         
-        model_cache_size = len(ml_models_cache)
-        ml_models_cache.clear()
-        logger.info(f"🧹 [Cleanup] Cleared {model_cache_size} ML models from in-memory cache.")
+        save_indicator_states()
+
+        cache_stats = ml_models_cache.stats()
+        logger.info(f"🧠 [Model Cache] {cache_stats['models']} models, {cache_stats['bytes'] / 1024 / 1024:.1f}/{cache_stats['max_bytes'] / 1024 / 1024:.0f} MB | "
+                    f"hits: {cache_stats['hits']}, misses: {cache_stats['misses']}, reloads: {cache_stats['reloads']}, evictions: {cache_stats['evictions']}")
 
         collected = gc.collect()
         logger.info(f"🧹 [Cleanup] Garbage collector ran. Collected {collected} objects.")
@@ -1134,7 +2767,301 @@ def perform_end_of_cycle_cleanup():
         logger.error(f"❌ [Cleanup] An error occurred during cleanup: {e}", exc_info=True)
 
 
+def reserve_trade_slot(symbol: str) -> bool:
+    """Atomically claims one of the MAX_OPEN_TRADES slots for a symbol that is about to open a trade."""
+    with signal_cache_lock:
+        if symbol in open_signals_cache or symbol in reserved_trade_slots: return False
+        if len(open_signals_cache) + len(reserved_trade_slots) >= MAX_OPEN_TRADES: return False
+        reserved_trade_slots.add(symbol)
+        return True
+
+def release_trade_slot(symbol: str):
+    with signal_cache_lock: reserved_trade_slots.discard(symbol)
+
+# ---------------------- دورة المسح على ثلاث مراحل ----------------------
+# 1) جلب الشموع وحساب الميزات لكل العملات بالتوازي، 2) تقييم آخر صف لكل العملات دفعة واحدة لكل عائلة نماذج،
+# 3) تطبيق الفلاتر وفتح/تحديث الصفقات للعملات التي أعطت إشارة شراء فقط.
+def prepare_symbol_for_scan(symbol: str, btc_data: Optional[pd.DataFrame]) -> Optional[Dict[str, Any]]:
+    strategy = TradingStrategy(symbol)
+    if not all([strategy.ml_model, strategy.scaler, strategy.feature_names]): 
+        return None
+
+    df_15m = get_signal_candles(symbol, SIGNAL_GENERATION_TIMEFRAME)
+    if df_15m is None or df_15m.empty: return None
+    candle_open_ms = int(df_15m.index[-1].value // 1_000_000)
+    if candle_already_scored(symbol, candle_open_ms): return None
+    df_4h = get_signal_candles(symbol, HIGHER_TIMEFRAME)
+    if df_4h is None or df_4h.empty: return None
+    
+    df_features = strategy.get_latest_features(df_15m, df_4h, btc_data) if USE_INCREMENTAL_INDICATORS else strategy.get_features(df_15m, df_4h, btc_data)
+    if df_features is None or df_features.empty: return None
+    candle_close_ms = candle_open_ms + interval_to_ms(SIGNAL_GENERATION_TIMEFRAME)
+    return {'symbol': symbol, 'strategy': strategy, 'features': df_features, 'candle_open_ms': candle_open_ms, 'candle_close_ms': candle_close_ms}
+
+def candle_already_scored(symbol: str, candle_open_ms: int) -> bool:
+    with last_scored_candle_lock:
+        return last_scored_candle.get(symbol, -1) >= candle_open_ms
+
+def record_candle_decision(candidate: Dict[str, Any]) -> float:
+    """
+    Marks the candidate's candle as scored and records the delay between its close and the decision. Called only
+    once the decision is complete (scored, and acted on for buys), so any failure before that leaves the candle
+    open for a retry.
+    """
+    with last_scored_candle_lock:
+        symbol = candidate['symbol']
+        last_scored_candle[symbol] = max(last_scored_candle.get(symbol, -1), candidate['candle_open_ms'])
+    candle_close_ms = candidate['candle_close_ms']
+    latency = time.time() - candle_close_ms / 1000
+    candle_close_to_decision_latency.observe(latency)
+    logger.debug(f"⏱️ [{candidate['symbol']}] Candle close-to-decision: {latency:.2f}s")
+    return latency
+
+def _score_candidate_batch(members: List[Dict[str, Any]], cache: Dict[Tuple[Any, ...], ForestBatch]):
+    forests = [c['strategy'].compiled_predictor for c in members]
+    batch_key = tuple(id(f) for f in forests)
+    batch = forest_batch_cache.get(batch_key)
+    if batch is None or not batch.built_from(forests): batch = ForestBatch(forests)
+    cache[batch_key] = batch
+    X = np.vstack([c['features'].iloc[[-1]][c['strategy'].feature_names].to_numpy(dtype=np.float32) for c in members])
+    proba = batch.predict_proba(X)
+    best = proba.argmax(axis=1)
+    for candidate, row_proba, best_index in zip(members, proba, best):
+        candidate['signal_info'] = candidate['strategy'].make_signal(batch.classes[best_index], row_proba[best_index])
+
+def score_scan_candidates(candidates: List[Dict[str, Any]]):
+    """
+    Sets candidate['signal_info'] for every prepared symbol. Compiled models that share a feature layout and
+    class set are scored together as one float32 matrix (chunks of BATCH_INFERENCE_CHUNK_SIZE); anything else,
+    or a batch that fails, falls back to the per-symbol generate_signal.
+    """
+    global forest_batch_cache
+    families: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+    for candidate in candidates:
+        forest = candidate['strategy'].compiled_predictor
+        if USE_BATCH_INFERENCE and forest is not None: families.setdefault(forest.family_key, []).append(candidate)
+        else: candidate['signal_info'] = candidate['strategy'].generate_signal(candidate['features'])
+
+    used_batches: Dict[Tuple[Any, ...], ForestBatch] = {}
+    for members in families.values():
+        for i in range(0, len(members), BATCH_INFERENCE_CHUNK_SIZE):
+            chunk = members[i:i + BATCH_INFERENCE_CHUNK_SIZE]
+            try:
+                _score_candidate_batch(chunk, used_batches)
+            except Exception as e:
+                logger.warning(f"⚠️ [Batch Inference] Batch of {len(chunk)} failed, scoring per symbol: {e}")
+                for candidate in chunk: candidate['signal_info'] = candidate['strategy'].generate_signal(candidate['features'])
+    # Batches built for models that were reloaded or evicted since the last cycle are dropped here.
+    forest_batch_cache = used_batches
+
+def act_on_signal(candidate: Dict[str, Any], market_regime: str):
+    symbol, df_features, signal_info = candidate['symbol'], candidate['features'], candidate.get('signal_info')
+    if not signal_info: return
+    
+    prediction, confidence = signal_info['prediction'], signal_info['confidence']
+    if prediction != 1 or confidence < BUY_CONFIDENCE_THRESHOLD: return
+
+    last_features = df_features.iloc[-1]
+    last_features.name = symbol
+    with signal_cache_lock:
+        open_trade = open_signals_cache.get(symbol)
+        open_trade_count = len(open_signals_cache) + len(reserved_trade_slots)
+    
+    if open_trade:
+        old_confidence_raw = open_trade.get('signal_details', {}).get('ML_Confidence', 0.0)
+        old_confidence = 0.0
+        try:
+            if isinstance(old_confidence_raw, str):
+                old_confidence = float(old_confidence_raw.strip().replace('%', '')) / 100.0
+            elif old_confidence_raw is not None:
+                old_confidence = float(old_confidence_raw)
+        except (ValueError, TypeError): pass
+
+        if confidence <= old_confidence + MIN_CONFIDENCE_INCREASE_FOR_UPDATE: return
+        logger.info(f"🔄 [{symbol}] Stronger BUY signal. Old: {old_confidence:.2%}, New: {confidence:.2%}. Evaluating update...")
+        try:
+            entry_price = price_snapshot.get_price(symbol)
+            logger.info(f"✅ [{symbol}] Fresh entry price fetched via API snapshot: {entry_price}")
+        except Exception as e:
+            logger.error(f"❌ [{symbol}] Could not fetch fresh entry price via API: {e}. Skipping signal.")
+            return
+        if USE_SPEED_FILTER and not passes_speed_filter(last_features): return
+        if USE_MOMENTUM_FILTER and not passes_momentum_filter(last_features): return
+        last_atr = last_features.get('atr', 0)
+        tp_sl_data = calculate_tp_sl(symbol, entry_price, last_atr)
+        if not tp_sl_data: return
+        
+        updated_signal_data = {
+            'symbol': symbol, 'target_price': tp_sl_data['target_price'], 'stop_loss': tp_sl_data['stop_loss'],
+            'signal_details': { 'ML_Confidence': confidence, 'ML_Confidence_Display': f"{confidence:.2%}", 'Original_Confidence': old_confidence, 'Update_Reason': 'Reinforcement Signal' }
+        }
+        
+        if update_signal_in_db(open_trade['id'], updated_signal_data):
+            with signal_cache_lock:
+                if symbol in open_signals_cache:
+                    open_signals_cache[symbol].update(updated_signal_data)
+                    open_signals_cache[symbol]['status'] = 'updated'
+                    open_trade_book.upsert(open_signals_cache[symbol])
+            event_broker.publish('signal', {'id': open_trade['id'], 'symbol': symbol, 'status': 'updated'})
+            announce_trade_events([(TRADE_UPDATED, open_trade['id'], symbol, 'updated', entry_price, None)])
+            send_trade_update_alert(updated_signal_data, open_trade)
+        return
+
+    if open_trade_count >= MAX_OPEN_TRADES or not reserve_trade_slot(symbol): return
+    try:
+        try:
+            entry_price = price_snapshot.get_price(symbol)
+            logger.info(f"✅ [{symbol}] Fresh entry price fetched via API snapshot: {entry_price}")
+        except Exception as e:
+            logger.error(f"❌ [{symbol}] Could not fetch fresh entry price via API: {e}. Skipping signal.")
+            return
+
+        if USE_SPEED_FILTER and not passes_speed_filter(last_features): return
+        if USE_MOMENTUM_FILTER and not passes_momentum_filter(last_features): return
+        
+        last_atr = last_features.get('atr', 0)
+        volatility = (last_atr / entry_price * 100) if entry_price > 0 else 0
+        if USE_MIN_VOLATILITY_FILTER and volatility < MIN_VOLATILITY_PERCENT:
+            log_rejection(symbol, "Low Volatility", {"volatility": f"{volatility:.2f}%", "min": f"{MIN_VOLATILITY_PERCENT}%"}); return
+        
+        if USE_BTC_CORRELATION_FILTER and market_regime in ["UPTREND", "STRONG UPTREND"]:
+            correlation = last_features.get('btc_correlation', 0)
+            if correlation < MIN_BTC_CORRELATION:
+                log_rejection(symbol, "BTC Correlation", {"corr": f"{correlation:.2f}", "min": f"{MIN_BTC_CORRELATION}"}); return
+        
+        tp_sl_data = calculate_tp_sl(symbol, entry_price, last_atr)
+        if not tp_sl_data: return
+        
+        new_signal = {
+            'symbol': symbol, 'strategy_name': BASE_ML_MODEL_NAME, 
+            'signal_details': {'ML_Confidence': confidence, 'ML_Confidence_Display': f"{confidence:.2%}"}, 
+            'entry_price': entry_price, **tp_sl_data
+        }
+
+        if USE_RRR_FILTER:
+            risk = entry_price - float(new_signal['stop_loss'])
+            reward = float(new_signal['target_price']) - entry_price
+            if risk <= 0 or reward <= 0 or (reward / risk) < MIN_RISK_REWARD_RATIO:
+                log_rejection(symbol, "RRR Filter", {"rrr": f"{(reward/risk):.2f}" if risk > 0 else "N/A"}); return
+        
+        saved_signal = insert_signal_into_db(new_signal)
+        if saved_signal:
+            with signal_cache_lock:
+                open_signals_cache[saved_signal['symbol']] = saved_signal
+                open_trade_book.upsert(saved_signal)
+                reserved_trade_slots.discard(symbol)
+            event_broker.publish('signal', {'id': saved_signal['id'], 'symbol': symbol, 'status': 'open'})
+            announce_trade_events([(TRADE_OPENED, saved_signal['id'], symbol, 'open', float(saved_signal['entry_price']), None)])
+            send_new_signal_alert(saved_signal)
+    finally:
+        release_trade_slot(symbol)
+
+def process_symbol(symbol: str, btc_data: Optional[pd.DataFrame], market_regime: str):
+    candidate = prepare_symbol_for_scan(symbol, btc_data)
+    if candidate is None: return
+    candidate['signal_info'] = candidate['strategy'].generate_signal(candidate['features'])
+    if candidate['signal_info'] is None: return
+    act_on_signal(candidate, market_regime)
+    record_candle_decision(candidate)
+
+def _process_symbol_safe(symbol: str, btc_data: Optional[pd.DataFrame], market_regime: str):
+    try:
+        process_symbol(symbol, btc_data, market_regime)
+    except Exception as e: 
+        logger.error(f"❌ [Processing Error] {symbol}: {e}", exc_info=True)
+
+def _prepare_symbol_safe(symbol: str, btc_data: Optional[pd.DataFrame]) -> Optional[Dict[str, Any]]:
+    try:
+        return prepare_symbol_for_scan(symbol, btc_data)
+    except Exception as e: 
+        logger.error(f"❌ [Processing Error] {symbol}: {e}", exc_info=True)
+        return None
+
+def _act_on_signal_safe(candidate: Dict[str, Any], market_regime: str) -> bool:
+    try:
+        act_on_signal(candidate, market_regime)
+        return True
+    except Exception as e: 
+        logger.error(f"❌ [Processing Error] {candidate['symbol']}: {e}", exc_info=True)
+        return False
+
+def run_staged_scan_cycle(symbols: List[str], btc_data: Optional[pd.DataFrame], market_regime: str, executor: Optional[ThreadPoolExecutor]):
+    stage_start = time.time()
+    if executor is None:
+        candidates = []
+        for symbol in symbols:
+            candidates.append(_prepare_symbol_safe(symbol, btc_data))
+            time.sleep(SCAN_SYMBOL_DELAY_SECONDS)
+    else:
+        candidates = list(executor.map(lambda s: _prepare_symbol_safe(s, btc_data), symbols))
+    candidates = [c for c in candidates if c is not None]
+    fetch_duration, score_start = time.time() - stage_start, time.time()
+
+    score_scan_candidates(candidates)
+    score_duration = time.time() - score_start
+    logger.info(f"ℹ️ [Batch Inference] {len(candidates)}/{len(symbols)} symbols featured in {fetch_duration:.1f}s, scored in {score_duration * 1000:.0f}ms.")
+
+    scored = [c for c in candidates if c.get('signal_info')]
+    is_buy = lambda c: c['signal_info']['prediction'] == 1 and c['signal_info']['confidence'] >= BUY_CONFIDENCE_THRESHOLD
+    buy_candidates = [c for c in scored if is_buy(c)]
+    latencies = [record_candle_decision(c) for c in scored if not is_buy(c)]
+    if executor is None:
+        acted = [_act_on_signal_safe(candidate, market_regime) for candidate in buy_candidates]
+    else:
+        futures = [executor.submit(_act_on_signal_safe, c, market_regime) for c in buy_candidates]
+        acted = [future.result() for future in futures]
+    latencies += [record_candle_decision(c) for c, ok in zip(buy_candidates, acted) if ok]
+    if latencies:
+        logger.info(f"⏱️ [Scheduler] {len(latencies)}/{len(symbols)} candles decided. Close-to-decision: median {np.median(latencies):.1f}s, max {max(latencies):.1f}s.")
+
+def run_scan_cycle(symbols: List[str], btc_data: Optional[pd.DataFrame], market_regime: str):
+    if not USE_CONCURRENT_SCAN or SCAN_MAX_WORKERS <= 1:
+        if USE_BATCH_INFERENCE:
+            run_staged_scan_cycle(symbols, btc_data, market_regime, None)
+            return
+        for symbol in symbols:
+            _process_symbol_safe(symbol, btc_data, market_regime)
+            time.sleep(SCAN_SYMBOL_DELAY_SECONDS)
+        return
+    with ThreadPoolExecutor(max_workers=SCAN_MAX_WORKERS, thread_name_prefix='scan') as executor:
+        if USE_BATCH_INFERENCE:
+            run_staged_scan_cycle(symbols, btc_data, market_regime, executor)
+            return
+        futures = [executor.submit(_process_symbol_safe, symbol, btc_data, market_regime) for symbol in symbols]
+        for future in as_completed(futures): future.result()
+
+# ---------------------- جدولة المسح عند إغلاق شمعة الإشارة ----------------------
+def wait_for_next_candle_close(interval: str) -> int:
+    """Sleeps until the next `interval` candle close plus CANDLE_SETTLE_DELAY_SECONDS; returns that close time (ms)."""
+    interval_ms = interval_to_ms(interval)
+    candle_close_ms = (int(time.time() * 1000) // interval_ms + 1) * interval_ms
+    delay = candle_close_ms / 1000 + CANDLE_SETTLE_DELAY_SECONDS - time.time()
+    logger.info(f"⏳ [Scheduler] Next {interval} candle closes at {datetime.fromtimestamp(candle_close_ms / 1000, timezone.utc):%H:%M:%S} UTC, scanning in {delay:.0f}s.")
+    time.sleep(max(0.0, delay))
+    return candle_close_ms
+
+def wait_for_closed_candles(symbols: List[str], interval: str, candle_close_ms: int) -> int:
+    """
+    Waits (up to CANDLE_READY_MAX_WAIT_SECONDS after the close) until every symbol's websocket buffer holds the
+    candle that just closed. Returns how many are still missing; those are read via REST gap-fill by the scan.
+    """
+    if not USE_WEBSOCKET_CANDLES: return 0
+    candle_open_ms = candle_close_ms - interval_to_ms(interval)
+    deadline = candle_close_ms / 1000 + CANDLE_READY_MAX_WAIT_SECONDS
+    pending = list(symbols)
+    while True:
+        pending = [s for s in pending if not get_candle_buffer(s, interval).has_closed(candle_open_ms)]
+        if not pending or time.time() >= deadline: break
+        time.sleep(CANDLE_READY_POLL_SECONDS)
+    if pending: logger.warning(f"⚠️ [Scheduler] {len(pending)} symbols have no closed {interval} candle from the websocket yet, e.g. {pending[:5]}.")
+    return len(pending)
+
 def main_loop():
+    """
+    With USE_CANDLE_CLOSE_SCHEDULER every cycle starts right after a SIGNAL_GENERATION_TIMEFRAME candle closes
+    (plus a settle delay) and scores that closed candle once per symbol; otherwise cycles repeat every
+    FIXED_SCAN_INTERVAL_SECONDS.
+    """
     logger.info("[Main Loop] Waiting for initialization...")
     time.sleep(15)
     if not validated_symbols_to_scan: 
@@ -1142,132 +3069,44 @@ def main_loop():
         return
     log_and_notify("info", f"✅ Starting main scan loop for {len(validated_symbols_to_scan)} symbols.", "SYSTEM")
     
+    scan_now = True
     while True:
         try:
+            # The first cycle (and the one after a failed cycle) scores the latest already-closed candle right away
+            # instead of waiting up to a full period; candles whose decision was already recorded are skipped.
+            candle_close_ms = wait_for_next_candle_close(SIGNAL_GENERATION_TIMEFRAME) if USE_CANDLE_CLOSE_SCHEDULER and not scan_now else None
+            scan_now = False
             determine_market_state()
             with market_state_lock: 
                 market_regime = current_market_state.get("overall_regime", "UNCERTAIN")
             
             if USE_BTC_TREND_FILTER and market_regime in ["DOWNTREND", "STRONG DOWNTREND"]:
                 log_rejection("ALL", "BTC Trend Filter", {"detail": f"Scan paused due to market regime: {market_regime}"})
-                time.sleep(300)
+                if not USE_CANDLE_CLOSE_SCHEDULER: time.sleep(FIXED_SCAN_INTERVAL_SECONDS)
                 continue
             
+            cycle_start = time.time()
+            symbols = list(validated_symbols_to_scan)
+            if candle_close_ms is not None: wait_for_closed_candles(symbols, SIGNAL_GENERATION_TIMEFRAME, candle_close_ms)
             btc_data = get_btc_data_for_bot()
+            run_scan_cycle(symbols, btc_data, market_regime)
             
-            for symbol in validated_symbols_to_scan:
-                try:
-                    with signal_cache_lock:
-                        open_trade = open_signals_cache.get(symbol)
-                        open_trade_count = len(open_signals_cache)
-
-                    strategy = TradingStrategy(symbol)
-                    if not all([strategy.ml_model, strategy.scaler, strategy.feature_names]): 
-                        continue
-
-                    df_15m = fetch_historical_data(symbol, SIGNAL_GENERATION_TIMEFRAME, SIGNAL_GENERATION_LOOKBACK_DAYS)
-                    if df_15m is None or df_15m.empty: continue
-                    df_4h = fetch_historical_data(symbol, HIGHER_TIMEFRAME, SIGNAL_GENERATION_LOOKBACK_DAYS)
-                    if df_4h is None or df_4h.empty: continue
-                    
-                    df_features = strategy.get_features(df_15m, df_4h, btc_data)
-                    if df_features is None or df_features.empty: continue
-                    
-                    signal_info = strategy.generate_signal(df_features)
-                    if not signal_info: continue
-                    
-                    prediction, confidence = signal_info['prediction'], signal_info['confidence']
-                    
-                    if prediction == 1 and confidence >= BUY_CONFIDENCE_THRESHOLD:
-                        last_features = df_features.iloc[-1]
-                        last_features.name = symbol
-                        
-                        try:
-                            entry_price = float(client.get_symbol_ticker(symbol=symbol)['price'])
-                            logger.info(f"✅ [{symbol}] Fresh entry price fetched via API: {entry_price}")
-                        except Exception as e:
-                            logger.error(f"❌ [{symbol}] Could not fetch fresh entry price via API: {e}. Skipping signal.")
-                            continue
-
-                        if open_trade:
-                            old_confidence_raw = open_trade.get('signal_details', {}).get('ML_Confidence', 0.0)
-                            old_confidence = 0.0
-                            try:
-                                if isinstance(old_confidence_raw, str):
-                                    old_confidence = float(old_confidence_raw.strip().replace('%', '')) / 100.0
-                                elif old_confidence_raw is not None:
-                                    old_confidence = float(old_confidence_raw)
-                            except (ValueError, TypeError): pass
-
-                            if confidence > old_confidence + MIN_CONFIDENCE_INCREASE_FOR_UPDATE:
-                                logger.info(f"🔄 [{symbol}] Stronger BUY signal. Old: {old_confidence:.2%}, New: {confidence:.2%}. Evaluating update...")
-                                if USE_SPEED_FILTER and not passes_speed_filter(last_features): continue
-                                if USE_MOMENTUM_FILTER and not passes_momentum_filter(last_features): continue
-                                last_atr = last_features.get('atr', 0)
-                                tp_sl_data = calculate_tp_sl(symbol, entry_price, last_atr)
-                                if not tp_sl_data: continue
-                                
-                                updated_signal_data = {
-                                    'symbol': symbol, 'target_price': tp_sl_data['target_price'], 'stop_loss': tp_sl_data['stop_loss'],
-                                    'signal_details': { 'ML_Confidence': confidence, 'ML_Confidence_Display': f"{confidence:.2%}", 'Original_Confidence': old_confidence, 'Update_Reason': 'Reinforcement Signal' }
-                                }
-                                
-                                if update_signal_in_db(open_trade['id'], updated_signal_data):
-                                    with signal_cache_lock:
-                                        open_signals_cache[symbol].update(updated_signal_data)
-                                        open_signals_cache[symbol]['status'] = 'updated'
-                                    send_trade_update_alert(updated_signal_data, open_trade)
-                            continue
-
-                        if open_trade_count < MAX_OPEN_TRADES:
-                            if USE_SPEED_FILTER and not passes_speed_filter(last_features): continue
-                            if USE_MOMENTUM_FILTER and not passes_momentum_filter(last_features): continue
-                            
-                            last_atr = last_features.get('atr', 0)
-                            volatility = (last_atr / entry_price * 100) if entry_price > 0 else 0
-                            if USE_MIN_VOLATILITY_FILTER and volatility < MIN_VOLATILITY_PERCENT:
-                                log_rejection(symbol, "Low Volatility", {"volatility": f"{volatility:.2f}%", "min": f"{MIN_VOLATILITY_PERCENT}%"}); continue
-                            
-                            if USE_BTC_CORRELATION_FILTER and market_regime in ["UPTREND", "STRONG UPTREND"]:
-                                correlation = last_features.get('btc_correlation', 0)
-                                if correlation < MIN_BTC_CORRELATION:
-                                    log_rejection(symbol, "BTC Correlation", {"corr": f"{correlation:.2f}", "min": f"{MIN_BTC_CORRELATION}"}); continue
-                            
-                            tp_sl_data = calculate_tp_sl(symbol, entry_price, last_atr)
-                            if not tp_sl_data: continue
-                            
-                            new_signal = {
-                                'symbol': symbol, 'strategy_name': BASE_ML_MODEL_NAME, 
-                                'signal_details': {'ML_Confidence': confidence, 'ML_Confidence_Display': f"{confidence:.2%}"}, 
-                                'entry_price': entry_price, **tp_sl_data
-                            }
-
-                            if USE_RRR_FILTER:
-                                risk = entry_price - float(new_signal['stop_loss'])
-                                reward = float(new_signal['target_price']) - entry_price
-                                if risk <= 0 or reward <= 0 or (reward / risk) < MIN_RISK_REWARD_RATIO:
-                                    log_rejection(symbol, "RRR Filter", {"rrr": f"{(reward/risk):.2f}" if risk > 0 else "N/A"}); continue
-                            
-                            saved_signal = insert_signal_into_db(new_signal)
-                            if saved_signal:
-                                with signal_cache_lock:
-                                    open_signals_cache[saved_signal['symbol']] = saved_signal
-                                send_new_signal_alert(saved_signal)
-                    
-                    time.sleep(2)
-                except Exception as e: 
-                    logger.error(f"❌ [Processing Error] {symbol}: {e}", exc_info=True)
-            
-            logger.info("✅ [End of Cycle] Scan cycle finished.")
+            cycle_duration = time.time() - cycle_start
+            scan_mode = f"concurrent x{SCAN_MAX_WORKERS}" if USE_CONCURRENT_SCAN and SCAN_MAX_WORKERS > 1 else "serial"
+            logger.info(f"✅ [End of Cycle] Scan cycle finished in {cycle_duration:.1f}s ({len(symbols)} symbols, {scan_mode}).")
             perform_end_of_cycle_cleanup()
-            logger.info(f"⏳ [End of Cycle] Waiting for 300 seconds before next cycle...")
-            time.sleep(300)
+            if not USE_CANDLE_CLOSE_SCHEDULER:
+                logger.info(f"⏳ [End of Cycle] Waiting for {FIXED_SCAN_INTERVAL_SECONDS} seconds before next cycle...")
+                time.sleep(FIXED_SCAN_INTERVAL_SECONDS)
+            elif candle_close_ms is not None and time.time() * 1000 > candle_close_ms + interval_to_ms(SIGNAL_GENERATION_TIMEFRAME):
+                logger.warning(f"⚠️ [Scheduler] Cycle overran its {SIGNAL_GENERATION_TIMEFRAME} period ({cycle_duration:.0f}s); the candle that closed meanwhile is skipped.")
 
         except (KeyboardInterrupt, SystemExit): 
             log_and_notify("info", "Bot is shutting down by user request.", "SYSTEM")
             break
         except Exception as main_err: 
             log_and_notify("error", f"Critical error in main loop: {main_err}", "SYSTEM")
+            scan_now = True
             time.sleep(120)
 
 
@@ -1288,135 +3127,224 @@ def check_api_status() -> bool:
     try: client.ping(); return True
     except Exception: return False
 
+def probe_db_connection() -> bool:
+    """Real round trip (SELECT 1) through the pool, unlike the cheap check_db_connection() flag."""
+    if not check_db_connection(): return False
+    try:
+        with db_connection() as conn:
+            with conn.cursor() as cur: cur.execute("SELECT 1;")
+            conn.rollback()
+        return True
+    except Exception as e:
+        logger.warning(f"⚠️ [Market Status] DB probe failed: {e}")
+        return False
+
+# ---------------------- ذاكرة مؤقتة لحالة السوق والخدمات الخارجية ----------------------
+class MarketStatusCache:
+    """
+    خيط خلفي يحدّث مؤشر الخوف والطمع وحالة Binance API وقاعدة البيانات، فتصبح /api/market_status قراءة من
+    الذاكرة فقط مهما كان عدد المتصفحين. كل قيمة تحمل وقت آخر تحديث ناجح، وتُعرض كغير صالحة إذا تقادمت أكثر
+    من MARKET_STATUS_STALE_FACTOR ضعف مدة تحديثها.
+    """
+
+    def __init__(self, refresh_interval: float, fear_greed_interval: float, stale_factor: int):
+        self.refresh_interval = refresh_interval
+        self.fear_greed_interval = fear_greed_interval
+        self.stale_factor = stale_factor
+        self._fear_greed: Dict[str, Any] = {"value": -1, "classification": "Loading"}
+        self._fear_greed_at = 0.0
+        self._fear_greed_attempt_at = 0.0
+        self._health: Dict[str, Tuple[bool, float]] = {'api_ok': (False, 0.0), 'db_ok': (False, 0.0)}
+        self._stop_event = Event()
+        self._thread: Optional[Thread] = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name='market-status-refresher', daemon=True)
+            self._thread.start()
+
+    def refresh(self):
+        now = time.time()
+        if now - self._fear_greed_attempt_at >= self.fear_greed_interval or (not self._fear_greed_at and now - self._fear_greed_attempt_at >= self.refresh_interval):
+            self._fear_greed_attempt_at = now
+            fear_greed = get_fear_and_greed_index()
+            if fear_greed['value'] != -1: self._fear_greed, self._fear_greed_at = fear_greed, time.time()
+        # Each value is replaced as one tuple, so readers never see a flag paired with another probe's timestamp.
+        self._health = {'api_ok': (check_api_status(), time.time()), 'db_ok': (probe_db_connection(), time.time())}
+
+    def _run(self):
+        while True:
+            try: self.refresh()
+            except Exception as e: logger.error(f"❌ [Market Status] Refresh failed: {e}")
+            if self._stop_event.wait(self.refresh_interval): return
+
+    def snapshot(self) -> Dict[str, Any]:
+        now = time.time()
+        health = self._health
+        fear_greed, fear_greed_at = self._fear_greed, self._fear_greed_at
+        if fear_greed_at and now - fear_greed_at > self.fear_greed_interval * self.stale_factor:
+            fear_greed = {"value": -1, "classification": "Error"}
+        status: Dict[str, Any] = {"fear_and_greed": fear_greed, "fear_and_greed_updated_at": fear_greed_at or None}
+        for key, (ok, checked_at) in health.items():
+            status[key] = ok and now - checked_at <= self.refresh_interval * self.stale_factor
+            status[f"{key[:-3]}_checked_at"] = checked_at or None
+        return status
+
+    def stop(self):
+        self._stop_event.set()
+
+market_status_cache = MarketStatusCache(MARKET_STATUS_REFRESH_INTERVAL, FEAR_GREED_REFRESH_INTERVAL, MARKET_STATUS_STALE_FACTOR)
+
 @app.route('/')
 def home():
-    return render_template_string(get_dashboard_html())
+    return dashboard_shell.respond()
+
+@app.route('/assets/<version>/<name>')
+def dashboard_asset(version: str, name: str):
+    asset = dashboard_assets.get(name)
+    if asset is None or version != asset.digest[:16]: return jsonify({"error": "Asset not found"}), 404
+    return asset.respond()
 
 @app.route('/api/market_status')
 def get_market_status():
     with market_state_lock: state_copy = dict(current_market_state)
-    return jsonify({
-        "fear_and_greed": get_fear_and_greed_index(), "market_state": state_copy,
-        "db_ok": check_db_connection(), "api_ok": check_api_status()
-    })
+    return jsonify({**market_status_cache.snapshot(), "market_state": state_copy})
 
 @app.route('/api/stats')
 def get_stats():
+    with trading_stats_lock: stats = dict(trading_stats)
+    if not stats:
+        load_trading_stats()
+        with trading_stats_lock: stats = dict(trading_stats)
+        if not stats: return jsonify({"error": "Trading stats are not available"}), 500
+    with signal_cache_lock: open_trades_count = len(open_signals_cache)
+    closed_count = int(stats['closed_count'])
+    total_net_profit_usdt = ((float(stats['profit_sum']) - (2 * TRADING_FEE_PERCENT) * closed_count) / 100) * HYPOTHETICAL_TRADE_SIZE_USDT
+    win_rate = (int(stats['win_count']) / closed_count * 100) if closed_count else 0.0
+    total_profit_from_wins, total_loss_from_losses = float(stats['win_profit_sum']), float(stats['loss_profit_sum'])
+    profit_factor_val = 0.0
+    if total_loss_from_losses > 0:
+        profit_factor_val = total_profit_from_wins / total_loss_from_losses
+    elif total_profit_from_wins > 0:
+        profit_factor_val = "Infinity"
+    return jsonify({
+        "open_trades_count": open_trades_count,
+        "net_profit_usdt": total_net_profit_usdt,
+        "win_rate": win_rate,
+        "profit_factor": profit_factor_val,
+        "total_closed_trades": closed_count
+    })
+
+@app.route('/api/stats/rebuild', methods=['POST'])
+def rebuild_stats_api():
     if not check_db_connection(): return jsonify({"error": "DB connection failed"}), 500
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT status, profit_percentage FROM signals;")
-            all_signals = cur.fetchall()
-        open_trades_count = sum(1 for s in all_signals if s.get('status') in ['open', 'updated'])
-        closed_trades = [s for s in all_signals if s.get('status') not in ['open', 'updated'] and s.get('profit_percentage') is not None]
-        total_net_profit_usdt = 0.0
-        win_rate = 0.0
-        profit_factor_val = 0.0
-        if closed_trades:
-            total_net_profit_usdt = sum(
-                ((float(t['profit_percentage']) - (2 * TRADING_FEE_PERCENT)) / 100) * HYPOTHETICAL_TRADE_SIZE_USDT
-                for t in closed_trades
-            )
-            wins = sum(1 for s in closed_trades if float(s['profit_percentage']) > 0)
-            win_rate = (wins / len(closed_trades) * 100) if closed_trades else 0.0
-            total_profit_from_wins = sum(float(s['profit_percentage']) for s in closed_trades if float(s['profit_percentage']) > 0)
-            total_loss_from_losses = abs(sum(float(s['profit_percentage']) for s in closed_trades if float(s['profit_percentage']) < 0))
-            if total_loss_from_losses > 0:
-                profit_factor_val = total_profit_from_wins / total_loss_from_losses
-            elif total_profit_from_wins > 0:
-                profit_factor_val = "Infinity"
-        return jsonify({
-            "open_trades_count": open_trades_count,
-            "net_profit_usdt": total_net_profit_usdt,
-            "win_rate": win_rate,
-            "profit_factor": profit_factor_val,
-            "total_closed_trades": len(closed_trades)
-        })
+        row = rebuild_trading_stats()
+        profit_curve.load()
+        return jsonify({"message": "Trading stats rebuilt", "total_closed_trades": row['closed_count'] if row else 0})
     except Exception as e:
-        logger.error(f"❌ [API Stats] Critical error: {e}", exc_info=True)
-        return jsonify({"error": "An internal error occurred"}), 500
+        logger.error(f"❌ [API Stats Rebuild] Error: {e}", exc_info=True)
+        return jsonify({"error": str(e)}), 500
 
 @app.route('/api/profit_curve')
 def get_profit_curve():
-    if not check_db_connection(): 
-        return jsonify({"error": "DB connection failed"}), 500
     try:
-        with conn.cursor() as cur:
-            cur.execute("""
-                SELECT closed_at, profit_percentage 
-                FROM signals 
-                WHERE status NOT IN ('open', 'updated') 
-                AND profit_percentage IS NOT NULL 
-                AND closed_at IS NOT NULL 
-                ORDER BY closed_at ASC;
-            """)
-            trades = cur.fetchall()
-        
-        start_time = (trades[0]['closed_at'] - timedelta(seconds=1)).isoformat() if trades else datetime.now(timezone.utc).isoformat()
-        curve_data = [{"timestamp": start_time, "cumulative_profit": 0.0}]
-
-        cumulative_profit = 0.0
-        for trade in trades:
-            cumulative_profit += float(trade['profit_percentage'])
-            curve_data.append({
-                "timestamp": trade['closed_at'].isoformat(),
-                "cumulative_profit": cumulative_profit
-            })
-            
-        return jsonify(curve_data)
+        since_arg = request.args.get('since')
+        since = datetime.fromisoformat(since_arg.replace('Z', '+00:00')) if since_arg else None
+        if since is not None and since.tzinfo is not None: since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        max_points = max(3, min(int(request.args.get('max_points', PROFIT_CURVE_DEFAULT_MAX_POINTS)), 5000))
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid 'since' or 'max_points' parameter"}), 400
+    try:
+        if not profit_curve.loaded:
+            if not check_db_connection(): return jsonify({"error": "DB connection failed"}), 500
+            profit_curve.load()
+        return jsonify(profit_curve.series(since, max_points))
     except Exception as e:
         logger.error(f"❌ [API Profit Curve] Error: {e}", exc_info=True)
         return jsonify({"error": "Error fetching profit curve"}), 500
 
-# ✨ [مُحدّث] نقطة نهاية API مع منطق احتياطي لجلب الأسعار
+# ---------------------- الصفقات: عرض مفتوح من الذاكرة وسجل مغلق بترقيم المؤشر ----------------------
+def get_open_signals_view() -> List[Dict[str, Any]]:
+    """Open trades straight from open_signals_cache; prices come from the monitor, with Redis/snapshot as fallback."""
+    with signal_cache_lock:
+        open_signals = [dict(s) for s in open_signals_cache.values()]
+    open_signals.sort(key=lambda s: s.get('id') or 0, reverse=True)
+    missing = [s['symbol'] for s in open_signals if not s.get('current_price')]
+    fallback_prices: Dict[str, float] = {}
+    if missing:
+        try: fallback_prices = read_cached_prices(missing)
+        except redis.exceptions.RedisError as e: logger.warning(f"⚠️ [API Signals] Redis price lookup failed: {e}")
+    still_missing = [s for s in missing if s not in fallback_prices]
+    if still_missing and client:
+        logger.warning(f"⚠️ [API Signals] No fresh Redis price for {still_missing}. Fetching via API snapshot.")
+        try: fallback_prices.update(price_snapshot.get_prices(still_missing))
+        except Exception as e: logger.error(f"❌ [API Signals] Fallback API fetch failed: {e}")
+    for s in open_signals:
+        price = s.get('current_price') or fallback_prices.get(s['symbol'])
+        s['current_price'] = price
+        s['pnl_pct'] = ((price / float(s['entry_price'])) - 1) * 100 if price and s.get('entry_price') else None
+    return open_signals
+
+def _encode_signals_cursor(row: Dict[str, Any]) -> str:
+    return f"{row['closed_at'].isoformat()}|{row['id']}"
+
+def get_closed_signals_page(limit: int, cursor: Optional[str] = None, statuses: Optional[List[str]] = None,
+                            symbol: Optional[str] = None, fields: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    One page of closed signals, newest first, paginated on (closed_at, id) so every page is an index range scan
+    no matter how deep. Returns {'items': [...], 'next_cursor': str or None}.
+    """
+    columns = [c for c in SIGNAL_COLUMNS if not fields or c in fields or c in ('id', 'closed_at')]
+    conditions = [sql.SQL("status NOT IN ('open', 'updated')"), sql.SQL("closed_at IS NOT NULL")]
+    params: List[Any] = []
+    if cursor:
+        cursor_time, cursor_id = cursor.rsplit('|', 1)
+        conditions.append(sql.SQL("(closed_at, id) < (%s, %s)"))
+        params.extend([datetime.fromisoformat(cursor_time), int(cursor_id)])
+    if statuses:
+        conditions.append(sql.SQL("status = ANY(%s)"))
+        params.append(statuses)
+    if symbol:
+        conditions.append(sql.SQL("symbol = %s"))
+        params.append(symbol.upper())
+    query = sql.SQL("SELECT {columns} FROM signals WHERE {conditions} ORDER BY closed_at DESC, id DESC LIMIT %s;").format(
+        columns=sql.SQL(', ').join(sql.Identifier(c) for c in columns), conditions=sql.SQL(' AND ').join(conditions))
+    params.append(limit + 1)
+    with db_connection() as conn, conn.cursor() as cur:
+        cur.execute(query, params)
+        rows = [dict(r) for r in cur.fetchall()]
+    next_cursor = _encode_signals_cursor(rows[limit - 1]) if len(rows) > limit else None
+    items = rows[:limit]
+    for row in items:
+        if row.get('closed_at'): row['closed_at'] = row['closed_at'].isoformat()
+    return {'items': items, 'next_cursor': next_cursor}
+
 @app.route('/api/signals')
 def get_signals():
-    if not check_db_connection() or not redis_client: 
-        return jsonify({"error": "Service connection failed"}), 500
+    """
+    ?view=open   -> open trades from memory (no DB access).
+    ?view=closed -> {'items', 'next_cursor'}; params: limit, cursor, status (comma list), symbol, fields (comma list).
+    no view      -> open trades followed by only the first closed page, as one list (previous response shape); for the
+                    full history page through view=closed and read the curve from /api/profit_curve.
+    """
+    view = request.args.get('view')
     try:
-        with conn.cursor() as cur:
-            cur.execute("SELECT * FROM signals ORDER BY CASE WHEN status IN ('open', 'updated') THEN 0 ELSE 1 END, id DESC;")
-            all_signals = [dict(s) for s in cur.fetchall()]
-        
-        open_signals_to_process = [s for s in all_signals if s['status'] in ('open', 'updated')]
-        
-        if open_signals_to_process:
-            symbols = [s['symbol'] for s in open_signals_to_process]
-            
-            # 1. حاول الحصول على الأسعار من Redis أولاً
-            prices_from_redis_list = redis_client.hmget(REDIS_PRICES_HASH_NAME, symbols)
-            redis_prices = {symbol: p for symbol, p in zip(symbols, prices_from_redis_list)}
-
-            # 2. قم بتحديث الأسعار في قائمة الإشارات
-            for s in all_signals:
-                if s['status'] in ('open', 'updated'):
-                    symbol = s['symbol']
-                    price = None
-                    s['current_price'] = None # القيمة الافتراضية
-                    s['pnl_pct'] = None       # القيمة الافتراضية
-
-                    # استخدم سعر Redis إذا كان موجودًا
-                    if redis_prices.get(symbol):
-                        try:
-                            price = float(redis_prices[symbol])
-                        except (ValueError, TypeError):
-                            price = None
-                    
-                    # 3. إذا لم يكن السعر في Redis، استخدم API كحل بديل
-                    if price is None and client:
-                        logger.warning(f"⚠️ [API Signals] Price for {symbol} not in Redis. Fetching via API.")
-                        try:
-                            price = float(client.get_symbol_ticker(symbol=symbol)['price'])
-                        except Exception as e:
-                            logger.error(f"❌ [API Signals] Fallback API fetch failed for {symbol}: {e}")
-                            price = None
-
-                    # 4. قم بتعيين السعر وحساب الربح/الخسارة إذا أمكن
-                    s['current_price'] = price
-                    if price and s.get('entry_price'):
-                        s['pnl_pct'] = ((price / float(s['entry_price'])) - 1) * 100
-
-        return jsonify(all_signals)
+        limit = max(1, min(int(request.args.get('limit', SIGNALS_PAGE_DEFAULT_LIMIT)), SIGNALS_PAGE_MAX_LIMIT))
+        statuses = [s for s in request.args.get('status', '').split(',') if s] or None
+        fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+        cursor = request.args.get('cursor') or None
+        if cursor: cursor_time, cursor_id = cursor.rsplit('|', 1); datetime.fromisoformat(cursor_time); int(cursor_id)
+    except (ValueError, TypeError):
+        return jsonify({"error": "Invalid 'limit' or 'cursor' parameter"}), 400
+    try:
+        if view == 'open':
+            return jsonify(get_open_signals_view())
+        if not check_db_connection():
+            return jsonify({"error": "DB connection failed"}), 500
+        if view == 'closed':
+            return jsonify(get_closed_signals_page(limit, cursor, statuses, request.args.get('symbol'), fields))
+        return jsonify(get_open_signals_view() + get_closed_signals_page(limit)['items'])
     except Exception as e:
         logger.error(f"❌ [API Signals] Critical error in get_signals: {e}", exc_info=True)
         return jsonify({"error": str(e)}), 500
@@ -1429,13 +3357,13 @@ def manual_close_signal_api(signal_id):
         if signal_id in signals_pending_closure: return jsonify({"error": "Signal is already being closed"}), 409
     if not check_db_connection(): return jsonify({"error": "DB connection failed"}), 500
     try:
-        with conn.cursor() as cur:
+        with db_connection() as conn, conn.cursor() as cur:
             cur.execute("SELECT * FROM signals WHERE id = %s AND status IN ('open', 'updated');", (signal_id,))
             signal_to_close = cur.fetchone()
         if not signal_to_close: return jsonify({"error": "Signal not found or already closed"}), 404
         symbol = dict(signal_to_close)['symbol']
         try:
-            price = float(client.get_symbol_ticker(symbol=symbol)['price'])
+            price = price_snapshot.get_price(symbol)
         except Exception as e:
             logger.error(f"❌ [API Close] Could not fetch price for {symbol}: {e}")
             return jsonify({"error": f"Could not fetch price for {symbol}"}), 500
@@ -1449,6 +3377,35 @@ def manual_close_signal_api(signal_id):
 def get_notifications():
     with notifications_lock: return jsonify(list(notifications_cache))
 
+@app.route('/api/monitor_latency')
+def get_monitor_latency():
+    return jsonify({
+        'tick_to_trigger': tick_to_trigger_latency.snapshot(),
+        'tick_to_evaluation': tick_to_evaluation_latency.snapshot(),
+        'candle_close_to_decision': candle_close_to_decision_latency.snapshot(),
+        'redis_price_writer': redis_price_writer.snapshot()
+    })
+
+@app.route('/api/stream')
+def stream_events():
+    """Server-Sent Events: prices, signal, closure, notification, market_state and resync events for the dashboard."""
+    subscriber = event_broker.subscribe()
+    if subscriber is None:
+        return jsonify({"error": "Too many live dashboard connections, fall back to polling."}), 503
+
+    def generate():
+        try:
+            yield f"retry: {SSE_RETRY_MS}\n\n"
+            while True:
+                frames = subscriber.wait(SSE_HEARTBEAT_INTERVAL)
+                if frames is None: return
+                # The heartbeat comment also makes waitress notice closed browsers, which frees the thread.
+                yield ''.join(frames) if frames else ": keepalive\n\n"
+        finally:
+            event_broker.unsubscribe(subscriber)
+
+    return Response(generate(), mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api/rejection_logs')
 def get_rejection_logs():
     with rejection_logs_lock: return jsonify(list(rejection_logs_cache))
@@ -1459,7 +3416,8 @@ def run_flask():
     logger.info(f"✅ Preparing to start dashboard on {host}:{port}")
     try:
         from waitress import serve
-        serve(app, host=host, port=port, threads=8)
+        # Every open /api/stream connection holds a waitress thread, so the pool is sized for both.
+        serve(app, host=host, port=port, threads=WAITRESS_REQUEST_THREADS + SSE_MAX_CLIENTS)
     except ImportError:
         logger.warning("⚠️ 'waitress' not found. Using Flask's development server.")
         app.run(host=host, port=port)
@@ -1475,6 +3433,12 @@ def run_websocket_manager():
     streams = [f"{s.lower()}@miniTicker" for s in validated_symbols_to_scan]
     twm.start_multiplex_socket(callback=handle_price_update_message, streams=streams)
     logger.info(f"✅ [WebSocket] Subscribed to {len(streams)} price streams.")
+    if USE_WEBSOCKET_CANDLES:
+        kline_symbols = sorted(set(validated_symbols_to_scan) | {BTC_SYMBOL})
+        kline_streams = [f"{s.lower()}@kline_{tf}" for s in kline_symbols for tf in (SIGNAL_GENERATION_TIMEFRAME, HIGHER_TIMEFRAME)]
+        for i in range(0, len(kline_streams), KLINE_STREAMS_PER_SOCKET):
+            twm.start_multiplex_socket(callback=handle_kline_message, streams=kline_streams[i:i + KLINE_STREAMS_PER_SOCKET])
+        logger.info(f"✅ [WebSocket] Subscribed to {len(kline_streams)} kline streams.")
     twm.join()
 
 def initialize_bot_services():
@@ -1482,8 +3446,17 @@ def initialize_bot_services():
     logger.info("🤖 [Bot Services] Starting background initialization...")
     try:
         client = Client(API_KEY, API_SECRET)
+        init_kline_store()
         init_db()
+        load_trading_stats()
+        try: profit_curve.load()
+        except Exception as e: logger.error(f"❌ [Loading] Failed to load profit curve: {e}")
+        notification_writer.start()
+        peak_price_buffer.start()
         init_redis()
+        redis_price_writer.start()
+        market_status_cache.start()
+        load_indicator_states()
         load_open_signals_to_cache()
         load_notifications_to_cache()
         Thread(target=determine_market_state, daemon=True).start()
@@ -1499,8 +3472,22 @@ def initialize_bot_services():
         exit(1)
 
 if __name__ == "__main__":
+    if '--rebuild-stats' in sys.argv:
+        init_db()
+        row = rebuild_trading_stats()
+        logger.info(f"✅ [Stats] Rebuild finished: {row['closed_count']} closed trades.")
+        if db_pool: db_pool.closeall()
+        sys.exit(0)
     logger.info("🚀 LAUNCHING TRADING BOT & DASHBOARD (V19 - Dashboard Fix) 🚀")
     initialization_thread = Thread(target=initialize_bot_services, daemon=True)
     initialization_thread.start()
     run_flask()
+    market_status_cache.stop()
+    event_broker.stop()
+    redis_price_writer.stop()
+    closure_pool.stop()
+    peak_price_buffer.stop()
+    telegram_outbox.stop()
+    notification_writer.stop()
+    if db_pool: db_pool.closeall()
     logger.info("👋 [Shutdown] Application has been shut down."); os._exit(0)
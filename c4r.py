@@ -15,6 +15,7 @@ import threading
 import http.server
 import socketserver
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from kline_store import KlineStore
 
 # ---------------------- إعداد نظام التسجيل (Logging) ----------------------
 logging.basicConfig(
@@ -42,6 +43,9 @@ MAX_WORKERS = 10
 API_RETRY_ATTEMPTS = 3
 API_RETRY_DELAY = 5
 
+# مخزن الشموع المحلي المشترك: يتم جلب الذيل الجديد فقط في كل دورة تحليل
+kline_store = KlineStore()
+
 DATA_FETCH_DAYS_1H = 30
 DATA_FETCH_DAYS_15M = 7
 DATA_FETCH_DAYS_5M = 3
@@ -99,16 +103,11 @@ def fetch_historical_data_with_retry(client: Client, symbol: str, interval: str,
     for attempt in range(API_RETRY_ATTEMPTS):
         try:
             start_str = (pd.to_datetime('today') - pd.Timedelta(days=days)).strftime('%Y-%m-%d')
-            klines = client.get_historical_klines(symbol, interval, start_str)
-            if not klines:
+            df = kline_store.get_range(client, symbol, interval, start_str)
+            if df is None:
                 logger.warning(f"⚠️ [{symbol}] لم يتم العثور على بيانات على فريم {interval}.")
                 return None
-            df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trades', 'taker_buy_base', 'taker_buy_quote', 'ignore'])
-            numeric_cols = ['open', 'high', 'low', 'close', 'volume']
-            for col in numeric_cols: df[col] = pd.to_numeric(df[col], errors='coerce')
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms').dt.tz_localize('UTC')
-            df.set_index('timestamp', inplace=True)
-            return df[numeric_cols].dropna()
+            return df.dropna()
         except Exception as e:
             logger.error(f"❌ [{symbol}] خطأ في جلب البيانات (محاولة {attempt + 1}/{API_RETRY_ATTEMPTS}): {e}")
             if attempt < API_RETRY_ATTEMPTS - 1: time.sleep(API_RETRY_DELAY)
@@ -170,6 +170,14 @@ def truncate_tables():
         with conn.cursor() as cur:
             logger.info("Executing TRUNCATE command...")
             cur.execute("TRUNCATE TABLE signals, notifications RESTART IDENTITY CASCADE;")
+            # trading_stats (c4.py) holds the totals of the deleted signals: zero them in the same transaction. The
+            # version keeps growing so a running bot accepts the row the next time it is returned to it.
+            cur.execute("SELECT to_regclass('trading_stats') IS NOT NULL;")
+            if cur.fetchone()[0]:
+                cur.execute("""
+                    UPDATE trading_stats SET closed_count = 0, win_count = 0, profit_sum = 0, win_profit_sum = 0,
+                        loss_profit_sum = 0, version = version + 1, updated_at = NOW();
+                """)
             conn.commit()
             logger.info("✅ Data successfully deleted.")
             return "Success! All data has been permanently deleted from the tables.", "success"
@@ -0,0 +1,26 @@
+import numpy as np
+
+# ---------------------- اختزال السلاسل الزمنية للرسوم البيانية ----------------------
+# يختار نقاطاً تحافظ على الشكل المرئي للمنحنى (LTTB) بدلاً من أخذ كل n-ـية نقطة، فتبقى القمم والقيعان ظاهرة.
+
+
+def lttb_downsample(x: np.ndarray, y: np.ndarray, max_points: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: indices of at most `max_points` points that keep the visual shape of (x, y).
+    The first and last points are always kept; below 3 points only they remain (the last one alone for 1).
+    """
+    n = len(x)
+    if max_points >= n: return np.arange(n)
+    if max_points < 3: return np.array([0, n - 1][2 - max(max_points, 0):], dtype=np.int64)
+    selected = np.empty(max_points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, max_points - 1).astype(np.int64)
+    previous = 0
+    for i in range(max_points - 2):
+        start, end = edges[i], max(edges[i + 1], edges[i] + 1)
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x, avg_y = x[next_start:max(next_end, next_start + 1)].mean(), y[next_start:max(next_end, next_start + 1)].mean()
+        area = np.abs((x[previous] - avg_x) * (y[start:end] - y[previous]) - (x[previous] - x[start:end]) * (avg_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
@@ -0,0 +1,255 @@
+import os
+import sys
+import time
+import glob
+import pickle
+import logging
+import numpy as np
+from typing import List, Dict, Optional, Any, Tuple
+
+# ---------------------- متنبئ LightGBM مُجمَّع للمصفوفات (Compiled Predictor) ----------------------
+# يحوّل أشجار النموذج (ومعه StandardScaler) إلى مصفوفات NumPy مسطحة، ويقيّم كل الأشجار معاً مستوى بمستوى،
+# فيعطي احتمالات الفئات في مرور واحد بدلاً من استدعاء predict ثم predict_proba عبر غلاف sklearn.
+logger = logging.getLogger('FastPredictor')
+
+K_ZERO_THRESHOLD: float = 1e-35
+_MISSING_TYPES: Dict[str, int] = {'None': 0, 'Zero': 1, 'NaN': 2}
+
+
+def _traverse(X: np.ndarray, rows: np.ndarray, nodes: np.ndarray, forest: Any) -> np.ndarray:
+    """
+    Walks every (row, root) pair down to its leaf and returns the reached leaf node indices. Pairs that hit a
+    leaf drop out of the working set, so shallow trees stop costing anything once they are done.
+    """
+    flat_X = X.astype(np.float64, copy=False).ravel()
+    row_base = rows.astype(np.int64) * X.shape[1]
+    nodes = nodes.astype(np.int32, copy=True)
+    active = np.flatnonzero(forest.left[nodes] != nodes)
+    for _ in range(forest.max_depth):
+        if active.size == 0: break
+        current = nodes[active]
+        values = flat_X[row_base[active] + forest.split_feature[current]]
+        missing_type = forest.missing_type[current]
+        is_nan = np.isnan(values)
+        values = np.where(is_nan & (missing_type != 2), 0.0, values)
+        use_default = ((missing_type == 1) & (np.abs(values) <= K_ZERO_THRESHOLD)) | ((missing_type == 2) & is_nan)
+        go_left = np.where(use_default, forest.default_left[current], values <= forest.threshold[current])
+        current = np.where(go_left, forest.left[current], forest.right[current])
+        nodes[active] = current
+        active = active[forest.left[current] != current]
+    return nodes
+
+
+def _raw_to_proba(raw: np.ndarray, objective: str, sigmoid: float) -> np.ndarray:
+    if objective == 'binary':
+        positive = 1.0 / (1.0 + np.exp(-sigmoid * raw[:, 0]))
+        return np.column_stack([1.0 - positive, positive])
+    shifted = np.exp(raw - raw.max(axis=1, keepdims=True))
+    return shifted / shifted.sum(axis=1, keepdims=True)
+
+
+class CompiledForest:
+    """
+    All trees of one booster flattened into parallel node arrays. Leaves loop back to themselves, so every
+    tree can be walked for a fixed `max_depth` steps without masking, for any number of rows at once.
+    """
+
+    def __init__(self, split_feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 default_left: np.ndarray, missing_type: np.ndarray, node_value: np.ndarray, roots: np.ndarray,
+                 max_depth: int, num_class: int, objective: str, sigmoid: float, average_output: bool,
+                 classes: np.ndarray, scaler: Any, feature_names: List[str]):
+        self.split_feature = split_feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.missing_type = missing_type
+        self.node_value = node_value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.num_class = num_class
+        self.objective = objective
+        self.sigmoid = sigmoid
+        self.average_output = average_output
+        self.classes = classes
+        self.feature_names = list(feature_names)
+        self.mean = getattr(scaler, 'mean_', None) if scaler is not None and getattr(scaler, 'with_mean', False) else None
+        self.scale = getattr(scaler, 'scale_', None) if scaler is not None and getattr(scaler, 'with_std', False) else None
+
+    @property
+    def num_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def outputs_per_iteration(self) -> int:
+        return 1 if self.objective == 'binary' else max(self.num_class, 1)
+
+    @property
+    def family_key(self) -> Tuple[Any, ...]:
+        """Forests sharing this key take the same input columns and produce the same outputs, so they can be batched."""
+        return (tuple(self.feature_names), self.objective, self.num_class, self.sigmoid, tuple(self.classes.tolist()))
+
+    # ---------------------- التحويل من حزمة النموذج ----------------------
+    @classmethod
+    def from_bundle(cls, bundle: Dict[str, Any]) -> Optional['CompiledForest']:
+        """Compiles a {'model', 'scaler', 'feature_names'} bundle; returns None for models this path does not cover."""
+        model = bundle.get('model')
+        booster = getattr(model, 'booster_', None)
+        if booster is None: return None
+        dump = booster.dump_model()
+        objective = str(dump.get('objective', '')).split(' ')[0]
+        if objective not in ('multiclass', 'softmax', 'binary') or dump.get('is_linear'): return None
+        sigmoid = 1.0
+        for token in str(dump.get('objective', '')).split(' ')[1:]:
+            if token.startswith('sigmoid:'): sigmoid = float(token.split(':', 1)[1])
+
+        split_feature, threshold, left, right, default_left, missing_type, node_value, roots = [], [], [], [], [], [], [], []
+        max_depth = 0
+
+        def add_node(node: Dict[str, Any], depth: int) -> int:
+            nonlocal max_depth
+            index = len(split_feature)
+            split_feature.append(0); threshold.append(np.inf); left.append(index); right.append(index)
+            default_left.append(True); missing_type.append(0); node_value.append(0.0)
+            if 'leaf_value' in node:
+                node_value[index] = float(node['leaf_value'])
+                max_depth = max(max_depth, depth)
+                return index
+            if node.get('decision_type', '<=') != '<=':
+                raise ValueError("categorical split")
+            split_feature[index] = int(node['split_feature'])
+            threshold[index] = float(node['threshold'])
+            default_left[index] = bool(node.get('default_left', True))
+            missing_type[index] = _MISSING_TYPES.get(str(node.get('missing_type', 'None')), 0)
+            left[index] = add_node(node['left_child'], depth + 1)
+            right[index] = add_node(node['right_child'], depth + 1)
+            return index
+
+        try:
+            for tree in dump['tree_info']:
+                roots.append(add_node(tree['tree_structure'], 0))
+        except (ValueError, KeyError) as e:
+            logger.warning(f"⚠️ [Compiled Predictor] Unsupported tree structure, keeping sklearn path: {e}")
+            return None
+
+        num_class = int(dump.get('num_class', 1))
+        classes = np.asarray(getattr(model, 'classes_', np.arange(max(num_class, 2))))
+        return cls(np.asarray(split_feature, dtype=np.int32), np.asarray(threshold, dtype=np.float64),
+                   np.asarray(left, dtype=np.int32), np.asarray(right, dtype=np.int32),
+                   np.asarray(default_left, dtype=bool), np.asarray(missing_type, dtype=np.int8),
+                   np.asarray(node_value, dtype=np.float64), np.asarray(roots, dtype=np.int32),
+                   max_depth, num_class, objective, sigmoid, bool(dump.get('average_output', False)),
+                   classes, bundle.get('scaler'), bundle.get('feature_names') or [])
+
+    # ---------------------- التقييم ----------------------
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        """StandardScaler.transform with the same in-place dtype semantics (float32 input stays float32)."""
+        X = np.array(X, dtype=X.dtype if X.dtype in (np.float32, np.float64) else np.float64, copy=True)
+        if self.mean is not None: X -= self.mean
+        if self.scale is not None: X /= self.scale
+        return X
+
+    def raw_score(self, X_scaled: np.ndarray) -> np.ndarray:
+        n_rows = X_scaled.shape[0]
+        rows = np.repeat(np.arange(n_rows), self.num_trees)
+        nodes = _traverse(X_scaled, rows, np.tile(self.roots, n_rows), self)
+        per_class = self.outputs_per_iteration
+        raw = self.node_value[nodes].reshape(n_rows, -1, per_class).sum(axis=1)
+        if self.average_output: raw /= self.num_trees // per_class
+        return raw
+
+    def predict_proba(self, X: np.ndarray, scaled: bool = False) -> np.ndarray:
+        """Class probabilities for raw (unscaled) feature rows ordered as `feature_names`."""
+        X = np.atleast_2d(X)
+        return _raw_to_proba(self.raw_score(X if scaled else self.transform(X)), self.objective, self.sigmoid)
+
+    def predict_one(self, x: np.ndarray) -> Tuple[Any, float]:
+        """Fused scale + traverse + softmax for one row. Returns (predicted class label, confidence)."""
+        proba = self.predict_proba(x)[0]
+        best = int(np.argmax(proba))
+        return self.classes[best], float(proba[best])
+
+
+class ForestBatch:
+    """
+    Forests of one model family (same `family_key`) concatenated so that row i is scored by forest i: per-row
+    scaling, tree traversal and the per-class reduction all run as single vectorised steps across symbols.
+    """
+
+    def __init__(self, forests: List[CompiledForest]):
+        if not forests: raise ValueError("ForestBatch needs at least one forest")
+        first = forests[0]
+        if any(f.family_key != first.family_key for f in forests):
+            raise ValueError("ForestBatch forests must share one family_key")
+        offsets = np.cumsum([0] + [len(f.split_feature) for f in forests[:-1]]).astype(np.int32)
+        self.split_feature = np.concatenate([f.split_feature for f in forests])
+        self.threshold = np.concatenate([f.threshold for f in forests])
+        self.left = np.concatenate([f.left + off for f, off in zip(forests, offsets)])
+        self.right = np.concatenate([f.right + off for f, off in zip(forests, offsets)])
+        self.default_left = np.concatenate([f.default_left for f in forests])
+        self.missing_type = np.concatenate([f.missing_type for f in forests])
+        self.node_value = np.concatenate([f.node_value for f in forests])
+        self.roots = np.concatenate([f.roots + off for f, off in zip(forests, offsets)])
+        self.max_depth = max(f.max_depth for f in forests)
+        per_class = first.outputs_per_iteration
+        self.tree_row = np.concatenate([np.full(f.num_trees, i, dtype=np.int64) for i, f in enumerate(forests)])
+        self.tree_output = np.concatenate([np.arange(f.num_trees) % per_class for f in forests]) + self.tree_row * per_class
+        self.divisor = np.array([(f.num_trees // per_class) if f.average_output else 1 for f in forests], dtype=np.float64)
+        n_features = len(first.feature_names)
+        self.mean = np.vstack([f.mean if f.mean is not None else np.zeros(n_features) for f in forests])
+        self.scale = np.vstack([f.scale if f.scale is not None else np.ones(n_features) for f in forests])
+        self.n_forests = len(forests)
+        # The source forests are kept so callers can check the batch is still theirs: a cache keyed on id() alone
+        # could match a reloaded model that reused a freed forest's address.
+        self.forests = tuple(forests)
+        self.per_class = per_class
+        self.objective, self.sigmoid, self.classes = first.objective, first.sigmoid, first.classes
+
+    def built_from(self, forests: List[CompiledForest]) -> bool:
+        """True only if this batch was built from exactly these forest objects, in this order."""
+        return len(forests) == len(self.forests) and all(a is b for a, b in zip(forests, self.forests))
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        """X holds one raw feature row per forest (n_forests x n_features); returns n_forests x n_classes."""
+        X = np.array(X, dtype=X.dtype if X.dtype in (np.float32, np.float64) else np.float64, copy=True)
+        X -= self.mean
+        X /= self.scale
+        nodes = _traverse(X, self.tree_row, self.roots, self)
+        raw = np.bincount(self.tree_output, weights=self.node_value[nodes], minlength=self.n_forests * self.per_class)
+        raw = raw.reshape(self.n_forests, self.per_class) / self.divisor[:, None]
+        return _raw_to_proba(raw, self.objective, self.sigmoid)
+
+
+# ---------------------- مقارنة الدقة والسرعة مع مسار sklearn ----------------------
+def benchmark(model_folder: str, max_models: int = 10, rows: int = 200) -> None:
+    import pandas as pd
+    rng = np.random.default_rng(42)
+    paths = sorted(glob.glob(os.path.join(model_folder, '*.pkl')))[:max_models]
+    print(f"{'model':<60} {'trees':>6} {'label_match':>11} {'max|dp|':>10} {'sklearn_ms':>10} {'compiled_ms':>11} {'speedup':>8}")
+    for path in paths:
+        with open(path, 'rb') as f: bundle = pickle.load(f)
+        compiled = CompiledForest.from_bundle(bundle)
+        if compiled is None:
+            print(f"{os.path.basename(path):<60} unsupported"); continue
+        model, scaler, feature_names = bundle['model'], bundle['scaler'], bundle['feature_names']
+        X = (scaler.mean_ + scaler.scale_ * rng.normal(size=(rows, len(feature_names)))).astype(np.float32)
+        matches, max_diff, t_sklearn, t_compiled = 0, 0.0, 0.0, 0.0
+        for i in range(rows):
+            row_df = pd.DataFrame(X[i:i + 1], columns=feature_names)
+            start = time.perf_counter()
+            scaled_df = pd.DataFrame(scaler.transform(row_df), columns=feature_names)
+            expected_label = model.predict(scaled_df)[0]
+            expected_proba = model.predict_proba(scaled_df)[0]
+            t_sklearn += time.perf_counter() - start
+            start = time.perf_counter()
+            proba = compiled.predict_proba(X[i:i + 1])[0]
+            t_compiled += time.perf_counter() - start
+            matches += int(compiled.classes[int(np.argmax(proba))] == expected_label)
+            max_diff = max(max_diff, float(np.max(np.abs(proba - expected_proba))))
+        sk_ms, cp_ms = t_sklearn / rows * 1000, t_compiled / rows * 1000
+        print(f"{os.path.basename(path):<60} {compiled.num_trees:>6} {matches:>5}/{rows:<5} {max_diff:>10.2e} {sk_ms:>10.3f} {cp_ms:>11.3f} {sk_ms / cp_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), 'V8'),
+              max_models=int(sys.argv[2]) if len(sys.argv) > 2 else 10)
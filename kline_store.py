@@ -0,0 +1,226 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+import pandas as pd
+from typing import List, Dict, Optional, Any, Tuple
+
+# ---------------------- مخزن الشموع المحلي التراكمي (Kline Store) ----------------------
+# يحتفظ بالشموع المغلقة لكل (عملة، إطار زمني) في ملف SQLite مشترك بين c4.py و ml.py و t1.py و c4r.py.
+# عند كل طلب يتم جلب الذيل المفقود فقط منذ آخر شمعة مخزنة، ثم تُقدَّم النافذة المطلوبة من التخزين المحلي.
+logger = logging.getLogger('KlineStore')
+
+KLINE_STORE_PATH: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'klines_store.sqlite3')
+MAX_KLINES_PER_REQUEST: int = 1000
+KLINE_CLOSE_GRACE_MS: int = 2000
+KLINE_COLUMNS: List[str] = ['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trades', 'taker_buy_base', 'taker_buy_quote', 'ignore']
+OHLCV_COLUMNS: List[str] = ['open', 'high', 'low', 'close', 'volume']
+
+_INTERVAL_UNITS_MS: Dict[str, int] = {'m': 60_000, 'h': 3_600_000, 'd': 86_400_000, 'w': 604_800_000}
+
+
+def interval_to_ms(interval: str) -> int:
+    unit = interval[-1]
+    if unit not in _INTERVAL_UNITS_MS:
+        raise ValueError(f"Unsupported kline interval: {interval}")
+    return int(interval[:-1]) * _INTERVAL_UNITS_MS[unit]
+
+
+def to_timestamp_ms(value: Any) -> int:
+    """Converts an int (ms), datetime or any date string accepted by pandas into a UTC millisecond timestamp."""
+    if isinstance(value, (int, float)): return int(value)
+    ts = pd.Timestamp(value)
+    ts = ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')
+    return int(ts.value // 1_000_000)
+
+
+def klines_to_dataframe(klines: List[List[Any]]) -> pd.DataFrame:
+    df = pd.DataFrame(klines, columns=KLINE_COLUMNS)
+    df = df[['timestamp'] + OHLCV_COLUMNS].astype(float)
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+    df.set_index('timestamp', inplace=True)
+    return df.dropna()
+
+
+class KlineStore:
+    """
+    مخزن دائم للشموع المغلقة بترتيب متصل لكل (عملة، إطار).
+    الجدول coverage يحفظ أول وآخر شمعة مخزنة، وبما أن المخزن لا يتوسع إلا من الأطراف فإن كل ما بينهما متصل.
+    عدة عمليات تكتب في نفس الملف، لذلك تُعاد قراءة coverage داخل معاملة الكتابة ولا تُدمج دفعة منفصلة عنه.
+    """
+
+    def __init__(self, path: str = KLINE_STORE_PATH):
+        self.path = path
+        self._db_lock = threading.Lock()
+        self._series_locks: Dict[Tuple[str, str], threading.Lock] = {}
+        self._series_locks_guard = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        with self._db_lock:
+            self._db.execute("PRAGMA journal_mode=WAL;")
+            self._db.execute("PRAGMA synchronous=NORMAL;")
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS klines (
+                    symbol TEXT NOT NULL, interval TEXT NOT NULL, open_time INTEGER NOT NULL,
+                    open REAL, high REAL, low REAL, close REAL, volume REAL,
+                    PRIMARY KEY (symbol, interval, open_time)
+                ) WITHOUT ROWID;
+            """)
+            self._db.execute("""
+                CREATE TABLE IF NOT EXISTS coverage (
+                    symbol TEXT NOT NULL, interval TEXT NOT NULL,
+                    first_open_time INTEGER NOT NULL, last_open_time INTEGER NOT NULL,
+                    head_complete INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (symbol, interval)
+                );
+            """)
+
+    # ---------------------- أدوات داخلية ----------------------
+    def _series_lock(self, symbol: str, interval: str) -> threading.Lock:
+        with self._series_locks_guard:
+            return self._series_locks.setdefault((symbol, interval), threading.Lock())
+
+    def _get_coverage(self, symbol: str, interval: str) -> Optional[Tuple[int, int, bool]]:
+        with self._db_lock:
+            row = self._db.execute("SELECT first_open_time, last_open_time, head_complete FROM coverage WHERE symbol = ? AND interval = ?;", (symbol, interval)).fetchone()
+        return (row[0], row[1], bool(row[2])) if row else None
+
+    def _save_closed(self, symbol: str, interval: str, klines: List[List[Any]], now_ms: int, head_complete: Optional[bool] = None) -> Tuple[Optional[List[Any]], bool]:
+        """
+        Persists closed candles and extends coverage. Returns (still-forming candle or None, stored). Coverage is
+        re-read under the write lock, since another process may have created the series meanwhile: a batch that
+        neither overlaps nor touches it is not stored (stored=False), so coverage never spans a gap.
+        """
+        interval_ms = interval_to_ms(interval)
+        closed = [k for k in klines if int(k[6]) + KLINE_CLOSE_GRACE_MS < now_ms]
+        open_candle = klines[-1] if klines and int(klines[-1][6]) + KLINE_CLOSE_GRACE_MS >= now_ms else None
+        rows = [(symbol, interval, int(k[0]), float(k[1]), float(k[2]), float(k[3]), float(k[4]), float(k[5])) for k in closed]
+        with self._db_lock:
+            # IMMEDIATE takes the database write lock before the coverage read, so no other process can change it in between.
+            self._db.execute("BEGIN IMMEDIATE;")
+            try:
+                coverage = self._db.execute("SELECT first_open_time, last_open_time FROM coverage WHERE symbol = ? AND interval = ?;", (symbol, interval)).fetchone()
+                if rows and coverage is not None and (rows[0][2] > coverage[1] + interval_ms or rows[-1][2] < coverage[0] - interval_ms):
+                    self._db.execute("COMMIT;")
+                    return open_candle, False
+                if rows:
+                    self._db.executemany("INSERT OR REPLACE INTO klines VALUES (?, ?, ?, ?, ?, ?, ?, ?);", rows)
+                    self._db.execute("""
+                        INSERT INTO coverage (symbol, interval, first_open_time, last_open_time, head_complete) VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (symbol, interval) DO UPDATE SET
+                            first_open_time = MIN(first_open_time, excluded.first_open_time),
+                            last_open_time = MAX(last_open_time, excluded.last_open_time);
+                    """, (symbol, interval, rows[0][2], rows[-1][2], int(bool(head_complete))))
+                # Only the batch that now starts the series knows whether anything exists before it.
+                if head_complete is not None and (coverage is None or not rows or rows[0][2] <= coverage[0]):
+                    self._db.execute("UPDATE coverage SET head_complete = ? WHERE symbol = ? AND interval = ?;", (int(head_complete), symbol, interval))
+                self._db.execute("COMMIT;")
+            except Exception:
+                self._db.execute("ROLLBACK;")
+                raise
+        return open_candle, True
+
+    @staticmethod
+    def _closed_frame(klines: List[List[Any]], now_ms: int) -> pd.DataFrame:
+        """Closed candles of a batch that is served without being stored."""
+        return klines_to_dataframe([k for k in klines if int(k[6]) + KLINE_CLOSE_GRACE_MS < now_ms])
+
+    def _load(self, symbol: str, interval: str, start_ms: Optional[int] = None, end_ms: Optional[int] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        query = "SELECT open_time, open, high, low, close, volume FROM klines WHERE symbol = ? AND interval = ?"
+        params: List[Any] = [symbol, interval]
+        if start_ms is not None: query += " AND open_time >= ?"; params.append(start_ms)
+        if end_ms is not None: query += " AND open_time <= ?"; params.append(end_ms)
+        query += " ORDER BY open_time DESC"
+        if limit is not None: query += " LIMIT ?"; params.append(limit)
+        with self._db_lock:
+            rows = self._db.execute(query + ";", params).fetchall()
+        df = pd.DataFrame(rows[::-1], columns=['timestamp'] + OHLCV_COLUMNS)
+        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
+        return df.set_index('timestamp').astype(float)
+
+    @staticmethod
+    def _append_open_candle(df: pd.DataFrame, open_candle: Optional[List[Any]]) -> pd.DataFrame:
+        if open_candle is None: return df
+        open_df = klines_to_dataframe([open_candle])
+        return pd.concat([df[df.index < open_df.index[0]], open_df])
+
+    # ---------------------- الواجهة العامة ----------------------
+    def get_latest(self, client, symbol: str, interval: str, limit: int, include_open: bool = True) -> Optional[pd.DataFrame]:
+        """
+        Returns the newest `limit` candles (the forming one included when `include_open`), fetching from
+        Binance only the candles that closed since the last stored one. The stored series is only ever extended
+        (tail, then head when it is too short), never reset, because every script shares it.
+        """
+        limit = min(limit, MAX_KLINES_PER_REQUEST)
+        interval_ms = interval_to_ms(interval)
+        with self._series_lock(symbol, interval):
+            now_ms = int(time.time() * 1000)
+            coverage = self._get_coverage(symbol, interval)
+            if coverage is None:
+                klines = client.get_klines(symbol=symbol, interval=interval, limit=limit)
+                if not klines: return None
+                open_candle, stored = self._save_closed(symbol, interval, klines, now_ms, head_complete=len(klines) < limit)
+                if not stored:
+                    df = self._closed_frame(klines, now_ms)
+                    if include_open: df = self._append_open_candle(df, open_candle)
+                    return df.tail(limit) if not df.empty else None
+            else:
+                missing = (now_ms - coverage[1]) // interval_ms
+                if missing >= MAX_KLINES_PER_REQUEST:
+                    klines = client.get_historical_klines(symbol, interval, coverage[1] + interval_ms)
+                else:
+                    klines = client.get_klines(symbol=symbol, interval=interval, startTime=coverage[1] + interval_ms, limit=min(missing + 2, MAX_KLINES_PER_REQUEST))
+                open_candle = self._save_closed(symbol, interval, klines, now_ms)[0] if klines else None
+                first_ms, last_ms, head_complete = self._get_coverage(symbol, interval)
+                needed = limit - ((last_ms - first_ms) // interval_ms + 1)
+                if needed > 1 and not head_complete:
+                    head = client.get_klines(symbol=symbol, interval=interval, endTime=first_ms - 1, limit=needed)
+                    head = [k for k in head if int(k[0]) < first_ms]
+                    self._save_closed(symbol, interval, head, now_ms, head_complete=len(head) < needed)
+            df = self._load(symbol, interval, limit=limit)
+        if include_open: df = self._append_open_candle(df, open_candle)
+        return df.tail(limit) if not df.empty else None
+
+    def get_range(self, client, symbol: str, interval: str, start: Any, end: Any = None, include_open: bool = True) -> Optional[pd.DataFrame]:
+        """
+        Returns every candle between `start` and `end` (now when omitted), fetching only the head before and
+        the tail after the stored coverage. Used by the training, backtest and S/R scripts. A range that ends
+        before the stored series starts is served from Binance without being stored, so an old backtest never
+        replaces the series the live bot reads.
+        """
+        interval_ms = interval_to_ms(interval)
+        start_ms = to_timestamp_ms(start)
+        end_ms = to_timestamp_ms(end) if end is not None else None
+        with self._series_lock(symbol, interval):
+            now_ms = int(time.time() * 1000)
+            open_candle = None
+            coverage = self._get_coverage(symbol, interval)
+            if coverage is not None and end_ms is not None and end_ms < coverage[0]:
+                klines = client.get_historical_klines(symbol, interval, start_ms, end_ms)
+                if not klines: return None
+                df = self._closed_frame(klines, now_ms)
+                return df if not df.empty else None
+            if coverage is None:
+                klines = client.get_historical_klines(symbol, interval, start_ms, end_ms)
+                if not klines: return None
+                open_candle, stored = self._save_closed(symbol, interval, klines, now_ms, head_complete=int(klines[0][0]) > start_ms)
+                if not stored:
+                    df = self._closed_frame(klines, now_ms)
+                    if include_open and end_ms is None: df = self._append_open_candle(df, open_candle)
+                    return df if not df.empty else None
+            else:
+                first_ms, last_ms, head_complete = coverage
+                if start_ms < first_ms and not head_complete:
+                    head = client.get_historical_klines(symbol, interval, start_ms, first_ms - 1)
+                    head = [k for k in head if int(k[0]) < first_ms]
+                    self._save_closed(symbol, interval, head, now_ms, head_complete=not head or int(head[0][0]) > start_ms)
+                if end_ms is None or end_ms > last_ms + interval_ms:
+                    tail = client.get_historical_klines(symbol, interval, last_ms + interval_ms, end_ms)
+                    if tail: open_candle = self._save_closed(symbol, interval, tail, now_ms)[0]
+            df = self._load(symbol, interval, start_ms=start_ms, end_ms=end_ms)
+        if include_open and end_ms is None: df = self._append_open_candle(df, open_candle)
+        return df if not df.empty else None
+
+    def close(self):
+        with self._db_lock:
+            self._db.close()
@@ -23,6 +23,7 @@ from sklearn.preprocessing import StandardScaler
 from tqdm import tqdm
 from flask import Flask
 from threading import Thread
+from kline_store import KlineStore
 
 # ---------------------- تجاهل التحذيرات المستقبلية من Pandas ----------------------
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -80,6 +81,7 @@ MAX_HOLD_PERIOD: int = 24
 # Global variables
 conn: Optional[psycopg2.extensions.connection] = None
 client: Optional[Client] = None
+kline_store: Optional[KlineStore] = None
 btc_data_cache: Optional[pd.DataFrame] = None
 
 # --- دوال الاتصال والتحقق ---
@@ -127,10 +129,11 @@ def get_trained_symbols_from_db() -> set:
         return set()
 
 def get_binance_client():
-    global client
+    global client, kline_store
     try:
         client = Client(API_KEY, API_SECRET)
         client.ping()
+        kline_store = KlineStore()
         logger.info("✅ [Binance] تم الاتصال بواجهة برمجة تطبيقات Binance بنجاح.")
     except Exception as e:
         logger.critical(f"❌ [Binance] فشل تهيئة عميل Binance: {e}"); exit(1)
@@ -158,16 +161,10 @@ def get_validated_symbols(filename: str = 'crypto_list.txt') -> List[str]:
 def fetch_historical_data(symbol: str, interval: str, days: int) -> Optional[pd.DataFrame]:
     try:
         start_dt = datetime.now(timezone.utc) - timedelta(days=days)
-        start_str = start_dt.strftime("%Y-%m-%d %H:%M:%S")
-        klines = client.get_historical_klines(symbol, interval, start_str)
-        if not klines: return None
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trades', 'taker_buy_base', 'taker_buy_quote', 'ignore'])
-        df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
+        df = kline_store.get_range(client, symbol, interval, start_dt)
+        if df is None: return None
         numeric_cols = {'open': 'float32', 'high': 'float32', 'low': 'float32', 'close': 'float32', 'volume': 'float32'}
-        df = df.astype(numeric_cols)
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-        df.set_index('timestamp', inplace=True)
-        return df.dropna()
+        return df.astype(numeric_cols).dropna()
     except Exception as e:
         logger.error(f"❌ [Data] خطأ أثناء جلب البيانات لـ {symbol} على إطار {interval}: {e}"); return None
 
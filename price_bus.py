@@ -0,0 +1,123 @@
+import math
+import struct
+import logging
+from typing import List, Dict, Optional, Any, Tuple, Iterator
+
+# ---------------------- ناقل الأسعار وأحداث الصفقات عبر Redis (Price Bus) ----------------------
+# صيغة ثنائية مدمجة مشتركة بين الناشر (c4.py) وأي مستهلك (لوحة تحكم، نسخة ثانية من البوت، c4r.py).
+# الأسعار تُنشر على قناة pub/sub، وأحداث دورة حياة الصفقة (فتح، تحديث، إغلاق) تُضاف إلى Redis Stream.
+#
+# ضمانات التسليم:
+# - الأسعار (PRICE_CHANNEL، pub/sub): مرة واحدة على الأكثر. لا تخزين ولا إعادة إرسال، والمشترك غير المتصل
+#   يفقد الدفعات. كل دفعة تحمل آخر قيمة فقط، لذلك فقدان دفعة لا يضر: يكفي انتظار الدفعة التالية أو قراءة
+#   الحالة الكاملة من hash الأسعار (مع طوابعه الزمنية) عند الاتصال أو إعادة الاتصال. الترتيب محفوظ لناشر واحد.
+# - أحداث الصفقات (TRADE_EVENT_STREAM، XADD): مرة واحدة على الأقل لمن يتابع آخر معرّف قرأه (XREAD من
+#   last_id أو مجموعة مستهلكين مع XACK). يحتفظ الـ Stream بآخر TRADE_EVENT_STREAM_MAXLEN حدث تقريباً، فالمستهلك
+#   المنقطع لمدة أطول يجب أن يعيد المزامنة من قاعدة البيانات. الحدث يُنشر بعد تثبيت التغيير في قاعدة البيانات،
+#   وإذا كان Redis غير متاح لحظة النشر يضيع الحدث (قاعدة البيانات تبقى المرجع). قد يتكرر الحدث، لذا يجب أن
+#   تكون المعالجة متساوية الأثر حسب (signal_id, kind).
+#
+# المستهلك يحتاج عميل Redis بدون decode_responses لأن الرسائل بايتات وليست نصوصاً.
+logger = logging.getLogger('PriceBus')
+
+PRICE_CHANNEL: str = "crypto_bot:prices:v1"
+TRADE_EVENT_STREAM: str = "crypto_bot:trade_events:v1"
+TRADE_EVENT_STREAM_MAXLEN: int = 10000
+WIRE_VERSION: int = 1
+
+TRADE_OPENED, TRADE_UPDATED, TRADE_CLOSED = 1, 2, 3
+TRADE_STATUSES: Tuple[str, ...] = ('open', 'updated', 'target_hit', 'stop_loss_hit', 'manual_close', 'closed_by_sell_signal')
+
+# Price batch: version, entry count, publish time (epoch seconds); each entry: symbol length, symbol (UTF-8), price.
+_PRICE_HEADER = struct.Struct('<BHd')
+_PRICE_ENTRY = struct.Struct('<d')
+# Trade event: version, kind, status index, signal id, price, profit % (NaN when not applicable), event time; then symbol length + symbol.
+_TRADE_EVENT = struct.Struct('<BBBIddd')
+_SYMBOL_LENGTH = struct.Struct('<B')
+
+
+def _pack_symbol(symbol: str) -> bytes:
+    raw = symbol.encode('utf-8')
+    return _SYMBOL_LENGTH.pack(len(raw)) + raw
+
+
+def _unpack_symbol(payload: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = _SYMBOL_LENGTH.unpack_from(payload, offset)
+    offset += _SYMBOL_LENGTH.size
+    return payload[offset:offset + length].decode('utf-8'), offset + length
+
+
+def encode_price_batch(prices: Dict[str, float], sent_at: float) -> bytes:
+    """~16 bytes per symbol (e.g. 'BTCUSDT'), against ~30 for the same entry as JSON."""
+    parts = [_PRICE_HEADER.pack(WIRE_VERSION, len(prices), sent_at)]
+    for symbol, price in prices.items():
+        parts.append(_pack_symbol(symbol))
+        parts.append(_PRICE_ENTRY.pack(price))
+    return b''.join(parts)
+
+
+def decode_price_batch(payload: bytes) -> Tuple[float, Dict[str, float]]:
+    version, count, sent_at = _PRICE_HEADER.unpack_from(payload, 0)
+    if version != WIRE_VERSION: raise ValueError(f"Unsupported price batch version: {version}")
+    offset, prices = _PRICE_HEADER.size, {}
+    for _ in range(count):
+        symbol, offset = _unpack_symbol(payload, offset)
+        (prices[symbol],) = _PRICE_ENTRY.unpack_from(payload, offset)
+        offset += _PRICE_ENTRY.size
+    return sent_at, prices
+
+
+def encode_trade_event(kind: int, signal_id: int, symbol: str, status: str, price: float, profit_pct: Optional[float], event_time: float) -> bytes:
+    status_index = TRADE_STATUSES.index(status) if status in TRADE_STATUSES else 255
+    profit = math.nan if profit_pct is None else profit_pct
+    return _TRADE_EVENT.pack(WIRE_VERSION, kind, status_index, signal_id, price, profit, event_time) + _pack_symbol(symbol)
+
+
+def decode_trade_event(payload: bytes) -> Dict[str, Any]:
+    version, kind, status_index, signal_id, price, profit, event_time = _TRADE_EVENT.unpack_from(payload, 0)
+    if version != WIRE_VERSION: raise ValueError(f"Unsupported trade event version: {version}")
+    symbol, _ = _unpack_symbol(payload, _TRADE_EVENT.size)
+    return {
+        'kind': kind, 'signal_id': signal_id, 'symbol': symbol, 'price': price, 'event_time': event_time,
+        'status': TRADE_STATUSES[status_index] if status_index < len(TRADE_STATUSES) else None,
+        'profit_percentage': None if math.isnan(profit) else profit,
+    }
+
+
+# ---------------------- الناشر والمستهلك ----------------------
+def publish_trade_event(redis_client, kind: int, signal_id: int, symbol: str, status: str, price: float,
+                        profit_pct: Optional[float], event_time: float) -> Optional[str]:
+    """Appends one event to TRADE_EVENT_STREAM (approximately capped at TRADE_EVENT_STREAM_MAXLEN) and returns its id."""
+    return append_trade_event(redis_client, encode_trade_event(kind, signal_id, symbol, status, price, profit_pct, event_time))
+
+
+def append_trade_event(redis_client, payload: bytes) -> Optional[str]:
+    """Same as publish_trade_event for a payload already built by encode_trade_event."""
+    return redis_client.xadd(TRADE_EVENT_STREAM, {'e': payload}, maxlen=TRADE_EVENT_STREAM_MAXLEN, approximate=True)
+
+
+def iter_price_batches(redis_client) -> Iterator[Tuple[float, Dict[str, float]]]:
+    """Blocking generator over PRICE_CHANNEL; `redis_client` must not use decode_responses."""
+    pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+    pubsub.subscribe(PRICE_CHANNEL)
+    try:
+        for message in pubsub.listen():
+            try: yield decode_price_batch(message['data'])
+            except (ValueError, struct.error) as e: logger.warning(f"⚠️ [Price Bus] Skipping malformed price batch: {e}")
+    finally:
+        pubsub.close()
+
+
+def read_trade_events(redis_client, last_id: str = '$', block_ms: int = 5000, count: int = 100) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Events after `last_id` ('$' = only new ones, '0' = everything retained). Pass the last returned id back in
+    to resume without gaps while it is still retained.
+    """
+    response = redis_client.xread({TRADE_EVENT_STREAM: last_id}, count=count, block=block_ms) or []
+    events = []
+    for _, entries in response:
+        for entry_id, fields in entries:
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            try: events.append((entry_id, decode_trade_event(fields[b'e'])))
+            except (KeyError, ValueError, struct.error) as e: logger.warning(f"⚠️ [Price Bus] Skipping malformed trade event {entry_id}: {e}")
+    return events
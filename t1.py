@@ -20,6 +20,7 @@ from decouple import config
 from typing import List, Dict, Optional, Any, Tuple
 from sklearn.preprocessing import StandardScaler
 import warnings
+from kline_store import KlineStore
 
 # --- تجاهل التحذيرات غير الهامة ---
 warnings.simplefilter(action='ignore', category=FutureWarning)
@@ -63,6 +64,7 @@ DATA_FETCH_BUFFER_DAYS: int = 40
 # --- متغيرات الاتصال ---
 conn: Optional[psycopg2.extensions.connection] = None
 client: Optional[Client] = None
+kline_store: Optional[KlineStore] = None
 ml_models_cache: Dict[str, Any] = {}
 exchange_info_map: Dict[str, Any] = {}
 
@@ -375,15 +377,8 @@ def get_validated_symbols(filename: str = 'crypto_list.txt') -> List[str]:
 def fetch_historical_data(symbol: str, interval: str, start_str: str, end_str: str = None) -> Optional[pd.DataFrame]:
     if not client: return None
     try:
-        klines = client.get_historical_klines(symbol, interval, start_str, end_str)
-        if not klines: return None
-        df = pd.DataFrame(klines, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume', 'close_time', 'quote_volume', 'trades', 'taker_buy_base', 'taker_buy_quote', 'ignore'])
-        df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
-        for col in ['open', 'high', 'low', 'close', 'volume']:
-            df[col] = pd.to_numeric(df[col], errors='coerce')
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True)
-        df.set_index('timestamp', inplace=True)
-        return df.dropna()
+        df = kline_store.get_range(client, symbol, interval, start_str, end_str)
+        return df.dropna() if df is not None else None
     except Exception as e:
         return None
 
@@ -767,6 +762,7 @@ if __name__ == "__main__":
     logger.info("🚀 إطلاق محرك الاختبار الخلفي ولوحة التحكم 🚀")
     
     client = Client(API_KEY, API_SECRET)
+    kline_store = KlineStore()
     init_db()
     get_exchange_info_map()
     
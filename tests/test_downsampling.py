@@ -0,0 +1,30 @@
+import numpy as np
+
+from downsampling import lttb_downsample
+
+
+def _curve(n):
+    x = np.arange(n, dtype=float)
+    return x, np.cumsum(np.sin(x))
+
+
+def test_keeps_everything_within_budget():
+    x, y = _curve(10)
+    assert lttb_downsample(x, y, 10).tolist() == list(range(10))
+    assert lttb_downsample(x, y, 50).tolist() == list(range(10))
+
+
+def test_downsamples_to_budget_with_endpoints():
+    x, y = _curve(1000)
+    selected = lttb_downsample(x, y, 50)
+    assert len(selected) == 50
+    assert selected[0] == 0 and selected[-1] == 999
+    assert np.all(np.diff(selected) > 0)
+
+
+def test_budget_below_three_keeps_only_endpoints():
+    # /api/profit_curve?max_points=3 leaves 2 points for the trades after its leading zero point.
+    x, y = _curve(1000)
+    assert lttb_downsample(x, y, 2).tolist() == [0, 999]
+    assert lttb_downsample(x, y, 1).tolist() == [999]
+    assert lttb_downsample(x, y, 0).tolist() == []